@@ -0,0 +1,36 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from towerrpg import compiler, levelpack
+
+
+class TestCompiler(unittest.TestCase):
+
+    # Everything in the shipped level pack has to come from the workbook, the manifest and the plans file
+    def test_rebuilds_level_pack(self):
+        records = compiler.compile_floors(compiler.read_workbook(compiler.DEFAULT_WORKBOOK),
+                                          compiler.read_manifest(compiler.DEFAULT_MANIFEST),
+                                          compiler.read_plans(compiler.DEFAULT_PLANS))
+
+        pack = levelpack.LevelPack()
+        try:
+            self.assertEqual(len(records), len(pack))
+            for i, record in enumerate(records):
+                self.assertEqual(levelpack.encode(record), levelpack.encode(pack.record(i)), record.name)
+        finally:
+            pack.close()
+
+    # Checking fails if any floor is different from the base level pack
+    def test_check(self):
+        missing = os.path.join(tempfile.gettempdir(), "no such level pack.dat")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(compiler.main(["--check"]), 0)
+            self.assertEqual(compiler.main(["--check", "--base", missing]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
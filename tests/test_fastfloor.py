@@ -0,0 +1,84 @@
+import random
+import unittest
+
+from towerrpg.game import Floor, FloorBuilder, Player
+
+try:
+    from towerrpg.fastfloor import NumpyFloor
+except ImportError:
+    NumpyFloor = None
+
+
+# Play the same seeded floors on a floor class and record everything that can differ after each tick
+def play(floor_class, seed, levels, ticks):
+    builder = FloorBuilder(floor_class, seed=seed)
+    builder.initialise()
+
+    rng = random.Random(seed)
+    results = []
+
+    for level in levels:
+        floor = builder.get_floor(level)
+        floor.player = Player("Bot", 0, 0)
+        floor.set_player_position(Floor.ENTRANCE)
+
+        events = []
+        floor.events.subscribe(lambda event: events.append(tuple(event)))
+
+        # Liven the floor up with things that go off during a tick
+        for i in range(40):
+            x, y = rng.randrange(1, floor.width - 1), rng.randrange(1, floor.height - 1)
+            floor.set_tile(x, y, rng.choice((Floor.BOMB_LIT, Floor.BRAZIER_LIT, Floor.LIGHTNING, Floor.ICE,
+                                             Floor.SNOW, floor.enemy_type or Floor.GOBLIN,
+                                             floor.enemy_type or Floor.GOBLIN)))
+
+        for tick in range(ticks):
+            if tick % 50 == 25:
+                floor.switch()
+            if tick % 7 == 0:
+                floor.player.x, floor.player.y = rng.randrange(floor.width), rng.randrange(floor.height)
+
+            floor.enemy_move_mode = Floor.MOVE_MAGNET if (tick // 30) % 2 else Floor.MOVE_RANDOM
+            floor.tick()
+
+            results.append((level, tick, bytes(floor.plan), floor.player.HP, floor.player.kills,
+                            sorted(floor.bombs.items()), sorted(floor.braziers.items()), list(events)))
+            events.clear()
+
+        # The entity index must still match the plan after all of the tile codes written straight to the array
+        index = {code: set(positions) for code, positions in floor.entity_index.items()}
+        floor.build_index()
+        results.append((level, index == floor.entity_index))
+
+    return results
+
+
+@unittest.skipIf(NumpyFloor is None, "numpy is not installed")
+class TestNumpyFloorParity(unittest.TestCase):
+    LEVELS = (0, 5, 12, 20, 33)
+    TICKS = 120
+
+    def check_parity(self, seed):
+        expected = play(Floor, seed, TestNumpyFloorParity.LEVELS, TestNumpyFloorParity.TICKS)
+        actual = play(NumpyFloor, seed, TestNumpyFloorParity.LEVELS, TestNumpyFloorParity.TICKS)
+
+        self.assertEqual(len(expected), len(actual))
+        for expected_tick, actual_tick in zip(expected, actual):
+            self.assertEqual(expected_tick, actual_tick)
+
+    # Small ticks are handed over to the pure Python floor...
+    def test_small_ticks(self):
+        self.check_parity(1)
+
+    # ...so force every tick through the array operations too
+    def test_array_ticks(self):
+        array_tick_size = NumpyFloor.ARRAY_TICK_SIZE
+        NumpyFloor.ARRAY_TICK_SIZE = 0
+        try:
+            self.check_parity(2)
+        finally:
+            NumpyFloor.ARRAY_TICK_SIZE = array_tick_size
+
+
+if __name__ == "__main__":
+    unittest.main()
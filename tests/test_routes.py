@@ -0,0 +1,96 @@
+import random
+import unittest
+
+from towerrpg.game import Floor, FloorTemplate, Player
+
+
+# A key next to the player and two doors, the first of which only leads to a dead end room
+DEAD_END_PLAN = (":::::::::",
+                 ":::::::::",
+                 ":  D   ::",
+                 ": ?::::::",
+                 ":  D  +::",
+                 ":::::::::")
+
+# A key to pick up and then two gates next to each other, with nowhere to stand between them
+DOOR_EXIT_PLAN = (":::::::",
+                  ":-  ?D+",
+                  ":::::::")
+
+DOOR_DOOR_PLAN = (":::::::::",
+                  ":-  ??DD+",
+                  ":::::::::")
+
+
+class TestFloorRoutes(unittest.TestCase):
+
+    def make_routes(self, plan, keys=0, exit_keys=1, position=(1, 3)):
+        floor = Floor(template=FloorTemplate(plan), treasures=0, enemies=0, traps=0, keys=0, rng=random.Random(1))
+        floor.player = Player("Bot", *position)
+        floor.player.keys = keys
+        floor.player.exit_keys = exit_keys
+        return floor, floor.get_routes()
+
+    # Using the only key on the dead end door must not stop the player finding the exit
+    def test_dead_end_door(self):
+        floor, routes = self.make_routes(DEAD_END_PLAN)
+
+        self.assertTrue(routes.can_exit())
+        self.assertTrue(routes.can_reach((5, 2)))
+
+        path = routes.shortest_path(floor.exit)
+        self.assertIsNotNone(path)
+        self.assertIn((3, 4), path)
+        self.assertNotIn((3, 2), path)
+        self.assertEqual(routes.distance(floor.exit), len(path) - 1)
+
+    # Without the key neither door can be opened
+    def test_no_keys(self):
+        plan = tuple(row.replace("?", " ") for row in DEAD_END_PLAN)
+        floor, routes = self.make_routes(plan)
+
+        self.assertFalse(routes.can_exit())
+        self.assertFalse(routes.can_reach((5, 2)))
+        self.assertIsNone(routes.shortest_path(floor.exit))
+
+        # Being able to stand next to a door doesn't mean being able to get to it
+        self.assertFalse(routes.can_reach((3, 2)))
+        self.assertIsNone(routes.shortest_path((3, 2)))
+
+    # With a key in hand as well as the one on the floor both doors can be opened
+    def test_enough_keys(self):
+        floor, routes = self.make_routes(DEAD_END_PLAN, keys=1)
+
+        self.assertTrue(routes.can_exit())
+        self.assertTrue(routes.can_reach((5, 2)))
+
+    # The exit can be got to straight through the door next to it
+    def test_door_next_to_exit(self):
+        floor, routes = self.make_routes(DOOR_EXIT_PLAN, position=(2, 1))
+
+        self.assertTrue(routes.can_exit())
+        self.assertEqual(routes.shortest_path(floor.exit), [(2, 1), (3, 1), (4, 1), (5, 1), (6, 1)])
+
+        # ...but not without the exit key to unlock it
+        self.assertFalse(routes.can_exit(exit_keys=0))
+        self.assertTrue(routes.can_reach((5, 1), exit_keys=0))
+        self.assertFalse(routes.can_reach(floor.exit, exit_keys=0))
+
+    # A door can be opened from inside another door
+    def test_door_next_to_door(self):
+        floor, routes = self.make_routes(DOOR_DOOR_PLAN, position=(2, 1))
+
+        self.assertTrue(routes.can_exit())
+        self.assertEqual(routes.distance(floor.exit), 6)
+
+        # With only one key the second door can't be opened
+        plan = tuple(row.replace("??", "? ") for row in DOOR_DOOR_PLAN)
+        floor, routes = self.make_routes(plan, position=(2, 1))
+
+        self.assertTrue(routes.can_reach((6, 1)))
+        self.assertFalse(routes.can_reach((7, 1)))
+        self.assertFalse(routes.can_exit())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from towerrpg.game import Floor
+from towerrpg.headless import HeadlessRunner, random_bot
+from towerrpg.savegame import SaveGame
+
+
+class TestSaveGame(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.path = os.path.join(directory, "Tower.sav")
+        self.addCleanup(os.rmdir, directory)
+        self.addCleanup(lambda: os.path.exists(self.path) and os.remove(self.path))
+
+    # A floor that the player left before saving still catches up with every tick it missed after loading,
+    # including a floor that was only written by an earlier incremental save
+    def test_missed_ticks(self):
+        for seed in range(3):
+            played = HeadlessRunner(seed=seed)
+            played.run(random_bot(seed), max_ticks=30)
+
+            floor = played.rpg.current_floor
+            for x in range(3, 9):
+                floor.set_tile(x, 3, floor.enemy_type or Floor.GOBLIN)
+
+            played.rpg.set_floor(1)
+            played.rpg.player.HP = 100
+            played.run(lambda rpg: None, max_ticks=77 + seed)
+
+            save_game = SaveGame(played.rpg, self.path)
+            save_game.save()
+            played.run(lambda rpg: None, max_ticks=50)
+            save_game.save()
+
+            loaded = HeadlessRunner(seed=seed + 100)
+            SaveGame(loaded.rpg, self.path).load()
+
+            for runner in (played, loaded):
+                runner.run(lambda rpg: None, max_ticks=13)
+                runner.rpg.set_floor(0)
+
+            self.assertEqual(bytes(played.rpg.current_floor.plan), bytes(loaded.rpg.current_floor.plan))
+            os.remove(self.path)
+
+    # Restoring a checkpoint puts back floors that incremental saves since it have already written
+    def test_restore_after_save(self):
+        compact_factor = SaveGame.COMPACT_FACTOR
+        SaveGame.COMPACT_FACTOR = 1000
+        self.addCleanup(setattr, SaveGame, "COMPACT_FACTOR", compact_factor)
+
+        played = HeadlessRunner(seed=1)
+        save_game = SaveGame(played.rpg, self.path)
+        save_game.save()
+        checkpoint = played.rpg.checkpoint()
+
+        played.rpg.set_floor(5)
+        floor = played.rpg.current_floor
+        for x in range(3, 9):
+            floor.set_tile(x, 3, Floor.TREASURE_CHEST)
+        save_game.save()
+
+        played.rpg.set_floor(7)
+        save_game.save()
+
+        played.rpg.restore(checkpoint)
+        save_game.save()
+
+        loaded = HeadlessRunner(seed=2)
+        SaveGame(loaded.rpg, self.path).load()
+
+        self.assertEqual(loaded.rpg.current_floor_level, played.rpg.current_floor_level)
+        for level in (0, 5, 7):
+            self.assertEqual(bytes(loaded.rpg.floor_builder.get_floor(level).plan),
+                             bytes(played.rpg.floor_builder.get_floor(level).plan))
+        self.assertNotIn(Floor.encode_row(Floor.TREASURE_CHEST)[0], loaded.rpg.floor_builder.get_floor(5).plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
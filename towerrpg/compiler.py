@@ -0,0 +1,258 @@
+__author__ = 'user'
+
+import argparse
+import csv
+import os
+import re
+import sys
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+from towerrpg import levelpack
+from towerrpg.game import Floor, FloorTemplate
+
+# Compiles the floor builder workbook into a level pack, checking every tile along the way. The workbook only has
+# the floor plans so a manifest lists the floors of the tower in order with the sheet and settings for each one.
+# Floors with no sheet take their plan from a text file of plans instead.
+# e.g. python -m towerrpg.compiler --check
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEFAULT_WORKBOOK = os.path.join(DATA_DIR, "floor builder.xlsx")
+DEFAULT_MANIFEST = os.path.join(DATA_DIR, "tower.csv")
+DEFAULT_PLANS = os.path.join(DATA_DIR, "plans.txt")
+
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Every tile that Floor knows about, by name and by tile
+TILES = {name: value for name, value in vars(Floor).items()
+         if name.isupper() and isinstance(value, str) and len(value) == 1}
+TILE_NAMES = {value: name for name, value in TILES.items()}
+
+
+class CompileError(Exception):
+    pass
+
+
+# Split a cell reference e.g. AB12 into a zero based column and row
+def cell_position(reference: str):
+    letters, digits = re.match(r"([A-Z]+)(\d+)$", reference).groups()
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - ord("A") + 1
+    return column - 1, int(digits) - 1
+
+
+# Read the values of every cell in every sheet of a workbook, using the cached values of any formulas
+def read_workbook(path):
+    with zipfile.ZipFile(path) as workbook:
+
+        shared_strings = []
+        if "xl/sharedStrings.xml" in workbook.namelist():
+            for item in ElementTree.fromstring(workbook.read("xl/sharedStrings.xml")):
+                shared_strings.append("".join(text.text or "" for text in item.iter(SPREADSHEET_NS + "t")))
+
+        targets = {relationship.get("Id"): relationship.get("Target") for relationship in
+                   ElementTree.fromstring(workbook.read("xl/_rels/workbook.xml.rels"))
+                   .iter(PACKAGE_RELATIONSHIP_NS + "Relationship")}
+
+        sheets = {}
+        for sheet in ElementTree.fromstring(workbook.read("xl/workbook.xml")).iter(SPREADSHEET_NS + "sheet"):
+            target = targets[sheet.get(RELATIONSHIP_NS + "id")].lstrip("/")
+            if not target.startswith("xl/"):
+                target = "xl/" + target
+
+            cells = {}
+            for cell in ElementTree.fromstring(workbook.read(target)).iter(SPREADSHEET_NS + "c"):
+                value = cell.find(SPREADSHEET_NS + "v")
+                if cell.get("t") == "inlineStr":
+                    value = "".join(text.text or "" for text in cell.iter(SPREADSHEET_NS + "t"))
+                elif value is None:
+                    continue
+                elif cell.get("t") == "s":
+                    value = shared_strings[int(value.text)]
+                else:
+                    value = value.text or ""
+                cells[cell_position(cell.get("r"))] = value
+
+            sheets[sheet.get("name")] = cells
+
+    return sheets
+
+
+# Get a number that is labelled in the first column of a sheet e.g. width
+def sheet_setting(name, cells, label):
+    for (column, row), value in cells.items():
+        if column == 0 and value.strip().lower() == label:
+            try:
+                return int(float(cells.get((1, row), "")))
+            except ValueError:
+                break
+    raise CompileError("Sheet {0} has no {1}".format(name, label))
+
+
+# Get the rows of tiles from a sheet, checking that every cell is a tile that Floor knows about
+def read_plan(name, cells):
+    width = sheet_setting(name, cells, "width")
+    height = sheet_setting(name, cells, "height")
+
+    rows = []
+    for y in range(0, height):
+        row = ""
+        for x in range(0, width):
+            tile = cells.get((x, y), Floor.EMPTY)
+            if tile not in TILE_NAMES:
+                raise CompileError("Sheet {0} cell {1}{2} has unknown tile {3!r}".format(
+                    name, chr(ord("A") + x) if x < 26 else x + 1, y + 1, tile))
+            row += tile
+        rows.append(row)
+
+    return tuple(rows)
+
+
+# Read the plans of the floors that have no sheet. Each plan starts with the floor's name in square brackets
+# followed by its rows of tiles in double quotes, so that spaces at the ends of rows can be seen.
+# Blank lines and lines starting with # are ignored.
+def read_plans(path):
+    plans = {}
+    name = None
+
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.rstrip("\n")
+
+            if line.strip() == "" or line.startswith("#"):
+                continue
+
+            if line.startswith("[") and line.endswith("]"):
+                name = line[1:-1]
+                if name in plans:
+                    raise CompileError("Plans line {0} has a second plan for floor {1}".format(number, name))
+                plans[name] = []
+
+            elif line.startswith('"') and line.endswith('"') and len(line) > 1 and name is not None:
+                row = line[1:-1]
+                for x, tile in enumerate(row):
+                    if tile not in TILE_NAMES:
+                        raise CompileError("Plans line {0} column {1} has unknown tile {2!r}".format(number, x + 1,
+                                                                                                   tile))
+                if len(plans[name]) > 0 and len(row) != len(plans[name][0]):
+                    raise CompileError("Plans line {0} is not the same width as the rest of floor {1}".format(
+                        number, name))
+                plans[name].append(row)
+
+            else:
+                raise CompileError("Plans line {0} is not a floor name or a row of tiles".format(number))
+
+    return {name: tuple(rows) for name, rows in plans.items()}
+
+
+# Turn a tile name from the manifest into a tile, checking that it is one of the expected tiles
+def manifest_tile(floor, name, allowed=None):
+    if name not in TILES or (allowed is not None and TILES[name] not in allowed):
+        raise CompileError("Floor {0} has unknown tile name {1}".format(floor, name))
+    return TILES[name]
+
+
+# Read the list of floors and their settings as (sheet, record) pairs, with the plans still to be filled in.
+# Columns are floor, sheet, enemies, enemy_type, traps, treasures, keys, switch_tiles.
+def read_manifest(path):
+    floors = []
+    with open(path, newline="", encoding="utf-8") as file:
+        for line in csv.DictReader(file):
+            name = line["floor"]
+            switch_tiles = line["switch_tiles"].split()
+
+            if len(switch_tiles) not in (0, 2):
+                raise CompileError("Floor {0} needs two switch tiles".format(name))
+
+            try:
+                enemies, traps, treasures, keys = (int(line[column]) for column in
+                                                   ("enemies", "traps", "treasures", "keys"))
+            except ValueError:
+                raise CompileError("Floor {0} has a setting that is not a number".format(name))
+
+            floors.append((line["sheet"], levelpack.LevelRecord(
+                name, None,
+                enemies=enemies,
+                enemy_type=manifest_tile(name, line["enemy_type"], Floor.ENEMIES),
+                traps=traps,
+                treasures=treasures,
+                keys=keys,
+                switch_tiles=tuple(manifest_tile(name, tile) for tile in switch_tiles) or None)))
+    return floors
+
+
+# Build all of the floor records, taking plans from the workbook or the plans file
+def compile_floors(sheets, manifest, plans):
+    records = []
+    errors = []
+
+    for sheet, record in manifest:
+        try:
+            if sheet != "":
+                if sheet not in sheets:
+                    raise CompileError("Floor {0} uses sheet {1} which is not in the workbook".format(record.name,
+                                                                                                      sheet))
+                record.rows = read_plan(sheet, sheets[sheet])
+            elif len(plans.get(record.name, ())) > 0:
+                record.rows = plans[record.name]
+            else:
+                raise CompileError("Floor {0} has no sheet and no plan in the plans file".format(record.name))
+
+            record.trophies = FloorTemplate(record.rows).trophies
+
+            records.append(record)
+
+        except CompileError as error:
+            errors.append(str(error))
+
+    if len(errors) > 0:
+        raise CompileError("\n".join(errors))
+
+    return records
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Compile the floor builder workbook into a level pack")
+    parser.add_argument("--workbook", default=DEFAULT_WORKBOOK)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--plans", default=DEFAULT_PLANS, help="plans of the floors that have no sheet")
+    parser.add_argument("--base", default=levelpack.DEFAULT_PATH, help="level pack that --check compares with")
+    parser.add_argument("--output", default=levelpack.DEFAULT_PATH)
+    parser.add_argument("--check", action="store_true",
+                        help="list the floors that differ from the base level pack without writing anything, "
+                             "failing if there are any")
+    arguments = parser.parse_args(arguments)
+
+    try:
+        records = compile_floors(read_workbook(arguments.workbook), read_manifest(arguments.manifest),
+                                 read_plans(arguments.plans))
+    except CompileError as error:
+        print(error)
+        return 1
+
+    if arguments.check is True:
+        base_pack = levelpack.LevelPack(arguments.base) if os.path.exists(arguments.base) else None
+        base_records = {} if base_pack is None else \
+            {base_pack.record(i).name: base_pack.record(i) for i in range(0, len(base_pack))}
+        differences = 0
+        for record in records:
+            base_record = base_records.get(record.name)
+            if base_record is None or levelpack.encode(record) != levelpack.encode(base_record):
+                print("Floor {0} is different from the base level pack".format(record.name))
+                differences += 1
+        print("{0} floors checked, {1} different".format(len(records), differences))
+
+        if base_pack is not None:
+            base_pack.close()
+        return 1 if differences > 0 else 0
+
+    levelpack.write_level_pack(arguments.output, records)
+    print("Wrote {0} floors to {1}".format(len(records), arguments.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
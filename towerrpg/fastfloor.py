@@ -0,0 +1,341 @@
+__author__ = 'user'
+
+import numpy as np
+
+from towerrpg.game import EventStream, Floor
+
+
+# Build a lookup table of tile codes that returns True for the specified tiles
+def tile_table(tiles):
+    table = np.zeros(256, dtype=bool)
+    for tile in tiles:
+        table[ord(tile)] = True
+    return table
+
+
+# Build a lookup table of tile codes that maps meltable tiles to what they melt into
+def melt_table():
+    table = np.arange(256, dtype=np.uint8)
+    for tile, melted_tile in Floor.MELTABLE_ITEMS.items():
+        table[ord(tile)] = ord(melted_tile)
+    return table
+
+
+# A Floor that views its plan as a NumPy array of tile codes and runs each tick as array operations.
+# Requires numpy so it is not imported by the towerrpg package - pass it to TowerRPG or FloorBuilder as floor_class.
+class NumpyFloor(Floor):
+    # The random moves in the same order as Floor.move_enemy picks from them, so that choosing a move number
+    # uses up the random number stream in the same way
+    MOVES = np.array(((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)))
+    MOVE_NUMBERS = tuple(range(len(MOVES)))
+
+    # Ticks with fewer active squares than this are quicker a square at a time than as array operations
+    ARRAY_TICK_SIZE = 100
+
+    ACTIVE_TABLE = tile_table(Floor.ACTIVE_TILES)
+    ENEMY_TABLE = tile_table(Floor.ENEMIES)
+    ENEMY_EMPTY_TABLE = tile_table(Floor.ENEMY_EMPTY_TILES)
+    INDESTRUCTIBLE_TABLE = tile_table(Floor.INDESTRUCTIBLE_ITEMS)
+    PLAYER_BLOCKED_TABLE = tile_table(Floor.PLAYER_BLOCKED_TILES)
+    MELT_TABLE = melt_table()
+
+    BANG_CODE = ord(Floor.BANG)
+    BOMB_LIT_CODE = ord(Floor.BOMB_LIT)
+    BRAZIER_LIT_CODE = ord(Floor.BRAZIER_LIT)
+    EMPTY_CODE = ord(Floor.EMPTY)
+    LIGHTNING_CODE = ord(Floor.LIGHTNING)
+
+    # The tile codes are a row by column array that shares its memory with the plan
+    def clear_plan(self, plan=None):
+        super().clear_plan(plan)
+        self.codes = np.frombuffer(self.plan, dtype=np.uint8).reshape(self.height, self.width)
+
+        # The squares that enemies have moved on to during a tick, which are cleared again at the end of the tick
+        self.claimed = np.zeros(self.width * self.height, dtype=bool)
+
+    # Build the flow field towards the player one BFS level at a time
+    def build_flow_field(self):
+        source = self.index(self.player.x, self.player.y)
+        open_squares = ~NumpyFloor.PLAYER_BLOCKED_TABLE[self.effective_codes(self.codes.reshape(-1))]
+        field = np.full(self.width * self.height, -1, dtype=np.int32)
+        field[source] = 0
+
+        frontier = np.array([source])
+        distance = 0
+        while len(frontier) > 0:
+            distance += 1
+            neighbours = self.neighbour_indexes(frontier)
+            neighbours = np.unique(neighbours[neighbours >= 0])
+            frontier = neighbours[(field[neighbours] < 0) & open_squares[neighbours]]
+            field[frontier] = distance
+
+        self.flow_field = field
+        self.flow_source = source
+
+    # Get the indexes of the squares left, right, above and below each index in the same order as
+    # Floor.neighbours, with -1 for squares that are off the floor
+    def neighbour_indexes(self, indexes):
+        y, x = np.divmod(indexes, self.width)
+        return np.stack((np.where(x > 0, indexes - 1, -1),
+                         np.where(x < self.width - 1, indexes + 1, -1),
+                         np.where(y > 0, indexes - self.width, -1),
+                         np.where(y < self.height - 1, indexes + self.width, -1)))
+
+    # Get tile codes with any switch tiles replaced by what they currently show
+    def effective_codes(self, codes):
+        if self.switch_tiles is not None:
+            switch_tile = self.switch_tiles[1] if self.switch_on is True else self.switch_tiles[0]
+            codes = np.where(codes == NumpyFloor.SWITCH_TILE_CODE, ord(switch_tile), codes).astype(np.uint8)
+
+        return codes
+
+    def tick(self):
+
+        # Only the squares in the entity index can be active so the rest of the floor is never looked at
+        positions = self.active_positions()
+        if len(positions) < NumpyFloor.ARRAY_TICK_SIZE:
+            super().tick()
+            return
+
+        # If the player is on a damage tile then take damage
+        tile = self.current_tile
+        if tile in Floor.PLAYER_DOT_TILES:
+            self.player.HP -= 1
+            self.events.emit(EventStream.DAMAGE, self.name, self.player.x, self.player.y, tile, 1)
+
+        # Enemies are about to use the random number generator
+        self.rng_state = None
+
+        fuses = self.timers.advance()
+
+        # Switch tiles are always in the index so drop any that aren't showing an active tile
+        flat = self.codes.reshape(-1)
+        positions = np.array(positions, dtype=np.intp)
+        position_codes = self.effective_codes(flat[positions])
+        is_active = NumpyFloor.ACTIVE_TABLE[position_codes]
+        active = positions[is_active]
+        active_codes = position_codes[is_active]
+
+        # Bangs and braziers that are about to go out change the plan around them so they split the tick into
+        # segments that have to be processed in the same order as the pure Python tick
+        events = active_codes == NumpyFloor.BANG_CODE
+        for i in np.flatnonzero(active_codes == NumpyFloor.BRAZIER_LIT_CODE):
+            due = self.braziers.get(int(active[i]))
+            if due is not None and due <= self.timers.now:
+                events[i] = True
+
+        claimed = self.claimed
+        claims = []
+
+        start = 0
+        for event in np.flatnonzero(events):
+            self.tick_segment(active[start:event], claimed, claims)
+            self.tick_segment(active[event:event + 1], claimed, claims)
+            start = event + 1
+        self.tick_segment(active[start:], claimed, claims)
+
+        # Finally move the enemies to their new positions, which were all empty
+        for indexes, codes in claims:
+            self.journal_cells(indexes)
+            flat[indexes] = codes
+            claimed[indexes] = False
+            self.cells_changed(indexes, np.full(len(indexes), NumpyFloor.EMPTY_CODE, dtype=np.uint8), codes)
+
+        self.put_out_fuses(fuses)
+
+    # Journal the tile codes of squares that are about to be changed without going through set_tile_at
+    def journal_cells(self, indexes):
+        if self.journal is not None:
+            self.journal.extend(zip(indexes.tolist(), self.codes.reshape(-1)[indexes].tolist()))
+
+    # Keep the entity index and the routes in step with squares whose tile codes were written straight to the
+    # array rather than through set_tile_at
+    def cells_changed(self, indexes, old_codes, new_codes):
+        changed = old_codes != new_codes
+        indexes, old_codes, new_codes = indexes[changed], old_codes[changed], new_codes[changed]
+
+        if self.routes is not None:
+            for index, old_code, new_code in zip(indexes.tolist(), old_codes.tolist(), new_codes.tolist()):
+                self.routes.tile_changed(index, self.code_tile(old_code), self.code_tile(new_code))
+
+        # Different kinds of enemy share the same set of positions so take everything out before putting anything in
+        codes = [code for code in np.unique(np.concatenate((old_codes, new_codes))).tolist()
+                 if code in self.entity_index]
+        for code in codes:
+            self.entity_index[code].difference_update(indexes[old_codes == code].tolist())
+        for code in codes:
+            self.entity_index[code].update(indexes[new_codes == code].tolist())
+
+    # Process a run of active positions that no event can affect part way through
+    def tick_segment(self, indexes, claimed, claims):
+
+        if len(indexes) == 0:
+            return
+
+        codes = self.effective_codes(self.codes.reshape(-1)[indexes])
+
+        items = (codes == NumpyFloor.BOMB_LIT_CODE) | (codes == NumpyFloor.BRAZIER_LIT_CODE) | \
+                (codes == NumpyFloor.BANG_CODE)
+
+        for index in indexes[items].tolist():
+            tile = self.get_tile_at(index)
+            if tile == Floor.BOMB_LIT:
+                self.tick_bomb(index)
+            if tile == Floor.BRAZIER_LIT:
+                self.tick_brazier(index)
+            elif tile == Floor.BANG:
+                self.explode(index)
+
+        enemies = NumpyFloor.ENEMY_TABLE[codes]
+        if enemies.any():
+            self.move_enemies(indexes[enemies], codes[enemies], claimed, claims)
+
+    # Move a batch of enemies, resolving conflicts as if they had moved one at a time in plan order
+    def move_enemies(self, origins, codes, claimed, claims):
+
+        flat = self.codes.reshape(-1)
+        count = len(origins)
+        order = np.arange(count)
+        y, x = np.divmod(origins, self.width)
+
+        if self.enemy_move_mode == Floor.MOVE_RANDOM:
+            moves = NumpyFloor.MOVES[[self.rng.choice(NumpyFloor.MOVE_NUMBERS) for i in range(count)]]
+            target_x = x + moves[:, 0]
+            target_y = y + moves[:, 1]
+            on_floor = (target_x >= 0) & (target_x < self.width) & (target_y >= 0) & (target_y < self.height)
+            targets = self.plan_indexes(target_x, target_y)
+        else:
+            # The squares one step down the flow field are the ones each enemy can try to move to
+            field = self.get_flow_field()
+            distance = field[origins]
+            candidates = self.neighbour_indexes(origins)
+            downhill = (candidates >= 0) & (distance > 0) & (field[candidates] == distance - 1)
+            on_floor = np.ones(count, dtype=bool)
+
+        succeeded = np.zeros(count, dtype=bool)
+        killed = np.zeros(count, dtype=bool)
+        claimed_targets = origins
+
+        # Each enemy only depends on the enemies before it so this settles on the sequential result
+        while True:
+            vacated = succeeded | killed
+
+            if self.enemy_move_mode == Floor.MOVE_MAGNET:
+                targets = self.first_downhill(candidates, downhill, origins, order, vacated, claimed,
+                                              self.first_claims(candidates.reshape(-1), claimed_targets, succeeded,
+                                                                order).reshape(candidates.shape))
+
+            target_codes = flat[targets]
+
+            empty = on_floor & ((target_codes == NumpyFloor.EMPTY_CODE) |
+                                self.vacated_before(targets, origins, order, vacated)) & ~claimed[targets]
+            new_killed = on_floor & (target_codes == NumpyFloor.LIGHTNING_CODE)
+            new_succeeded = empty & (self.first_claims(targets, targets, succeeded, order) >= order)
+
+            if np.array_equal(new_succeeded, succeeded) and np.array_equal(new_killed, killed) and \
+                    np.array_equal(targets, claimed_targets):
+                break
+
+            succeeded = new_succeeded
+            killed = new_killed
+            claimed_targets = targets
+
+        # Enemies that moved on to lightning are killed in the same order as they would have moved
+        for index in targets[killed].tolist():
+            self.player.kills += 1
+            self.events.emit(EventStream.KILL, self.name, *self.position(index), Floor.LIGHTNING, 1)
+
+        emptied = origins[succeeded | killed]
+        old_codes = flat[emptied]
+        self.journal_cells(emptied)
+        flat[emptied] = NumpyFloor.EMPTY_CODE
+        self.cells_changed(emptied, old_codes, flat[emptied])
+        claimed[targets[succeeded]] = True
+        self.dirty.update(emptied.tolist())
+        self.dirty.update(targets[succeeded].tolist())
+        claims.append((targets[succeeded], codes[succeeded]))
+
+    # Pick the first downhill square that each enemy can enter, or the square it is on if there isn't one
+    def first_downhill(self, candidates, downhill, origins, order, vacated, claimed, first_claims):
+        flat = self.codes.reshape(-1)
+        targets = origins.copy()
+        chosen = np.zeros(len(origins), dtype=bool)
+
+        for candidate, can_try, first in zip(candidates, downhill, first_claims):
+            candidate_codes = flat[candidate]
+            enterable = ((candidate_codes == NumpyFloor.EMPTY_CODE) |
+                         self.vacated_before(candidate, origins, order, vacated)) & ~claimed[candidate] & \
+                        (first >= order) | (candidate_codes == NumpyFloor.LIGHTNING_CODE)
+            pick = can_try & enterable & ~chosen
+            targets[pick] = candidate[pick]
+            chosen |= pick
+
+        return targets
+
+    # Get plan indexes for arrays of positions, clamping positions that are off the floor
+    def plan_indexes(self, x, y):
+        return np.clip(y, 0, self.height - 1) * self.width + np.clip(x, 0, self.width - 1)
+
+    # For each target find whether an earlier enemy in the batch has already moved off it
+    @staticmethod
+    def vacated_before(targets, origins, order, vacated):
+        owner = np.minimum(np.searchsorted(origins, targets), len(origins) - 1)
+        return (origins[owner] == targets) & (owner < order) & vacated[owner]
+
+    # For each square find the earliest enemy in the batch that successfully moved on to it
+    @staticmethod
+    def first_claims(squares, targets, succeeded, order):
+        first = np.full(len(squares), len(targets))
+        movers = order[succeeded]
+        if len(movers) > 0:
+            claimed_targets, first_movers = np.unique(targets[movers], return_index=True)
+            position = np.minimum(np.searchsorted(claimed_targets, squares), len(claimed_targets) - 1)
+            found = claimed_targets[position] == squares
+            first[found] = movers[first_movers[position[found]]]
+        return first
+
+    # Get the 3x3 area of tile codes around a plan index and the position of its top left corner
+    def area(self, index: int):
+        x, y = self.position(index)
+        left, top = max(0, x - 1), max(0, y - 1)
+        return self.codes[top:y + 2, left:x + 2], left, top
+
+    # Catch up with an area of tile codes that was changed without going through set_tile_at
+    def area_changed(self, index: int, old_area, area):
+        if self.journal is not None:
+            self.journal.extend(zip(self.area_positions(index), old_area.reshape(-1).tolist()))
+
+        self.cells_changed(np.array(self.area_positions(index)), old_area.reshape(-1), area.reshape(-1))
+
+    def melt(self, index: int):
+        area, left, top = self.area(index)
+        old_area = area.copy()
+        area[...] = NumpyFloor.MELT_TABLE[area]
+        self.dirty.update(self.area_positions(index))
+        self.flow_field = None
+        self.area_changed(index, old_area, area)
+
+    def explode(self, index: int):
+        area, left, top = self.area(index)
+        enemies = NumpyFloor.ENEMY_TABLE[area]
+
+        self.events.emit(EventStream.EXPLOSION, self.name, *self.position(index), Floor.BANG)
+
+        player_x = self.player.x - left
+        player_y = self.player.y - top
+
+        # Go through the area a row at a time so that the events come out in the same order as the pure Python floor
+        for area_y, area_x in np.ndindex(*area.shape):
+            if enemies[area_y, area_x]:
+                self.player.kills += 1
+                self.events.emit(EventStream.KILL, self.name, left + area_x, top + area_y, Floor.BANG, 1)
+
+            elif self.catching_up is False and (area_x, area_y) == (player_x, player_y):
+                self.player.HP -= 3
+                self.events.emit(EventStream.DAMAGE, self.name, self.player.x, self.player.y, Floor.BANG, 3)
+
+        old_area = area.copy()
+        area[~NumpyFloor.INDESTRUCTIBLE_TABLE[area]] = NumpyFloor.EMPTY_CODE
+        self.dirty.update(self.area_positions(index))
+        self.flow_field = None
+        self.area_changed(index, old_area, area)
@@ -1,10 +1,13 @@
 __author__ = 'user'
 
+import collections
 import sys
 import random
 import logging
 import time
 
+from towerrpg import levelpack
+from towerrpg.timers import TimerHeap
 from towerrpg.KWGameClasses import HighScoreTable
 
 
@@ -135,17 +138,44 @@ class Floor:
     INDESTRUCTIBLE_ITEMS = (KEY, BOSS_KEY, DOOR, BOSS_DOOR, EXIT_KEY, TELEPORT1, TELEPORT2, WATER, BEACH, WELL)
     MELTABLE_ITEMS = {ICE: EMPTY, SNOW: ICE}
     SWAP_TILES = {SECRET_WALL: EMPTY, BOMB: BOMB_LIT, BRAZIER: BRAZIER_LIT, PINK_POTION: KITTY, BLUE_POTION: LIGHTNING}
+    ACTIVE_TILES = frozenset(ENEMIES + (BOMB_LIT, BRAZIER_LIT, BANG))
+    PLAYER_BLOCKED_CODES = frozenset(ord(tile) for tile in PLAYER_BLOCKED_TILES)
+    SWITCH_TILE_CODE = ord(SWITCH_TILE)
+    EMPTY_CODE = ord(EMPTY)
+
+    # Each tile is stored in the plan as a single byte tile code
+    TILE_ENCODING = "latin-1"
+    CODE_TILES = tuple(chr(code) for code in range(256))
 
     # Enemy movement modes
     MOVE_RANDOM = "MOVE RANDOM"
     MOVE_MAGNET = "MOVE MAGNET"
 
+    # When a floor catches up, enemies that are only wandering about at random stop after this many floor ticks as
+    # where they have got to by then is as good as anywhere else they could have got to
+    CATCH_UP_WANDER_TICKS = 100
+
     def __init__(self, width=10, height=10, treasures=10, enemies=10, enemy_type=None, traps=10, keys=1,
                  entrance=None,
                  exit=None,
                  switch_tiles=None,
-                 name=None):
+                 name=None,
+                 rng=None,
+                 template=None,
+                 events=None):
+
+        # The floor's own random number stream so that games can be repeated
+        if rng is None:
+            rng = random.Random()
+
+        self.rng = rng
+        self.rng_state = None
 
+        # Where to send anything that happens on the floor
+        if events is None:
+            events = EventStream()
+
+        self.events = events
         self.height = height
         self.width = width
         self.treasures = treasures
@@ -161,6 +191,11 @@ class Floor:
         self.exit_locked = True
         self.enemy_move_mode = Floor.MOVE_RANDOM
 
+        # The playing tick that the player last left the floor on so that it can catch up when they come back,
+        # and whether it is catching up now, when the player is on another floor
+        self.left_tick = None
+        self.catching_up = False
+
         if entrance is not None:
             self.entrance = entrance
         else:
@@ -171,96 +206,75 @@ class Floor:
         else:
             self.exit = (width - 2, height - 2)
 
-        self.plan = []
-        self.plan = [[Floor.EMPTY for x in range(self.height)] for x in range(self.width)]
+        # The floor ticks that lit bombs and braziers go out on, with their fuses timed in floor ticks
+        self.timers = TimerHeap()
         self.bombs = {}
         self.braziers = {}
+        self.dirty = set()
+
+        # Either start from a parsed floor plan or build a very basic one
+        if template is not None:
+            self.load_template(template)
+        else:
+            self.clear_plan()
+            self.auto_build_plan()
 
-        self.auto_build_plan()
         self.initialise()
 
         # print("Floor {0}, traps={1}".format(self.name, self.traps))
 
     def load_plan(self, plan):
+        self.load_template(FloorTemplate(plan))
 
-        self.entrance = None
-        self.exit = None
-        self.height = len(plan)
-        self.width = len(plan[0])
-        self.plan = [[Floor.EMPTY for x in range(self.height)] for x in range(self.width)]
-
-        fake_exits = []
-
-        for y in range(0, len(plan)):
-            row = plan[y]
-            for x in range(0, min(self.width, len(row))):
-                self.plan[x][y] = row[x]
-
-                if row[x] == Floor.EXIT:
-                    self.exit = (x, y)
-                    print("Found the exit at {0},{1}".format(x, y))
-
-                elif row[x] == Floor.ENTRANCE:
-                    self.entrance = (x, y)
-                    print("Found the entrance at {0},{1}".format(x, y))
-
-                elif row[x] == Floor.ENTRANCE_TELEPORT and self.entrance is None:
-                    self.entrance = (x, y)
-                    print("Found the teleport entrance at {0},{1}".format(x, y))
-
-                elif row[x] == Floor.GOAL:
-                    self.trophies += 1
-                    print("Found a trophy at {0},{1}".format(x, y))
+    # Copy a parsed floor plan into this floor
+    def load_template(self, template):
 
-                elif row[x] == Floor.FAKE_EXIT:
-                    fake_exits.append((x, y))
+        self.width = template.width
+        self.height = template.height
+        self.entrance = template.entrance
+        self.exit = template.exit
+        self.trophies += template.trophies
 
-        if self.entrance is None:
-            self.entrance = (1, 1)
+        self.clear_plan(template.plan)
 
         # If no real exit exists and there are fake exits....
-        if self.exit is None and len(fake_exits) > 0:
+        if self.exit is None and len(template.fake_exits) > 0:
             # pick a random fake one and turn it into a real exit...
-            self.exit = random.choice(fake_exits)
+            self.exit = self.rng.choice(template.fake_exits)
             x, y = self.exit
-            self.plan[x][y] = Floor.EXIT
-            print("Setting random real exit to {0},{1}".format(x, y))
-
-        # Create safety zones around the entrance and exits
-        if self.entrance is not None:
-            self.safety_zone(self.entrance[0], self.entrance[1], 4, 4)
-
-        if self.exit is not None:
-            self.safety_zone(self.exit[0], self.exit[1], 4, 4)
+            self.set_tile(x, y, Floor.EXIT)
+            logging.info("Setting random real exit to %i,%i", x, y)
 
-        for fake_exit in fake_exits:
-            self.safety_zone(fake_exit[0], fake_exit[1], 4, 4)
+    # Get the plan indexes of the squares in a safety zone around a specified location on a floor of a given size
+    @staticmethod
+    def safety_zone_squares(x, y, height, width, floor_width, floor_height):
+        for dx in range(-1 * int(width / 2), int(width / 2) + 1):
+            for dy in range(-1 * int(height / 2), int(height / 2) + 1):
+                if (x + dx) < floor_width and (x + dx) >= 0 and (y + dy) < floor_height and (y + dy) >= 0:
+                    yield (y + dy) * floor_width + x + dx
 
     # Build a safety zone around a specified location
     def safety_zone(self, x, y, height, width):
-        for dx in range(-1 * int(width / 2), int(width / 2) + 1):
-            for dy in range(-1 * int(height / 2), int(height / 2) + 1):
-                if (x + dx) < self.width and (x + dx) >= 0 and (y + dy) < self.height and (y + dy) >= 0:
-                    if self.plan[x + dx][y + dy] == Floor.EMPTY:
-                        self.plan[x + dx][y + dy] = Floor.SAFETY
-                        # print("Safety zone created at {0},{1}".format((x + dx), (y + dx)))
+        for index in Floor.safety_zone_squares(x, y, height, width, self.width, self.height):
+            if self.tile_at(index) == Floor.EMPTY:
+                self.set_tile_at(index, Floor.SAFETY)
 
     # Build a very basic floor layout
     def auto_build_plan(self):
 
         x, y = self.entrance
-        self.plan[x][y] = Floor.ENTRANCE
+        self.set_tile(x, y, Floor.ENTRANCE)
 
         x, y = self.exit
-        self.plan[x][y] = Floor.EXIT
+        self.set_tile(x, y, Floor.EXIT)
 
         for x in range(0, self.width):
-            self.plan[x][0] = Floor.WALL
-            self.plan[x][self.height - 1] = Floor.WALL
+            self.set_tile(x, 0, Floor.WALL)
+            self.set_tile(x, self.height - 1, Floor.WALL)
 
         for y in range(0, self.height):
-            self.plan[0][y] = Floor.WALL
-            self.plan[self.width - 1][y] = Floor.WALL
+            self.set_tile(0, y, Floor.WALL)
+            self.set_tile(self.width - 1, y, Floor.WALL)
 
         # Create safety zones around the entrance and exits
         if self.entrance is not None:
@@ -271,37 +285,67 @@ class Floor:
 
     def initialise(self):
 
-        print("Start initialising {0}...".format(self.name))
+        logging.info("Start initialising %s...", self.name)
 
-        self.place_tiles(self.keys, Floor.EXIT_KEY, tries=20)
+        # Share one list of empty squares between all of the items that get placed
+        self.build_free_cells()
+
+        self.place_tiles(self.keys, Floor.EXIT_KEY)
         self.place_tiles(self.treasures, Floor.TREASURE)
         self.place_tiles(self.enemies, self.enemy_type)
         self.place_tiles(self.traps, Floor.TRAP)
 
-        print("Finished initialising {0}".format(self.name))
+        self.drop_free_cells()
+
+        logging.info("Finished initialising %s", self.name)
 
-    # Find empty tiles to place items
-    def place_tiles(self, item_count, item_type, tries=20):
+    # Place items on randomly chosen empty tiles
+    def place_tiles(self, item_count, item_type):
+
+        # Nothing to place e.g. a floor with no enemy type
+        if item_type is None:
+            return
+
+        # The list of empty squares is only kept while items are being placed, not while the floor is played on
+        built = self.free_cells is None
+        if built is True:
+            self.build_free_cells()
 
         for i in range(0, item_count):
-            attempts = 0
-            while True:
-                x = random.randint(1, self.width - 1)
-                y = random.randint(1, self.height - 1)
-                if self.plan[x][y] == Floor.EMPTY:
-                    self.plan[x][y] = item_type
-                    logging.info("Placed a {0} at {1},{2}".format(item_type, x, y))
-                    break
-                attempts += 1
-                # We tried several times to find an empty square, time to give up!
-                if attempts > tries:
-                    print("Can't find an empty tile t place {0} after {1} tries".format(item_type, attempts))
-                    break
+            # We have run out of empty squares, time to give up!
+            if len(self.free_cells) == 0:
+                logging.warning("Can't find an empty tile to place %s so %i were not placed", item_type, item_count - i)
+                break
+
+            index = self.free_cells[self.rng.randrange(len(self.free_cells))]
+            self.remove_free_cell(index)
+            self.set_tile_at(index, item_type)
+            logging.info("Placed a %s at %i,%i", item_type, *self.position(index))
+
+        if built is True:
+            self.drop_free_cells()
+
+    # Build the list of empty squares that items can be placed on, and where each one is in the list
+    def build_free_cells(self):
+        self.free_cells = [index for index, code in enumerate(self.plan) if code == Floor.EMPTY_CODE]
+        self.free_slots = {index: slot for slot, index in enumerate(self.free_cells)}
+
+    def drop_free_cells(self):
+        self.free_cells = None
+        self.free_slots = None
+
+    # Remove a square from the list of empty squares by moving the last one in the list into its place
+    def remove_free_cell(self, index: int):
+        slot = self.free_slots.pop(index)
+        last = self.free_cells.pop()
+        if last != index:
+            self.free_cells[slot] = last
+            self.free_slots[last] = slot
 
     @property
     def current_tile(self):
-        if self.player != None:
-            return self.plan[self.player.x][self.player.y]
+        if self.player != None and self.catching_up is False:
+            return self.tile_at(self.index(self.player.x, self.player.y))
         else:
             return None
 
@@ -312,13 +356,219 @@ class Floor:
         else:
             position = self.entrance
 
+        self.dirty.add(self.index(self.player.x, self.player.y))
         self.player.x, self.player.y = position
+        self.dirty.add(self.index(self.player.x, self.player.y))
+
+    # Convert a row of tiles to the bytes that are stored in the plan
+    @staticmethod
+    def encode_row(row: str):
+        return row.encode(Floor.TILE_ENCODING)
+
+    # Get the index of a position in the plan
+    def index(self, x: int, y: int):
+        return y * self.width + x
+
+    # Get the position of an index in the plan
+    def position(self, index: int):
+        y, x = divmod(index, self.width)
+        return x, y
+
+    # Get the tile codes for a row of the plan
+    def row(self, y: int):
+        return self.plan[y * self.width:(y + 1) * self.width]
+
+    # Get the tile stored at an index in the plan, ignoring any switch settings
+    def tile_at(self, index: int):
+        return Floor.CODE_TILES[self.plan[index]]
 
     def set_tile(self, x: int, y: int, new_tile: str):
-        self.plan[x][y] = new_tile
+        self.set_tile_at(y * self.width + x, new_tile)
+
+    def set_tile_at(self, index: int, new_tile: str):
+        old_code = self.plan[index]
+        new_code = ord(new_tile)
+        self.plan[index] = new_code
+        self.dirty.add(index)
+
+        if self.journal is not None:
+            self.journal.append((index, old_code))
+
+        # If the tile changed whether it blocks the way to the player then the flow field is out of date
+        if (old_code in Floor.PLAYER_BLOCKED_CODES) != (new_code in Floor.PLAYER_BLOCKED_CODES) or \
+                Floor.SWITCH_TILE_CODE in (old_code, new_code):
+            self.flow_field = None
+
+        if self.routes is not None:
+            self.routes.tile_changed(index, self.code_tile(old_code), self.code_tile(new_code))
+
+        # Keep the entity index in step with the plan
+        if old_code in self.entity_index:
+            self.entity_index[old_code].discard(index)
+        if new_code in self.entity_index:
+            self.entity_index[new_code].add(index)
+
+    # Take a checkpoint of everything on the floor that can change while it is being played on.
+    # The plan is shared with the live floor and only the squares that change after this are journaled.
+    def checkpoint(self):
+        if self.journal is None:
+            self.journal = []
+            self.journal_start = 0
+
+        # The random number state is only read again once a tick has used the random number generator
+        if self.rng_state is None:
+            self.rng_state = self.rng.getstate()
+
+        return (self.journal_start + len(self.journal), self.switch_on, self.exit_locked, self.exit,
+                dict(self.bombs), dict(self.braziers), self.timers.checkpoint(), self.rng_state, self.left_tick)
+
+    # Go back to a checkpoint by undoing the journaled changes to the plan since it was taken
+    def restore(self, checkpoint):
+        position, switch_on, self.exit_locked, self.exit, bombs, braziers, timers, rng_state, self.left_tick = \
+            checkpoint
+
+        if self.journal is None or position < self.journal_start or \
+                position > self.journal_start + len(self.journal):
+            raise (Exception("Floor {0} can't go back to this checkpoint".format(self.name)))
+
+        journal = self.journal
+        self.journal = None
+
+        while self.journal_start + len(journal) > position:
+            index, old_code = journal.pop()
+            self.set_tile_at(index, Floor.CODE_TILES[old_code])
+
+        self.journal = journal
+
+        if switch_on != self.switch_on:
+            self.switch(switch_on)
+
+        self.bombs = dict(bombs)
+        self.braziers = dict(braziers)
+        self.timers.restore(timers)
+
+        if rng_state is not self.rng_state:
+            self.rng.setstate(rng_state)
+            self.rng_state = rng_state
+
+    # Has anything on the floor changed since a checkpoint was taken?
+    def changed_since(self, checkpoint):
+        return self.checkpoint() != checkpoint
+
+    # Stop journaling changes that happened before a checkpoint as nothing older will be restored
+    def forget(self, checkpoint):
+        position = checkpoint[0]
+        if self.journal is not None and position > self.journal_start:
+            del self.journal[:position - self.journal_start]
+            self.journal_start = position
+
+    # Create a plan for the current floor size, either empty or from the specified tile codes
+    def clear_plan(self, plan=None):
+        if plan is None:
+            self.plan = bytearray(Floor.encode_row(Floor.EMPTY) * (self.width * self.height))
+        else:
+            self.plan = bytearray(plan)
+
+        self.dirty = set(range(len(self.plan)))
+        self.flow_field = None
+        self.flow_source = None
+        self.routes = None
+        self.free_cells = None
+        self.build_index()
+
+        # The old tile codes of every square changed since the oldest checkpoint, if there are any checkpoints
+        self.journal = None
+        self.journal_start = 0
+
+    # Build the live sets of plan indexes of the entities that need to be processed on each tick
+    def build_index(self):
+        self.enemy_positions = set()
+        self.lit_bombs = set()
+        self.lit_braziers = set()
+        self.bangs = set()
+        self.switch_positions = set()
+
+        self.entity_index = {ord(Floor.BOMB_LIT): self.lit_bombs,
+                             ord(Floor.BRAZIER_LIT): self.lit_braziers,
+                             ord(Floor.BANG): self.bangs,
+                             ord(Floor.SWITCH_TILE): self.switch_positions}
+
+        for enemy in Floor.ENEMIES:
+            self.entity_index[ord(enemy)] = self.enemy_positions
+
+        for code, positions in self.entity_index.items():
+            index = self.plan.find(code)
+            while index >= 0:
+                positions.add(index)
+                index = self.plan.find(code, index + 1)
+
+    # Get the indexes of the squares left, right, above and below a location that are on the floor
+    def neighbours(self, index: int):
+        x, y = self.position(index)
+        neighbours = []
+        if x > 0:
+            neighbours.append(index - 1)
+        if x < self.width - 1:
+            neighbours.append(index + 1)
+        if y > 0:
+            neighbours.append(index - self.width)
+        if y < self.height - 1:
+            neighbours.append(index + self.width)
+        return neighbours
+
+    # Work out how far every square is from the player going around anything that blocks the player.
+    # All of the enemies being pulled towards the player share this so it is only rebuilt when the player moves
+    # or a blocking tile changes.
+    def build_flow_field(self):
+        source = self.index(self.player.x, self.player.y)
+        field = [-1] * len(self.plan)
+        field[source] = 0
+        queue = collections.deque([source])
+
+        while len(queue) > 0:
+            index = queue.popleft()
+            distance = field[index] + 1
+            for neighbour in self.neighbours(index):
+                if field[neighbour] < 0 and self.get_tile_at(neighbour) not in Floor.PLAYER_BLOCKED_TILES:
+                    field[neighbour] = distance
+                    queue.append(neighbour)
+
+        self.flow_field = field
+        self.flow_source = source
+
+    # Get the flow field towards the player, building it if it is out of date
+    def get_flow_field(self):
+        if self.flow_field is None or self.flow_source != self.index(self.player.x, self.player.y):
+            self.build_flow_field()
+        return self.flow_field
+
+    # Get the routes around the floor, working them out the first time they are needed
+    def get_routes(self):
+        if self.routes is None:
+            self.routes = FloorRoutes(self)
+        return self.routes
+
+    # Get the indexes of the 3x3 area around a location that are on the floor
+    def area_positions(self, index: int):
+        x, y = self.position(index)
+        return [area_y * self.width + area_x for area_y in range(max(0, y - 1), min(self.height, y + 2))
+                for area_x in range(max(0, x - 1), min(self.width, x + 2))]
+
+    # Get the indexes of all of the active entities in the order that they need to be processed
+    def active_positions(self):
+        positions = self.enemy_positions | self.lit_bombs | self.lit_braziers | self.bangs
+
+        # Switch tiles can masquerade as active tiles e.g. lit bombs
+        if self.switch_tiles is not None and Floor.ACTIVE_TILES.intersection(self.switch_tiles):
+            positions |= self.switch_positions
+
+        return sorted(positions)
 
     def get_tile(self, x: int, y: int):
-        tile = self.plan[x][y]
+        return self.get_tile_at(y * self.width + x)
+
+    def get_tile_at(self, index: int):
+        tile = Floor.CODE_TILES[self.plan[index]]
 
         if tile == Floor.SWITCH_TILE and self.switch_tiles is not None:
             if self.switch_on == True:
@@ -328,15 +578,29 @@ class Floor:
 
         return tile
 
+    # Get the tile that switch tiles are currently showing, if the floor has any
+    def switch_tile(self):
+        if self.switch_tiles is None:
+            return None
+        elif self.switch_on == True:
+            return self.switch_tiles[1]
+        else:
+            return self.switch_tiles[0]
+
+    # Get the tile that a tile code shows, allowing for switch tiles
+    def code_tile(self, code: int):
+        if code == Floor.SWITCH_TILE_CODE and self.switch_tiles is not None:
+            return self.switch_tile()
+        else:
+            return Floor.CODE_TILES[code]
+
     def set_current_tile(self, new_tile: str):
         self.set_tile(self.player.x, self.player.y, new_tile)
 
     def print(self):
 
         for y in range(0, self.height):
-            for x in range(0, self.width):
-                sys.stdout.write(self.plan[x][y])
-            print()
+            print(self.row(y).decode(Floor.TILE_ENCODING))
         sys.stdout.flush()
 
     def move_player(self, dx: int, dy: int):
@@ -348,7 +612,6 @@ class Floor:
         new_y = self.player.y + dy
 
         if new_x < 0 or new_x >= self.width or new_y < 0 or new_y >= self.height:
-            print("Hit the boundary!")
             new_x = self.player.x
             new_y = self.player.y
 
@@ -356,6 +619,10 @@ class Floor:
             new_x = self.player.x
             new_y = self.player.y
 
+        # Both the square the player left and the one they moved to need redrawing
+        self.dirty.add(self.index(self.player.x, self.player.y))
+        self.dirty.add(self.index(new_x, new_y))
+
         self.player.x = new_x
         self.player.y = new_y
 
@@ -370,123 +637,824 @@ class Floor:
             return False
 
     def switch(self, setting=None):
+        old_tile = self.switch_tile()
+
         if setting is None:
             self.switch_on = not self.switch_on
         else:
             self.switch_on = setting
 
+        # All of the switch tiles change how they look and could now block the way to the player
+        self.dirty.update(self.switch_positions)
+        self.flow_field = None
+
+        if self.routes is not None and old_tile is not None:
+            self.routes.tiles_changed(self.switch_positions, old_tile, self.switch_tile())
+
     def tick(self):
 
         # If the player is on a damage tile then take damage
-        if self.current_tile in Floor.PLAYER_DOT_TILES:
+        tile = self.current_tile
+        if tile in Floor.PLAYER_DOT_TILES:
             self.player.HP -= 1
+            self.events.emit(EventStream.DAMAGE, self.name, self.player.x, self.player.y, tile, 1)
 
-        enemy_count = 0
+        # Enemies are about to use the random number generator
+        self.rng_state = None
+
+        fuses = self.timers.advance()
         new_enemy_positions = {}
 
-        # Look for items across the floor plan
-        for y in range(0, self.height):
-            for x in range(0, self.width):
+        # Look for active items across the floor plan
+        for index in self.active_positions():
+
+            tile = self.get_tile_at(index)
+
+            # If we found a lit bomb...
+            if tile == Floor.BOMB_LIT:
+                self.tick_bomb(index)
+
+            # If we found a lit brazier...
+            if tile == Floor.BRAZIER_LIT:
+                self.tick_brazier(index)
+
+            # If we found a bang...
+            elif tile == Floor.BANG:
+                self.explode(index)
+
+            # If we found an enemy...
+            elif tile in Floor.ENEMIES:
+                self.move_enemy(index, tile, new_enemy_positions)
+
+        for index in new_enemy_positions.keys():
+            self.set_tile_at(index, new_enemy_positions[index])
+
+        self.put_out_fuses(fuses)
+
+    # Light the fuse of a lit bomb the first time that it is ticked and turn it into a bang when the fuse runs out
+    def tick_bomb(self, index: int):
+        # The bomb's count down needs redrawing
+        self.dirty.add(index)
+
+        if index not in self.bombs:
+            self.bombs[index] = self.timers.schedule(TowerRPG.BOMB_COUNT, index)
+        elif self.bombs[index] <= self.timers.now:
+            self.set_tile_at(index, Floor.BANG)
+            del self.bombs[index]
+
+    # Light a brazier's fuse the first time that it is ticked and melt the area around it when the fuse runs out
+    def tick_brazier(self, index: int):
+        if index not in self.braziers:
+            self.braziers[index] = self.timers.schedule(TowerRPG.BRAZIER_COUNT, index)
+        elif self.braziers[index] <= self.timers.now:
+            self.set_tile_at(index, Floor.BRAZIER)
+            del self.braziers[index]
+            self.melt(index)
+
+    # Fuses that ran out on a tick are normally dealt with by the bomb or brazier being ticked. Any that are
+    # left belong to a bomb or brazier that has been blown up or switched off, so they go out.
+    def put_out_fuses(self, fuses):
+        for due, index in fuses:
+            if self.bombs.get(index) == due:
+                del self.bombs[index]
+            if self.braziers.get(index) == due:
+                del self.braziers[index]
+
+    # How many floor ticks are left before the lit bomb or brazier at an index goes out
+    def fuse_remaining(self, index: int):
+        due = self.bombs.get(index, self.braziers.get(index))
+        if due is not None:
+            return self.timers.remaining(due)
+        else:
+            return None
 
-                tile = self.get_tile(x, y)
+    # Bring the floor up to date with the floor ticks that it missed while the player was on another floor.
+    # Ticks are only played one at a time while something is going on. A floor with lit bombs or braziers but no
+    # enemies jumps straight to the tick that the next fuse runs out on, and once nothing is left but enemies
+    # wandering about at random the rest of the ticks are skipped.
+    def catch_up(self, ticks: int):
+        enemy_move_mode = self.enemy_move_mode
+        self.enemy_move_mode = Floor.MOVE_RANDOM
+        self.catching_up = True
+        wander_ticks = 0
+
+        while ticks > 0:
+            enemies = False
+            waiting = True
+            for index in self.active_positions():
+                tile = self.get_tile_at(index)
+                if tile in Floor.ENEMIES:
+                    enemies = True
+
+                # Switch tiles are always listed in case they are showing an active tile
+                elif tile in Floor.ACTIVE_TILES and (tile != Floor.BOMB_LIT or index not in self.bombs) and \
+                        (tile != Floor.BRAZIER_LIT or index not in self.braziers):
+                    waiting = False
+
+            # Nothing is going on apart from enemies wandering about
+            if waiting is True and len(self.timers) == 0:
+                if enemies is False or wander_ticks >= Floor.CATCH_UP_WANDER_TICKS:
+                    break
+                wander_ticks += 1
+
+            # Nothing changes until the next fuse runs out
+            elif waiting is True and enemies is False:
+                skip = min(ticks, self.timers.next_due() - self.timers.now - 1)
+                if skip > 0:
+                    self.timers.advance(skip)
+                    ticks -= skip
+                    continue
+
+            self.tick()
+            ticks -= 1
+
+        self.catching_up = False
+        self.enemy_move_mode = enemy_move_mode
+
+    # Melt any meltable tiles in the 3x3 area around a location
+    def melt(self, index: int):
+        for area_index in self.area_positions(index):
+            tile = self.tile_at(area_index)
+            if tile in Floor.MELTABLE_ITEMS.keys():
+                self.set_tile_at(area_index, Floor.MELTABLE_ITEMS[tile])
+
+    # Blow up everything destructible in the 3x3 area around a bang
+    def explode(self, index: int):
+        player_index = self.index(self.player.x, self.player.y) if self.catching_up is False else None
+        self.events.emit(EventStream.EXPLOSION, self.name, *self.position(index), Floor.BANG)
+
+        for area_index in self.area_positions(index):
+            tile = self.tile_at(area_index)
+
+            if tile in Floor.ENEMIES:
+                self.player.kills += 1
+                self.events.emit(EventStream.KILL, self.name, *self.position(area_index), Floor.BANG, 1)
 
-                # If we found a lit bomb...
-                if tile == Floor.BOMB_LIT:
-                    if (x, y) not in self.bombs:
-                        self.bombs[(x, y)] = TowerRPG.BOMB_COUNT
-                    else:
-                        self.bombs[(x, y)] = self.bombs[(x, y)] - 1
-                        if self.bombs[(x, y)] <= 0:
-                            self.plan[x][y] = Floor.BANG
-                            del self.bombs[(x, y)]
-
-                # If we found a lit brazier...
-                if tile == Floor.BRAZIER_LIT:
-                    if (x, y) not in self.braziers:
-                        self.braziers[(x, y)] = TowerRPG.BRAZIER_COUNT
+            elif player_index == area_index:
+                self.player.HP -= 3
+                self.events.emit(EventStream.DAMAGE, self.name, self.player.x, self.player.y, Floor.BANG, 3)
+
+            if tile not in Floor.INDESTRUCTIBLE_ITEMS:
+                self.set_tile_at(area_index, Floor.EMPTY)
+
+    # Can an enemy move on to a square, either because it is free or because it contains lightning
+    def enemy_can_enter(self, index: int, new_enemy_positions: dict):
+        tile = self.tile_at(index)
+        return (tile == Floor.EMPTY and index not in new_enemy_positions) or tile == Floor.LIGHTNING
+
+    # Work out where an enemy wants to move to and record its new position
+    def move_enemy(self, index: int, tile: str, new_enemy_positions: dict):
+
+        x, y = self.position(index)
+
+        # If we are in random move mode then...
+        if self.enemy_move_mode == Floor.MOVE_RANDOM:
+            # ..look at a random square around the enemy...
+            new_x, new_y = self.rng.choice(((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)))
+            new_x += x
+            new_y += y
+
+        # If we are in magnet move mode then..
+        elif self.enemy_move_mode == Floor.MOVE_MAGNET:
+
+            new_x = x
+            new_y = y
+
+            # ...follow the flow field one square closer to the player if we can
+            field = self.get_flow_field()
+            distance = field[index]
+
+            if distance > 0:
+                for neighbour in self.neighbours(index):
+                    if field[neighbour] == distance - 1 and self.enemy_can_enter(neighbour, new_enemy_positions):
+                        new_x, new_y = self.position(neighbour)
+                        break
+
+        # If out of bounds...
+        if new_x < 0 or new_x >= self.width or new_y < 0 or new_y >= self.height:
+            return
+
+        new_index = self.index(new_x, new_y)
+
+        # ...if the square is empty move the enemy to the new square
+        if self.tile_at(new_index) == Floor.EMPTY and new_index not in new_enemy_positions:
+            self.set_tile_at(index, Floor.EMPTY)
+            new_enemy_positions[new_index] = tile
+
+        # ...else if the square contains lightning then kill the enemy
+        elif self.tile_at(new_index) == Floor.LIGHTNING:
+            self.player.kills += 1
+            self.set_tile_at(index, Floor.EMPTY)
+            self.events.emit(EventStream.KILL, self.name, new_x, new_y, Floor.LIGHTNING, 1)
+
+
+# A floor plan that has been parsed once and is then shared by every floor built from it.
+# The tiles are immutable bytes with the safety zones already in place, along with everything that
+# Floor.load_template needs to know about the plan, so building a floor is just a copy of the tiles.
+class FloorTemplate:
+    def __init__(self, plan):
+
+        self.height = len(plan)
+        self.width = len(plan[0])
+        self.entrance = None
+        self.exit = None
+        self.trophies = 0
+
+        # Short rows are padded out with empty tiles
+        tiles = bytearray(b"".join(Floor.encode_row(row[:self.width].ljust(self.width, Floor.EMPTY)) for row in plan))
+
+        fake_exits = []
+
+        for y in range(0, len(plan)):
+            row = plan[y]
+            for x in range(0, min(self.width, len(row))):
+
+                if row[x] == Floor.EXIT:
+                    self.exit = (x, y)
+                    logging.info("Found the exit at %i,%i", x, y)
+
+                elif row[x] == Floor.ENTRANCE:
+                    self.entrance = (x, y)
+                    logging.info("Found the entrance at %i,%i", x, y)
+
+                elif row[x] == Floor.ENTRANCE_TELEPORT and self.entrance is None:
+                    self.entrance = (x, y)
+                    logging.info("Found the teleport entrance at %i,%i", x, y)
+
+                elif row[x] == Floor.GOAL:
+                    self.trophies += 1
+                    logging.info("Found a trophy at %i,%i", x, y)
+
+                elif row[x] == Floor.FAKE_EXIT:
+                    fake_exits.append((x, y))
+
+        if self.entrance is None:
+            self.entrance = (1, 1)
+
+        self.fake_exits = tuple(fake_exits)
+
+        # Create safety zones around the entrance and exits. If there is no real exit then one of the fake exits
+        # will become the exit so it already has a safety zone.
+        for x, y in (self.entrance,) + ((self.exit,) if self.exit is not None else ()) + self.fake_exits:
+            self.safety_zone(tiles, x, y, 4, 4)
+
+        self.plan = bytes(tiles)
+
+    # Build a safety zone around a specified location in the plan's tile codes
+    def safety_zone(self, tiles, x, y, height, width):
+        for index in Floor.safety_zone_squares(x, y, height, width, self.width, self.height):
+            if tiles[index] == Floor.EMPTY_CODE:
+                tiles[index] = ord(Floor.SAFETY)
+
+
+# Answers "can the player get there?" and "what is the shortest way there?" about a floor.
+# The floor is split into areas of squares that the player can walk around freely. Doors, fake exits and the
+# squares that take the player off the floor are gates between the areas. The areas are kept up to date as
+# tiles change so only the area around a changed square is ever worked out again, and answers are cached until
+# a change that could affect them.
+class FloorRoutes:
+    # How the player can get through each kind of square
+    OPEN = "OPEN"
+    BLOCKED = "BLOCKED"
+    GATE = "GATE"
+    STOP = "STOP"
+
+    GATE_TILES = (Floor.DOOR, Floor.BOSS_DOOR, Floor.FAKE_EXIT)
+    STOP_TILES = (Floor.EXIT, Floor.ENTRANCE, Floor.TELEPORT1, Floor.TELEPORT2)
+    KEY_TILES = (Floor.KEY, Floor.BOSS_KEY, Floor.EXIT_KEY)
+
+    def __init__(self, floor: Floor):
+        self.floor = floor
+        self.build()
+
+    # Work out the kind of a tile as far as the player getting through it goes
+    @staticmethod
+    def kind(tile: str):
+        if tile in Floor.PLAYER_BLOCKED_TILES:
+            return FloorRoutes.BLOCKED
+        elif tile in FloorRoutes.GATE_TILES:
+            return FloorRoutes.GATE
+        elif tile in FloorRoutes.STOP_TILES:
+            return FloorRoutes.STOP
+        else:
+            return FloorRoutes.OPEN
+
+    # Split the whole floor up into areas and gates
+    def build(self):
+        self.labels = [-1] * (self.floor.width * self.floor.height)
+        self.members = {}
+        self.key_counts = {}
+        self.gates = {}
+        self.next_area = 0
+        self.clear_cache()
+
+        for index in range(len(self.labels)):
+            tile = self.floor.get_tile_at(index)
+            kind = FloorRoutes.kind(tile)
+            if kind == FloorRoutes.OPEN and self.labels[index] < 0:
+                self.new_area(self.flood(index, lambda square: self.labels[square] < 0 and FloorRoutes.kind(
+                    self.floor.get_tile_at(square)) == FloorRoutes.OPEN))
+            elif kind in (FloorRoutes.GATE, FloorRoutes.STOP):
+                self.gates[index] = tile
+
+    # Forget the answers to any queries
+    def clear_cache(self):
+        self.reach_cache = {}
+        self.path_cache = {}
+        self.area_gates = None
+
+    # Find all of the squares that can be walked to from a square without leaving the squares that are included
+    def flood(self, index: int, included):
+        squares = {index}
+        queue = collections.deque([index])
+        while len(queue) > 0:
+            for neighbour in self.floor.neighbours(queue.popleft()):
+                if neighbour not in squares and included(neighbour):
+                    squares.add(neighbour)
+                    queue.append(neighbour)
+        return squares
+
+    # Make a new area out of a set of squares
+    def new_area(self, squares: set):
+        area = self.next_area
+        self.next_area += 1
+        self.members[area] = squares
+        self.key_counts[area] = collections.Counter()
+        for square in squares:
+            self.labels[square] = area
+            tile = self.floor.get_tile_at(square)
+            if tile in FloorRoutes.KEY_TILES:
+                self.key_counts[area][tile] += 1
+        return area
+
+    # Get the areas next to a square
+    def neighbour_areas(self, index: int):
+        return {self.labels[neighbour] for neighbour in self.floor.neighbours(index) if self.labels[neighbour] >= 0}
+
+    # Is a gate the only way into an area?
+    def only_way_in(self, gate: int, area: int):
+        if self.area_gates is None:
+            self.area_gates = collections.defaultdict(set)
+            for other_gate, tile in self.gates.items():
+                if tile in FloorRoutes.GATE_TILES:
+                    for other_area in self.neighbour_areas(other_gate):
+                        self.area_gates[other_area].add(other_gate)
+
+        return self.area_gates[area] == {gate}
+
+    # Keep the areas up to date when the tile shown at a square changes
+    def tile_changed(self, index: int, old_tile: str, new_tile: str):
+        if old_tile == new_tile:
+            return
+
+        old_kind = FloorRoutes.kind(old_tile)
+        new_kind = FloorRoutes.kind(new_tile)
+
+        # Most changes e.g. enemies moving around don't change any routes
+        if old_kind == new_kind == FloorRoutes.OPEN:
+            if old_tile in FloorRoutes.KEY_TILES or new_tile in FloorRoutes.KEY_TILES:
+                counts = self.key_counts[self.labels[index]]
+                if old_tile in FloorRoutes.KEY_TILES:
+                    counts[old_tile] -= 1
+                if new_tile in FloorRoutes.KEY_TILES:
+                    counts[new_tile] += 1
+                self.clear_cache()
+            return
+        elif old_kind == new_kind == FloorRoutes.BLOCKED:
+            return
+
+        self.clear_cache()
+
+        if old_kind == FloorRoutes.OPEN:
+            self.remove_square(index, old_tile)
+        elif old_kind != FloorRoutes.BLOCKED:
+            del self.gates[index]
+
+        if new_kind == FloorRoutes.OPEN:
+            self.add_square(index, new_tile)
+        elif new_kind != FloorRoutes.BLOCKED:
+            self.gates[index] = new_tile
+
+    # Keep the areas up to date when a set of squares all change to show the same new tile e.g. switch tiles
+    def tiles_changed(self, indexes, old_tile: str, new_tile: str):
+        for index in indexes:
+            self.tile_changed(index, old_tile, new_tile)
+
+    # Add an open square to the areas around it, joining them together if there is more than one
+    def add_square(self, index: int, tile: str):
+        areas = sorted(self.neighbour_areas(index), key=lambda area: len(self.members[area]), reverse=True)
+
+        if len(areas) == 0:
+            self.new_area({index})
+            return
+
+        area = areas[0]
+        for other_area in areas[1:]:
+            for square in self.members[other_area]:
+                self.labels[square] = area
+            self.members[area] |= self.members.pop(other_area)
+            self.key_counts[area] += self.key_counts.pop(other_area)
+
+        self.labels[index] = area
+        self.members[area].add(index)
+        if tile in FloorRoutes.KEY_TILES:
+            self.key_counts[area][tile] += 1
+
+    # Take a square out of its area, splitting the area up if the square was the only way between its parts
+    def remove_square(self, index: int, tile: str):
+        area = self.labels[index]
+        self.labels[index] = -1
+        self.members[area].discard(index)
+        if tile in FloorRoutes.KEY_TILES:
+            self.key_counts[area][tile] -= 1
+
+        neighbours = [neighbour for neighbour in self.floor.neighbours(index) if self.labels[neighbour] == area]
+        if len(neighbours) < 2:
+            if len(self.members[area]) == 0:
+                del self.members[area]
+                del self.key_counts[area]
+            return
+
+        # Every part that can't be reached from the first neighbour becomes a new area
+        part = self.flood(neighbours[0], lambda square: self.labels[square] == area)
+        for neighbour in neighbours[1:]:
+            if neighbour not in part and self.labels[neighbour] == area:
+                new_part = self.flood(neighbour, lambda square: self.labels[square] == area)
+                self.members[area] -= new_part
+                self.key_counts[area] -= self.key_counts[self.new_area(new_part)]
+
+    # Get the player's current situation for any details of a query that were not given
+    def player_details(self, source, keys, boss_key, exit_keys):
+        player = self.floor.player
+        if source is None:
+            source = (player.x, player.y)
+        if keys is None:
+            keys = player.keys if player is not None else 0
+        if boss_key is None:
+            boss_key = player.boss_key if player is not None else False
+        if exit_keys is None:
+            exit_keys = player.exit_keys if player is not None else 0
+        return self.floor.index(*source), keys, boss_key, exit_keys
+
+    # Find everywhere the player can get to from a square, collecting any keys that they find along the way.
+    # Opening a door uses up a key, so when there are not enough keys for every door each choice of door is tried.
+    # Returns every different way that things can end up as (areas, gates reached, gates opened, keys found).
+    def reach(self, source: int, keys: int, boss_key: bool, exit_keys: int):
+        start = self.labels[source] if self.labels[source] >= 0 else -1 - source
+        query = (start, keys, boss_key, exit_keys, self.floor.exit_locked)
+        if query in self.reach_cache:
+            return self.reach_cache[query]
+
+        if start >= 0:
+            areas = {start}
+            opened = set()
+        else:
+            areas = self.neighbour_areas(source)
+            opened = {source}
+
+        outcomes = []
+        seen = set()
+        choices = [(areas, opened, 0, 0)]
+
+        while len(choices) > 0:
+            areas, opened, doors_opened, boss_doors_opened = choices.pop()
+
+            # Gates can lead straight on to other gates so the gates that are open matter as well as the areas.
+            # Opening the same doors in a different order ends up the same way so each is only explored once.
+            before = (frozenset(areas), frozenset(opened))
+            if before in seen:
+                continue
+            seen.add(before)
+
+            areas, reached, opened, found, locked, doors_opened, boss_doors_opened = \
+                self.explore(areas, opened, keys, boss_key, exit_keys, doors_opened, boss_doors_opened)
+
+            after = (frozenset(areas), frozenset(opened))
+            if after != before:
+                if after in seen:
+                    continue
+                seen.add(after)
+
+            # Once there are no more doors that can be opened this is as far as the player can get. Doors that
+            # the player could get to here but that don't lead anywhere may have their keys used up by the choices
+            # that come after, so keep this way of things ending up as well.
+            spare = [gate for gate in reached - opened if self.gates[gate] in (Floor.DOOR, Floor.BOSS_DOOR)]
+            if len(locked) == 0 or len(spare) > 0:
+                outcomes.append((frozenset(areas), frozenset(reached), frozenset(opened), found))
+            if len(locked) == 0:
+                continue
+
+            for gate in locked:
+                if self.gates[gate] == Floor.DOOR:
+                    choices.append((areas | self.neighbour_areas(gate), opened | {gate}, doors_opened + 1,
+                                    boss_doors_opened))
+                else:
+                    choices.append((areas | self.neighbour_areas(gate), opened | {gate}, doors_opened,
+                                    boss_doors_opened + 1))
+
+        result = tuple(outcomes)
+        self.reach_cache[query] = result
+        return result
+
+    # Is a square next to any of the areas or to a gate that has been opened?
+    def next_to(self, index: int, areas: set, opened: set):
+        return any(self.labels[neighbour] in areas or neighbour in opened
+                   for neighbour in self.floor.neighbours(index))
+
+    # Would opening a gate lead somewhere new, either into a new area or on to a gate that can't be got to yet?
+    def leads_somewhere(self, gate: int, areas: set, opened: set):
+        if len(self.neighbour_areas(gate) - areas) > 0:
+            return True
+
+        return any(neighbour in self.gates and neighbour not in opened and not self.next_to(neighbour, areas, opened)
+                   for neighbour in self.floor.neighbours(gate))
+
+    # Spread out from some areas as far as possible without having to choose which doors to use the keys on.
+    # A door is opened straight away if there are enough keys for every door left or it is the only way to a key for
+    # it on the other side, as then opening it can't stop the player getting anywhere. An open gate is somewhere the
+    # player can stand, so the gates next to it can be got to as well. Returns the areas, the gates reached, the gates
+    # opened, the keys found, the doors that need a choice making and how many of each kind of door are open.
+    def explore(self, areas: set, opened: set, keys: int, boss_key: bool, exit_keys: int, doors_opened: int,
+                boss_doors_opened: int):
+        areas = set(areas)
+        opened = set(opened)
+
+        while True:
+            found = collections.Counter()
+            for area in areas:
+                found += self.key_counts[area]
+
+            keys_left = keys + found[Floor.KEY] - doors_opened
+            boss_keys_left = int(boss_key) + found[Floor.BOSS_KEY] - boss_doors_opened
+            exit_key = exit_keys + found[Floor.EXIT_KEY] > 0
+            shut = collections.Counter(tile for gate, tile in self.gates.items() if gate not in opened)
+
+            reached = set()
+            locked = []
+            progress = False
+
+            for gate in sorted(self.gates):
+                if gate in opened or not self.next_to(gate, areas, opened):
+                    continue
+
+                tile = self.gates[gate]
+
+                # The player can step onto exits, entrances and teleports but the exit sends them back if it is locked
+                # and they don't have an exit key...
+                if tile in FloorRoutes.STOP_TILES:
+                    if tile != Floor.EXIT or self.floor.exit_locked is False or exit_key:
+                        reached.add(gate)
+                    continue
+
+                # ...fake exits vanish if the player has an exit key and doesn't use it up...
+                if tile == Floor.FAKE_EXIT:
+                    if self.floor.exit_locked is True and exit_key:
+                        opened.add(gate)
+                        areas |= self.neighbour_areas(gate)
+                        progress = True
+                        break
+                    continue
+
+                # ...but doors use up a key so the player can only get to them if they have one left...
+                if tile == Floor.DOOR:
+                    key, left, kind = Floor.KEY, keys_left, shut[Floor.DOOR]
+                elif tile == Floor.BOSS_DOOR:
+                    key, left, kind = Floor.BOSS_KEY, boss_keys_left, shut[Floor.BOSS_DOOR]
+                else:
+                    continue
+
+                if left <= 0:
+                    continue
+
+                reached.add(gate)
+
+                # ...and they are only opened if they lead somewhere new
+                if not self.leads_somewhere(gate, areas, opened):
+                    continue
+
+                beyond = self.neighbour_areas(gate) - areas
+                if left >= kind or any(self.key_counts[area][key] > 0 and self.only_way_in(gate, area)
+                                       for area in beyond):
+                    opened.add(gate)
+                    areas |= beyond
+                    if tile == Floor.DOOR:
+                        doors_opened += 1
                     else:
-                        self.braziers[(x, y)] = self.braziers[(x, y)] - 1
-                        if self.braziers[(x, y)] <= 0:
-                            self.plan[x][y] = Floor.BRAZIER
-                            del self.braziers[(x, y)]
-
-                            for area_y in range(y - 1, y + 2):
-                                for area_x in range(x - 1, x + 2):
-                                    tile = self.plan[area_x][area_y]
-                                    if tile in Floor.MELTABLE_ITEMS.keys():
-                                        self.plan[area_x][area_y] = Floor.MELTABLE_ITEMS[tile]
-
-                # If we found a bang...
-                elif tile == Floor.BANG:
-                    for area_y in range(y - 1, y + 2):
-                        for area_x in range(x - 1, x + 2):
-                            tile = self.plan[area_x][area_y]
-
-                            if tile in Floor.ENEMIES:
-                                self.player.kills += 1
-                                print("You killed an enemy with a bomb!")
-
-                            elif (self.player.x, self.player.y) == (area_x, area_y):
-                                self.player.HP -= 3
-                                print("You were hit by the bomb blast and lost health!")
-
-                            if tile not in Floor.INDESTRUCTIBLE_ITEMS:
-                                self.plan[area_x][area_y] = Floor.EMPTY
-
-                # If we found an enemy...
-                elif tile in Floor.ENEMIES:
-
-                    enemy_count += 1
-
-                    # If we are in random move mode then...
-                    if self.enemy_move_mode == Floor.MOVE_RANDOM:
-                        # ..look at a random square around the enemy...
-                        new_x, new_y = random.choice(((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)))
-                        new_x += x
-                        new_y += y
-
-                    # If we are in magnet move mode then..
-                    elif self.enemy_move_mode == Floor.MOVE_MAGNET:
-
-                        new_x = x
-                        new_y = y
-
-                        # first try and move horizontally towards the player...
-                        if self.player.x > x:
-                            new_x += 1
-                        elif self.player.x < x:
-                            new_x -= 1
-
-                        if new_x < 0 or new_x >= self.width or new_y < 0 or new_y >= self.height:
-                            new_x = x
-                            new_y = y
-
-                        # if this square is not empty then try moving vertically towards the player...
-                        if self.plan[new_x][new_y] not in Floor.ENEMY_EMPTY_TILES:
-                            new_x = x
-                            if self.player.y > y:
-                                new_y += 1
-                            elif self.player.y < y:
-                                new_y -= 1
-
-                    # If out of bounds...
-                    if new_x < 0 or new_x >= self.width or new_y < 0 or new_y >= self.height:
-                        print("Hit boundary")
-
-                    # ...if the square is empty move the enemy to the new square
-                    elif self.plan[new_x][new_y] == Floor.EMPTY and (new_x, new_y) not in new_enemy_positions:
-                        self.plan[x][y] = Floor.EMPTY
-                        new_enemy_positions[(new_x, new_y)] = tile
-
-                    # ...else if the square contains lightning then kill the enemy
-                    elif self.plan[new_x][new_y] == Floor.LIGHTNING:
-                        print("You killed an enemy with lightning!")
-                        self.player.kills += 1
-                        self.plan[x][y] = Floor.EMPTY
-
-        for key in new_enemy_positions.keys():
-            new_x, new_y = key
-            self.plan[new_x][new_y] = new_enemy_positions[key]
+                        boss_doors_opened += 1
+                    progress = True
+                    break
+
+                locked.append(gate)
+
+            if progress is False:
+                return areas, reached | opened, opened, found, locked, doors_opened, boss_doors_opened
+
+    # Can the player get to a position? Anything not given is taken from the player on the floor.
+    # Gates only count once the player can get through them e.g. a door they have a key for.
+    def can_reach(self, position, source=None, keys=None, boss_key=None, exit_keys=None):
+        source, keys, boss_key, exit_keys = self.player_details(source, keys, boss_key, exit_keys)
+        index = self.floor.index(*position)
+        if index == source:
+            return True
+
+        return any(self.labels[index] in areas or index in reached
+                   for areas, reached, opened, found in self.reach(source, keys, boss_key, exit_keys))
+
+    # Can the player get to the exit and through it? The exit is only reached if it is unlocked or they have a key.
+    def can_exit(self, source=None, keys=None, boss_key=None, exit_keys=None):
+        if self.floor.exit is None:
+            return False
+
+        source, keys, boss_key, exit_keys = self.player_details(source, keys, boss_key, exit_keys)
+        exit_index = self.floor.index(*self.floor.exit)
+
+        return any(exit_index in reached
+                   for areas, reached, opened, found in self.reach(source, keys, boss_key, exit_keys))
+
+    # Get the shortest list of positions from the source to a position, or None if the player can't get there.
+    # The path goes through the doors that the player can open but doesn't go out of its way to collect keys.
+    def shortest_path(self, position, source=None, keys=None, boss_key=None, exit_keys=None):
+        source, keys, boss_key, exit_keys = self.player_details(source, keys, boss_key, exit_keys)
+        target = self.floor.index(*position)
+
+        if target == source:
+            return [self.floor.position(source)]
+
+        query = (source, keys, boss_key, exit_keys, self.floor.exit_locked)
+        if query not in self.path_cache:
+            self.path_cache[query] = [self.search(source, outcome)
+                                      for outcome in self.reach(source, keys, boss_key, exit_keys)]
+
+        # Each way of opening the doors gives its own paths so take the shortest of them
+        best = None
+        for previous in self.path_cache[query]:
+            if target not in previous:
+                continue
+
+            path = [target]
+            while path[-1] != source:
+                path.append(previous[path[-1]])
+
+            if best is None or len(path) < len(best):
+                best = path
+
+        if best is None:
+            return None
+
+        best.reverse()
+        return [self.floor.position(index) for index in best]
+
+    # Get the length of the shortest path to a position, or None if the player can't get there
+    def distance(self, position, source=None, keys=None, boss_key=None, exit_keys=None):
+        path = self.shortest_path(position, source, keys, boss_key, exit_keys)
+        return len(path) - 1 if path is not None else None
+
+    # Breadth first search out from a square through one way of opening the doors, recording the square that each
+    # square was first reached from
+    def search(self, source: int, outcome):
+        areas, reached, opened, found = outcome
+        previous = {}
+        queue = collections.deque([source])
+
+        while len(queue) > 0:
+            index = queue.popleft()
+            for neighbour in self.floor.neighbours(index):
+                if neighbour in previous or neighbour == source:
+                    continue
+                if self.labels[neighbour] in areas or neighbour in reached:
+                    previous[neighbour] = index
+                    if self.labels[neighbour] >= 0 or neighbour in opened:
+                        queue.append(neighbour)
+
+        return previous
+
+
+# Something that happened in the game, recorded as it is and only turned into a message if someone wants one
+GameEvent = collections.namedtuple("GameEvent", ("kind", "floor", "x", "y", "tile", "value"))
+
+
+# A bounded stream of the latest game events that the HUD, analytics or logging can subscribe to
+class EventStream:
+    # Kinds of event
+    PICKUP = "PICKUP"
+    KILL = "KILL"
+    DAMAGE = "DAMAGE"
+    DEFEND = "DEFEND"
+    FLOOR_CHANGE = "FLOOR CHANGE"
+    EFFECT_START = "EFFECT START"
+    EFFECT_STOP = "EFFECT STOP"
+    EXPLOSION = "EXPLOSION"
+    SWITCH = "SWITCH"
+    SWAP = "SWAP"
+    UNLOCK = "UNLOCK"
+    LOCKED = "LOCKED"
+    FINISHED = "FINISHED"
+
+    # How many of the latest events are kept
+    SIZE = 256
+
+    # The names of the tiles that appear in messages
+    TILE_NAMES = {Floor.TREASURE: "some treasure",
+                  Floor.TREASURE_CHEST: "a treasure chest",
+                  Floor.HP_POTION: "an HP potion",
+                  Floor.KEY: "a key",
+                  Floor.EXIT_KEY: "an exit key",
+                  Floor.BOSS_KEY: "a BOSS key",
+                  Floor.SWORD: "a sword",
+                  Floor.FROST_WAND: "a frost wand",
+                  Floor.SHIELD: "a shield",
+                  Floor.MAGNET: "a magnet",
+                  Floor.RED_POTION: "a red potion",
+                  Floor.YELLOW_POTION: "a yellow potion",
+                  Floor.GOAL: "a trophy",
+                  Floor.BANG: "a bomb",
+                  Floor.LIGHTNING: "lightning",
+                  Floor.EXIT: "the exit",
+                  Floor.ENTRANCE: "the entrance",
+                  Floor.FAKE_EXIT: "the exit",
+                  Floor.DOOR: "the door",
+                  Floor.BOSS_DOOR: "the BOSS door",
+                  Floor.TRAP: "a trap"}
+
+    MESSAGES = {PICKUP: "Found {name}!!",
+                KILL: "You killed an enemy with {name}!",
+                DAMAGE: "You were hurt by {name} and lost {event.value} HP!",
+                DEFEND: "You defended yourself with your shield",
+                FLOOR_CHANGE: "You went through {name} to floor {event.value}!",
+                EFFECT_START: "Starting {event.value} effect...",
+                EFFECT_STOP: "Stopping {event.value} effect.",
+                EXPLOSION: "A bomb exploded at {event.x},{event.y}!",
+                SWITCH: "You found a switch!!",
+                SWAP: "You found a {event.tile} to {event.value} swappable tile!!",
+                UNLOCK: "You opened {name}!",
+                LOCKED: "You found {name} but it is locked!",
+                FINISHED: "You finished the game with a score of {event.value}!!"}
+
+    def __init__(self, size=None):
+
+        if size is None:
+            size = EventStream.SIZE
+
+        self.events = collections.deque(maxlen=size)
+        self.subscribers = []
+
+    def emit(self, kind: str, floor=None, x=None, y=None, tile=None, value=None):
+        event = GameEvent(kind, floor, x, y, tile, value)
+        self.events.append(event)
+        for subscriber in self.subscribers:
+            subscriber(event)
+
+    # Call a function with every event from now on
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    # Get the latest events, oldest first
+    def recent(self, count=None):
+        if count is None or count >= len(self.events):
+            return list(self.events)
+        else:
+            return list(self.events)[-count:]
+
+    def clear(self):
+        self.events.clear()
+
+    # Turn an event into a message for the player
+    @staticmethod
+    def describe(event: GameEvent):
+        name = EventStream.TILE_NAMES.get(event.tile, event.tile)
+        if event.tile in Floor.ENEMIES:
+            name = "an enemy"
+        elif event.tile in TowerRPG.TELEPORTS:
+            name = "a teleporter"
+        elif event.tile in Floor.PLAYER_DOT_TILES:
+            name = "something nasty"
+        return EventStream.MESSAGES[event.kind].format(event=event, name=name)
+
+
+# Log every event as a message, only doing the work of making the message if it is going to be logged
+def log_event(event: GameEvent):
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info(EventStream.describe(event))
+
+
+# Everything needed to put a game back the way it was. Floors are shared with the live game rather than copied,
+# with each built floor keeping a journal of the squares that change after the checkpoint.
+class Checkpoint:
+    def __init__(self, rpg):
+        self.floor_builder = rpg.floor_builder
+        self.floors = list(rpg.floor_builder.floors)
+        self.floor_checkpoints = [floor.checkpoint() if floor is not None else None for floor in self.floors]
+        self.player = dict(vars(rpg.player))
+        self.effects = dict(rpg.effects)
+        self.timers = rpg.timers.checkpoint()
+        self.state = rpg.state
+        self.tick_count = rpg.tick_count
+        self.effect_count = rpg.effect_count
+        self.current_floor_level = rpg.current_floor_level
+        self.touched_floors = set(rpg.touched_floors)
 
 
 class TowerRPG:
@@ -535,20 +1503,38 @@ class TowerRPG:
     MEDIUM = 500
     HARD = 300
 
-    def __init__(self, player: Player, difficulty=None):
+    def __init__(self, player: Player, difficulty=None, floor_class=None, clock=None, seed=None, hst=None):
 
-        self.floors = []
+        self.floor_builder = None
         self._player = player
 
+        # Everything that happens in the game
+        self.events = EventStream()
+
+        # Function that returns the current time in seconds e.g. a simulated clock for headless runs
+        if clock is None:
+            clock = time.time
+
+        self.clock = clock
+
         if difficulty == None:
             difficulty = TowerRPG.MEDIUM
 
         self.difficulty = difficulty
+        self.floor_class = floor_class
+
+        # Each new game gets its floors seeded from this stream so identical seeds and inputs give identical games
+        self.seed = seed
+        self.rng = random.Random(seed)
 
         self.initialise()
 
-        self.hst = HighScoreTable("Tower")
-        self.hst.load()
+        # The high score table is loaded from disk unless one is given e.g. one that is never saved for headless runs
+        if hst is None:
+            hst = HighScoreTable("Tower")
+            hst.load()
+
+        self.hst = hst
         self.hst.print()
 
     @property
@@ -562,10 +1548,13 @@ class TowerRPG:
 
     def initialise(self):
 
-        self.game_start = time.time()
+        self.game_start = self.clock()
         self.state = TowerRPG.READY
         self.tick_count = 0
         self.effect_count = 0
+
+        # The effects that are running and the tick that each one stops on, timed in playing ticks
+        self.timers = TimerHeap()
         self.effects = {}
 
 
@@ -574,23 +1563,68 @@ class TowerRPG:
 
         self.player.initialise()
 
-        builder = FloorBuilder()
-        builder.initialise()
-        self.floors = builder.floors
-        self.trophies = builder.trophies
+        # Floors are only built when the player first gets to them
+        self.floor_builder = FloorBuilder(self.floor_class, seed=self.rng.getrandbits(64), events=self.events)
+        self.floor_builder.initialise()
+        self.trophies = self.floor_builder.trophies
 
         self.current_floor.player = self.player
         self.current_floor.set_player_position(Floor.ENTRANCE)
 
+        # The floors that have been played on since the game was last saved
+        self.touched_floors = {self.current_floor_level}
+
+    # Take a checkpoint of the game that it can be put back to later
+    def checkpoint(self):
+        return Checkpoint(self)
+
+    # Put the game back to a checkpoint. Any checkpoints taken after it can't be used once this is done.
+    def restore(self, checkpoint: Checkpoint):
+
+        if checkpoint.floor_builder is not self.floor_builder:
+            raise (Exception("Checkpoint is from a different game"))
+
+        # Floors that changed after the checkpoint, even if they have been saved since, have to be saved again
+        # and so do floors that were built after it
+        for level, floor in enumerate(self.floor_builder.floors):
+            if floor is None:
+                continue
+            if level >= len(checkpoint.floors) or checkpoint.floors[level] is not floor or \
+                    floor.changed_since(checkpoint.floor_checkpoints[level]):
+                self.touched_floors.add(level)
+
+        # Floors that were built after the checkpoint get built again from scratch if they are needed
+        self.floor_builder.floors[:] = checkpoint.floors
+
+        for floor, floor_checkpoint in zip(checkpoint.floors, checkpoint.floor_checkpoints):
+            if floor is not None:
+                floor.restore(floor_checkpoint)
+
+        vars(self.player).update(checkpoint.player)
+        self.effects = dict(checkpoint.effects)
+        self.timers.restore(checkpoint.timers)
+        self.state = checkpoint.state
+        self.tick_count = checkpoint.tick_count
+        self.effect_count = checkpoint.effect_count
+        self.current_floor_level = checkpoint.current_floor_level
+        self.touched_floors.update(checkpoint.touched_floors)
+        self.current_floor.player = self.player
+
+    # Forget everything needed to go back to any checkpoint older than this one
+    def forget(self, checkpoint: Checkpoint):
+        for floor, floor_checkpoint in zip(checkpoint.floors, checkpoint.floor_checkpoints):
+            if floor is not None:
+                floor.forget(floor_checkpoint)
+
     @property
     def elapsed_time(self):
-        elapsed_seconds = time.time() - self.game_start
+        elapsed_seconds = self.clock() - self.game_start
         return time.gmtime(elapsed_seconds)
 
     def print(self):
-        for i in range(0, len(self.floors)):
+        for i in range(0, self.floor_builder.floor_count):
             print("Floor {0}".format(i))
-            self.floors[i].print()
+            self.floor_builder.get_floor(i).print()
 
     def is_high_score(self):
         if self.hst.is_high_score(self.player.score()):
@@ -598,14 +1632,27 @@ class TowerRPG:
         else:
             return False
 
+    # Leave the current floor for another one, which catches up with everything that it missed while the player
+    # was away. Floors that the player is not on tick at normal speed, which is every other playing tick.
+    def enter_floor(self, new_floor: int):
+        self.current_floor.left_tick = self.timers.now
+        self.current_floor_level = new_floor
+        self.touched_floors.add(new_floor)
+
+        floor = self.current_floor
+        if floor.left_tick is not None:
+            floor.catch_up(self.timers.now // 2 - floor.left_tick // 2)
+            floor.left_tick = None
+
+        floor.player = self.player
+
     def change_floor(self, direction: int):
         new_floor = self.current_floor_level + direction
 
-        if new_floor < 0 or new_floor >= len(self.floors):
+        if new_floor < 0 or new_floor >= self.floor_builder.floor_count:
             return
         else:
-            self.current_floor_level = new_floor
-            self.current_floor.player = self.player
+            self.enter_floor(new_floor)
 
             if direction > 0:
                 self.current_floor.set_player_position(Floor.ENTRANCE)
@@ -614,64 +1661,68 @@ class TowerRPG:
 
     def set_floor(self, new_floor: int):
 
-        if new_floor < 0 or new_floor >= len(self.floors):
+        if new_floor < 0 or new_floor >= self.floor_builder.floor_count:
             return
         else:
-            self.current_floor_level = new_floor
-            self.current_floor.player = self.player
+            self.enter_floor(new_floor)
             self.current_floor.set_player_position(Floor.ENTRANCE)
 
     @property
     def current_floor(self):
-        return self.floors[self.current_floor_level]
+        return self.floor_builder.get_floor(self.current_floor_level)
+
+    # Record something that happened to the player on the current floor
+    def emit(self, kind: str, tile=None, value=None):
+        self.events.emit(kind, self.current_floor.name, self.player.x, self.player.y, tile, value)
 
     def check_collision(self):
 
         # Check if the player has collided with and enemy?
         if self.current_floor.is_collision() is True:
 
-            print("collision!")
+            tile = self.current_floor.current_tile
 
             if TowerRPG.SWORD in self.effects.keys():
-                print("You killed an enemy with your sword")
                 self.player.kills += 1
                 self.current_floor.set_current_tile(Floor.EMPTY)
+                self.emit(EventStream.KILL, Floor.SWORD, 1)
 
             elif TowerRPG.SHIELD in self.effects.keys():
-                print("You defended yourself with your shield")
+                self.emit(EventStream.DEFEND, tile)
 
             else:
                 self.player.HP -= 1
                 self.current_floor.set_current_tile(Floor.EMPTY)
-                print("HP down to %i" % self.player.HP)
+                self.emit(EventStream.DAMAGE, tile, 1)
 
-    def slow_effect(self):
+    # Start an effect, or start it again if it is already running, so that it lasts for count more ticks
+    def start_effect(self, effect: str, count: int):
+        self.effects[effect] = self.timers.schedule(count + 1, effect)
+        self.emit(EventStream.EFFECT_START, value=effect)
 
-        print("Starting SLOW effect...")
-        self.effects[TowerRPG.SLOW] = TowerRPG.SLOW_COUNT
+    # How many more ticks an effect has left to run
+    def effect_remaining(self, effect: str):
+        return self.timers.remaining(self.effects[effect]) - 1
 
-    def fast_effect(self):
+    def slow_effect(self):
+        self.start_effect(TowerRPG.SLOW, TowerRPG.SLOW_COUNT)
 
-        print("Starting FAST effect...")
-        self.effects[TowerRPG.FAST] = TowerRPG.FAST_COUNT
+    def fast_effect(self):
+        self.start_effect(TowerRPG.FAST, TowerRPG.FAST_COUNT)
 
     def sword_effect(self):
-        print("Starting SWORD effect...")
         self.player.sword = True
-        self.effects[TowerRPG.SWORD] = TowerRPG.SWORD_COUNT
+        self.start_effect(TowerRPG.SWORD, TowerRPG.SWORD_COUNT)
 
     def shield_effect(self):
-        print("Starting SHIELD effect...")
         self.player.shield = True
-        self.effects[TowerRPG.SHIELD] = TowerRPG.SHIELD_COUNT
+        self.start_effect(TowerRPG.SHIELD, TowerRPG.SHIELD_COUNT)
 
     def magnet_effect(self):
-        print("Starting MAGNET effect...")
-        self.effects[TowerRPG.MAGNET] = TowerRPG.MAGNET_COUNT
+        self.start_effect(TowerRPG.MAGNET, TowerRPG.MAGNET_COUNT)
 
     def frost_effect(self):
-        print("Starting FROST effect...")
-        self.effects[TowerRPG.FROST] = TowerRPG.FROST_COUNT
+        self.start_effect(TowerRPG.FROST, TowerRPG.FROST_COUNT)
 
     def move_player(self, dx: int, dy: int):
 
@@ -679,155 +1730,153 @@ class TowerRPG:
         if self.state != TowerRPG.PLAYING:
             return
 
-        self.current_floor.move_player(dx, dy)
-
-        if self.current_floor.current_tile == Floor.EXIT:
-
-            print("You found the exit!")
-
-            if self.current_floor.exit_locked is True and self.player.exit_keys > 0:
-                self.player.exit_keys -= 1
-                self.current_floor.exit_locked = False
-            else:
-                self.player.back()
-                print("...but the exit is locked!")
-
-            if self.current_floor.exit_locked is False:
-                self.change_floor(1)
-                self.current_floor.player = self.player
-                print("You moved up to floor {0}!".format(self.current_floor_level))
-
-        elif self.current_floor.current_tile == Floor.ENTRANCE and self.player.moved() is True:
-            self.change_floor(-1)
-            self.current_floor.player = self.player
-            print("You found the entrance and moved to floor {0}!".format(self.current_floor_level))
-
-        elif self.current_floor.current_tile == Floor.SWITCH and self.player.moved() is True:
-            self.current_floor.switch()
-            self.current_floor.set_current_tile(Floor.SWITCH_LIT)
-            print("You found a switch!!")
-
-        elif self.current_floor.current_tile == Floor.SWITCH_LIT and self.player.moved() is True:
-            self.current_floor.switch()
-            self.current_floor.set_current_tile(Floor.SWITCH)
-            print("You found a switch!!")
-
-        elif self.current_floor.current_tile == Floor.TREASURE:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.treasure += 1
-            print("Found some treasure!!")
-
-        elif self.current_floor.current_tile == Floor.TREASURE_CHEST:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.treasure += 10
-            print("Found a treasure chest!!")
-
-        elif self.current_floor.current_tile == Floor.HP_POTION:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.HP += 1
-            print("Found an HP potion!!")
-
-        elif self.current_floor.current_tile == Floor.KEY:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.keys += 1
-            print("Found a key!!")
-
-        elif self.current_floor.current_tile == Floor.EXIT_KEY:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.exit_keys += 1
-            print("Found an exit key!!")
-
-        elif self.current_floor.current_tile == Floor.BOSS_KEY:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.boss_key = True
-            print("Found a BOSS key!!")
-
-        elif self.current_floor.current_tile == Floor.SWORD:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.sword_effect()
-            print("Found a sword!!")
-
-        elif self.current_floor.current_tile == Floor.FROST_WAND:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.frost_effect()
-            print("Found a frost wand!!")
-
-        elif self.current_floor.current_tile == Floor.SHIELD:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.shield_effect()
-            print("Found a shield!!")
-
-        elif self.current_floor.current_tile == Floor.MAGNET:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.magnet_effect()
-            print("Found a magnet!!")
-
-        elif self.current_floor.current_tile in Floor.SWAP_TILES.keys():
-            print("You found a {0} to {1} swappable tile!!".format(self.current_floor.current_tile,
-                                                                   Floor.SWAP_TILES[self.current_floor.current_tile]))
-            self.current_floor.set_current_tile(Floor.SWAP_TILES[self.current_floor.current_tile])
-
-        elif self.current_floor.current_tile == Floor.FAKE_EXIT:
-            print("You found the exit!")
-            if self.current_floor.exit_locked is True and self.player.exit_keys > 0:
-                self.current_floor.set_current_tile(Floor.EMPTY)
-                print("...but it is a fake exit!")
-            else:
-                self.player.back()
-                print("...but the exit is locked!")
+        floor = self.current_floor
+        floor.move_player(dx, dy)
 
-        elif self.current_floor.current_tile == Floor.RED_POTION:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.slow_effect()
-            print("You found a red potion!!")
+        # Whatever the player moved on to decides what happens next
+        tile = floor.current_tile
+        handler = self.tile_handlers.get(tile)
+        if handler is not None:
+            handler(self, floor, tile)
 
-        elif self.current_floor.current_tile == Floor.YELLOW_POTION:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.fast_effect()
-            print("You found a yellow potion!!")
+    # Add or replace what happens when the player moves on to a type of tile.
+    # The handler is called with the game, the current floor and the tile.
+    @classmethod
+    def register_tile_handler(cls, tile: str, handler):
 
-        elif self.current_floor.current_tile in TowerRPG.TELEPORTS.keys():
-            self.set_floor(TowerRPG.TELEPORTS[self.current_floor.current_tile])
-            print("You found a teleporter!")
+        # Subclasses get their own copy of the handlers so that they don't change the game for everyone else
+        if "tile_handlers" not in vars(cls):
+            cls.tile_handlers = dict(cls.tile_handlers)
 
-        elif self.current_floor.current_tile in Floor.PLAYER_DOT_TILES:
-            if self.current_floor.current_tile == Floor.LAVA and TowerRPG.FROST in self.effects.keys():
-                self.current_floor.set_current_tile(Floor.EMPTY)
-            else:
-                self.player.HP -= 1
-                print("You walked into something nasty!")
+        cls.tile_handlers[tile] = handler
 
-        elif self.current_floor.current_tile == Floor.GOAL:
-            self.current_floor.set_current_tile(Floor.EMPTY)
-            self.player.treasure += 30
-            self.player.trophies += 1
-            print("You found a trophy!!")
+    def exit_tile(self, floor: Floor, tile: str):
 
-            if self.player.trophies >= self.trophies:
-                print("You finished the game!!")
-                self.state = TowerRPG.FINISHED
+        if floor.exit_locked is True and self.player.exit_keys > 0:
+            self.player.exit_keys -= 1
+            floor.exit_locked = False
+            self.emit(EventStream.UNLOCK, tile)
+        else:
+            self.player.back()
+            if floor.exit_locked is True:
+                self.emit(EventStream.LOCKED, tile)
 
-        elif self.current_floor.current_tile == Floor.DOOR:
+        if floor.exit_locked is False:
+            self.change_floor(1)
+            self.current_floor.player = self.player
+            self.emit(EventStream.FLOOR_CHANGE, tile, self.current_floor_level)
 
-            print("You found a door...")
-            if self.player.keys > 0:
-                self.player.keys -= 1
-                self.current_floor.set_current_tile(Floor.EMPTY)
-                print("...and you opened it!")
-            else:
-                self.player.back()
-                print("...but the door is locked!")
+    def entrance_tile(self, floor: Floor, tile: str):
+        if self.player.moved() is True:
+            self.change_floor(-1)
+            self.current_floor.player = self.player
+            self.emit(EventStream.FLOOR_CHANGE, tile, self.current_floor_level)
+
+    def switch_tile(self, floor: Floor, tile: str):
+        if self.player.moved() is True:
+            floor.switch()
+            floor.set_current_tile(Floor.SWITCH_LIT if tile == Floor.SWITCH else Floor.SWITCH)
+            self.emit(EventStream.SWITCH, tile, floor.switch_on)
+
+    # Pick up something that adds to one of the player's counts e.g. treasure
+    def collect_tile(self, floor: Floor, tile: str):
+        attribute, amount = TowerRPG.COLLECTABLES[tile]
+        floor.set_current_tile(Floor.EMPTY)
+        setattr(self.player, attribute, getattr(self.player, attribute) + amount)
+        self.emit(EventStream.PICKUP, tile, amount)
+
+    def boss_key_tile(self, floor: Floor, tile: str):
+        floor.set_current_tile(Floor.EMPTY)
+        self.player.boss_key = True
+        self.emit(EventStream.PICKUP, tile, 1)
+
+    # Pick up something that starts an effect e.g. a sword
+    def effect_tile(self, floor: Floor, tile: str):
+        floor.set_current_tile(Floor.EMPTY)
+        self.emit(EventStream.PICKUP, tile)
+        TowerRPG.EFFECT_ITEMS[tile](self)
+
+    def swap_tile(self, floor: Floor, tile: str):
+        floor.set_current_tile(Floor.SWAP_TILES[tile])
+        self.emit(EventStream.SWAP, tile, Floor.SWAP_TILES[tile])
+
+    def fake_exit_tile(self, floor: Floor, tile: str):
+        if floor.exit_locked is True and self.player.exit_keys > 0:
+            floor.set_current_tile(Floor.EMPTY)
+            self.emit(EventStream.UNLOCK, tile)
+        else:
+            self.player.back()
+            self.emit(EventStream.LOCKED, tile)
 
-        elif self.current_floor.current_tile == Floor.BOSS_DOOR:
+    def teleport_tile(self, floor: Floor, tile: str):
+        self.set_floor(TowerRPG.TELEPORTS[tile])
+        self.emit(EventStream.FLOOR_CHANGE, tile, self.current_floor_level)
 
-            print("You found a BOSS door...")
-            if self.player.boss_key is True:
-                self.player.boss_key = False
-                self.current_floor.set_current_tile(Floor.EMPTY)
-                print("...and you opened it!")
-            else:
-                self.player.back()
-                print("...but the door is locked!")
+    def damage_tile(self, floor: Floor, tile: str):
+        if tile == Floor.LAVA and TowerRPG.FROST in self.effects.keys():
+            floor.set_current_tile(Floor.EMPTY)
+        else:
+            self.player.HP -= 1
+            self.emit(EventStream.DAMAGE, tile, 1)
+
+    def goal_tile(self, floor: Floor, tile: str):
+        floor.set_current_tile(Floor.EMPTY)
+        self.player.treasure += 30
+        self.player.trophies += 1
+        self.emit(EventStream.PICKUP, tile, 30)
+
+        if self.player.trophies >= self.trophies:
+            self.state = TowerRPG.FINISHED
+            self.emit(EventStream.FINISHED, value=self.player.score())
+
+    def door_tile(self, floor: Floor, tile: str):
+        if self.player.keys > 0:
+            self.player.keys -= 1
+            floor.set_current_tile(Floor.EMPTY)
+            self.emit(EventStream.UNLOCK, tile)
+        else:
+            self.player.back()
+            self.emit(EventStream.LOCKED, tile)
+
+    def boss_door_tile(self, floor: Floor, tile: str):
+        if self.player.boss_key is True:
+            self.player.boss_key = False
+            floor.set_current_tile(Floor.EMPTY)
+            self.emit(EventStream.UNLOCK, tile)
+        else:
+            self.player.back()
+            self.emit(EventStream.LOCKED, tile)
+
+    # Things the player can pick up, the player attribute they add to and by how much
+    COLLECTABLES = {Floor.TREASURE: ("treasure", 1),
+                    Floor.TREASURE_CHEST: ("treasure", 10),
+                    Floor.HP_POTION: ("HP", 1),
+                    Floor.KEY: ("keys", 1),
+                    Floor.EXIT_KEY: ("exit_keys", 1)}
+
+    # Things the player can pick up and the effect that they start
+    EFFECT_ITEMS = {Floor.SWORD: sword_effect,
+                    Floor.FROST_WAND: frost_effect,
+                    Floor.SHIELD: shield_effect,
+                    Floor.MAGNET: magnet_effect,
+                    Floor.RED_POTION: slow_effect,
+                    Floor.YELLOW_POTION: fast_effect}
+
+    # What happens when the player moves on to each type of tile
+    tile_handlers = {Floor.EXIT: exit_tile,
+                     Floor.ENTRANCE: entrance_tile,
+                     Floor.SWITCH: switch_tile,
+                     Floor.SWITCH_LIT: switch_tile,
+                     Floor.BOSS_KEY: boss_key_tile,
+                     Floor.FAKE_EXIT: fake_exit_tile,
+                     Floor.GOAL: goal_tile,
+                     Floor.DOOR: door_tile,
+                     Floor.BOSS_DOOR: boss_door_tile}
+    tile_handlers.update(dict.fromkeys(COLLECTABLES, collect_tile))
+    tile_handlers.update(dict.fromkeys(EFFECT_ITEMS, effect_tile))
+    tile_handlers.update(dict.fromkeys(Floor.SWAP_TILES, swap_tile))
+    tile_handlers.update(dict.fromkeys(TELEPORTS, teleport_tile))
+    tile_handlers.update(dict.fromkeys(Floor.PLAYER_DOT_TILES, damage_tile))
 
     def tick(self):
 
@@ -853,16 +1902,11 @@ class TowerRPG:
             else:
                 self.current_floor.enemy_move_mode = Floor.MOVE_RANDOM
 
-            expired_effects = []
-            for effect in self.effects.keys():
-                if self.effects[effect] > 0:
-                    self.effects[effect] -= 1
-                elif self.effects[effect] == 0:
-                    print("Stopping %s effect." % effect)
-                    expired_effects.append(effect)
-
-            for effect in expired_effects:
-                del self.effects[effect]
+            # Stop any effects that have run out, ignoring timers for effects that were started again
+            for due, effect in self.timers.advance():
+                if self.effects.get(effect) == due:
+                    del self.effects[effect]
+                    self.emit(EventStream.EFFECT_STOP, value=effect)
 
             if do_a_tick is True:
                 self.current_floor.tick()
@@ -881,1042 +1925,69 @@ class TowerRPG:
 
 
 class FloorBuilder():
-    def __init__(self):
-        self.floor_settings = []
-        self.floor_plans = []
+    # The parsed floor plans of each level pack, shared by every builder in the process
+    templates = {}
+
+    def __init__(self, floor_class=None, seed=None, level_pack_path=None, events=None):
+
+        # The class used to build each floor e.g. fastfloor.NumpyFloor
+        if floor_class is None:
+            floor_class = Floor
+
+        self.floor_class = floor_class
+        self.events = events
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.level_pack_path = level_pack_path
+        self.level_pack = None
+        self.floor_seeds = []
         self.floors = []
         self.trophies = 0
 
     def initialise(self):
-        self.load_floor_plans()
-
-        self.floor_settings = [
-            (5, Floor.SKELETON, 0, 0, 0, None, "The Decrepit Gate"),
-            (5, Floor.SKELETON, 0, 0, 0, None, "The Ancient Tower"),
-            (10, Floor.GOBLIN, 5, 10, 1, None, "Back and Forth"),
-            (11, Floor.GOBLIN, 6, 10, 1, None, "The Armoury"),
-            (12, Floor.GOBLIN, 7, 10, 1, None, "The Maze"),
-            (13, Floor.GOBLIN, 8, 10, 1, None, "Guard House"),
-            (0, Floor.GOBLIN, 0, 0, 0, None, "The Trap"),
-            (0, Floor.GOBLIN, 0, 5, 0, None, "Bomb Alley"),
-            (14, Floor.GOBLIN, 9, 10, 1, None, "Hello Kitty"),
-            (15, Floor.GOBLIN, 10, 10, 1, None, "The Final Countdown"),
-            (0, Floor.GOBLIN, 0, 0, 0, None, "The Tower Top"),
-            (5, Floor.CHICKEN, 0, 0, 0, None, "The Training Room"),
-            (10, Floor.BITER, 5, 10, 0, None, "Cave Entrance"),
-            (10, Floor.BITER, 15, 10, 1, (Floor.WALL, Floor.EMPTY), "Underground River"),
-            (10, Floor.DEVIL, 5, 0, 0, (Floor.LAVA, Floor.EMPTY), "Lava Flows"),
-            (10, Floor.BITER, 15, 10, 1, None, "Collossal Cavern"),
-            (6, Floor.BITER, 5, 5, 1, (Floor.WATER, Floor.BEACH), "The Ancient Lake"),
-            (5, Floor.BITER, 5, 10, 0, (Floor.WALL, Floor.EMPTY), "The Switch Maze"),
-            (0, Floor.BITER, 0, 0, 0, None, "Nowhere to go"),
-            (3, Floor.SKELETON, 0, 15, 0, (Floor.WALL, Floor.EMPTY), "Marble Hall"),
-            (8, Floor.SNOW_BEAST, 10, 5, 0, None, "Frost Ward"),
-            (8, Floor.SNOW_BEAST, 5, 5, 1, None, "Ice Fort"),
-            (10, Floor.SNOW_BEAST, 10, 5, 1, None, "Deception"),
-            (10, Floor.SNOW_BEAST, 10, 5, 1, None, "The Ice Throne"),
-            (10, Floor.SKELETON, 5, 10, 1, None, "The Prison of Ice"),
-            (6, Floor.SKELETON, 5, 10, 0, (Floor.ICE, Floor.EMPTY), "Dungeon of the Damned"),
-            (10, Floor.SNOW_BEAST, 5, 10, 0, (Floor.ICE, Floor.EMPTY), "Lair of the Ice Beast"),
-            (2, Floor.SNOW_BEAST, 0, 0, 0, None, "Frost Top"),
-            (8, Floor.DEVIL, 5, 5, 1, None, "Chaos"),
-            (0, Floor.DEVIL, 0, 0, 0, None, "Ceaseless Discharge"),
-            (8, Floor.DEVIL, 5, 5, 1, None, "Furnace Steps"),
-            (8, Floor.BEHOLDER, 10, 10, 0, None, "Forge of Giants"),
-            (8, Floor.DEVIL, 10, 10, 1, None, "The Crucible"),
-            (5, Floor.BEHOLDER, 4, 10, 0, (Floor.BOMB, Floor.BOMB_LIT), "The Pyre"),
-            (5, Floor.DEVIL, 4, 10, 0, (Floor.BOMB, Floor.BOMB_LIT), "Hell's Gate"),
-            (5, Floor.DEVIL, 4, 5, 0, None, "Fire Throne")
-        ]
-
-        if len(self.floor_settings) > len(self.floor_plans):
-            raise (
-                Exception(
-                    "Too many settings %i compared to floors %i" % (len(self.floor_settings), len(self.floor_plans))))
-
-        for i in range(0, len(self.floor_settings)):
-            print("Processing floor %i" % i)
-            enemies, enemy_type, traps, treasures, keys, switch_tiles, name = self.floor_settings[i]
-            new_floor = Floor(treasures=treasures, enemies=enemies, enemy_type=enemy_type, traps=traps, keys=keys,
-                              switch_tiles=switch_tiles, name=name)
-            new_floor.load_plan(self.floor_plans[i])
-            new_floor.initialise()
-            self.floors.append(new_floor)
-            self.trophies += new_floor.trophies
-            print("Completed floor {0}.{1}".format(i, name))
-
-        print("{0} floors built!".format(len(self.floors)))
-
-    def load_floor_plans(self):
-        # Decrepit Gate
-        new_floor_plan = (
-
-            ' t tt   t   #######:',
-            'tFt? t t !!! ###w##:',
-            '   t  !       #  #::',
-            'tt                 :',
-            ' t        T        :',
-            't           !  |  ::',
-            ' T  T |            :',
-            'T        |         :',
-            'T            |   :::',
-            'T3    !          D +',
-            'T   !     :      :::',
-            'T        :c:   !   :',
-            ' T  :::::: :::     :',
-            'T  ::         :   ::',
-            'T   D         %:   :',
-            ' T ::         :    :',
-            ' !  :::::: :::  | ::',
-            'T        : : !     :',
-            ' T  T ! 1 :   |  !?:',
-            '  TT ! !TT TTT TT ::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # The Ancient Tower
-        new_floor_plan = (
-            ' T  T  T T   TT  TT ',
-            'T TT TT T TT T TT  T',
-            'T T   T   T T   TT ',
-            'T                 T ',
-            ' T       :::   T   T',
-            'T   T   :::::     T',
-            'T      ::   ::   TT ',
-            ' TT   ::     ::    T',
-            'T   :::   :%  :   T ',
-            'TT    :   :   ::  T ',
-            '-  ?  D ::::: +: T T',
-            'T     :   :   ::   T',
-            ' TT :::   :   :   T ',
-            'T     ::     ::   T ',
-            'T    T ::   ::  T  T',
-            ' TT     :::::      T',
-            'T     T  :::   T  T ',
-            ' T  T            T  ',
-            'T   T T T 1 T TT  T ',
-            ' TTT T T TTT T  TTT ',
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-
-
-        # Back and Forth
-        new_floor_plan = (
-            '::::::::::::::::::::',
-            ':-    U           K:',
-            ':                  :',
-            ':                  :',
-            ':     Y          k :',
-            ':::::::::::::::    :',
-            ':             :    :',
-            ':  l          :    :',
-            ':       :::   :    :',
-            ':  :::   :    :    :',
-            ':   :    :   :::   :',
-            ':   :   :::        :',
-            ':   :         S    :',
-            ':   :              :',
-            ':   :::::::::;::::::',
-            ':                 @:',
-            ':                  :',
-            ':                  :',
-            ':                 +:',
-            '::::::::::::::::::::'
-        )
-        self.floor_plans.append(new_floor_plan)
-
-        # The Armoury
-        new_floor_plan = (
-            '::::::::::::::::::::',
-            ':@ :               :',
-            ':  :               :',
-            ': k:               :',
-            ':  :+ :            :',
-            ':  ::::       ::   :',
-            ':     :       ::   :',
-            ':                  :',
-            ':                  :',
-            ':          l       :',
-            ':                  :',
-            ':  ::         ::   :',
-            ':  ::         ::   :',
-            ':                  :',
-            ':            S     :',
-            ':        :         :',
-            ':       :::        :',
-            ':      :;/::       :',
-            ':     ;;;::::     -:',
-            '::::::::::::::::::::'
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # The Maze
-        new_floor_plan = (
-            '~~~.~~~~~~~~~.~~~~~~',
-            '~~~~~~~~~.~~~~~~~~~.',
-            '~~:::::::::::::::~~~',
-            '.~:       S  :  :.~~',
-            '~~:  ::::    :  :~~~',
-            '~~:  :- :    :  :~~~',
-            '~.:  :     k    :~~~',
-            '~~:  ::::     :::~~~',
-            '.~:     ::      :~.~',
-            '~~:     ::      :~~~',
-            '~~::;:   ::::   :~~~',
-            '.~: O:      :   :~~~',
-            '~~::::   :  :   :.~~',
-            '~~: @:   : +:   :~~~',
-            '~~:  :   ::::   :~~.',
-            '~.:         l   :~~~',
-            '~~:::::::::::::::~~~',
-            '~~~~~~~~~~~~~~~~~~.~',
-            '~~.~~~.~~~~~~.~~~~~~',
-            '~~~~~~~~~.~~~~~~~~~~',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Guard House
-        new_floor_plan = (
-            '~~~.~~~~~.~.~~~~.~~~',
-            '.~~~~~~.~~~~~~.~~~~.',
-            '~~:::::::::::::::~~~',
-            '~~:            @:~.~',
-            '~~:             :~~~',
-            '.~:  ::     ::  :.~~',
-            '~~:  ::     ::  :~~~',
-            '~~:  :  : :  :  :~~.',
-            '~.:     :+:     :~~~',
-            '~~:   l :::     :.~~',
-            '~.:     :-:    S:~~~',
-            '~~:  :  : :  :  :~.~',
-            '.~:  ::     ::  :~~~',
-            '~~:  ::  k  ::  :~~.',
-            '~~:             :~~~',
-            '~.:             :.~~',
-            '~~:::::::::::::::~~~',
-            '~~~~.~~~~~~.~~~.~~~.',
-            '~~.~~~.~~~~~~~~~~~~~',
-            '.~~~~~~~~~.~~.~~~.~~',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # The Trap
-        new_floor_plan = (
-            '::::::::::::::::::::',
-            ':                  :',
-            ':        ?         :',
-            ':                  :',
-            ':   ::::::::::::   :',
-            ':   :?X X X X X:   :',
-            ':   :XlX X X X :   :',
-            ':   : X::::D:lX:   :',
-            ':   :X :?***:X :   :',
-            ':+  : X:****: X:  -:',
-            ':   :X :@*:::X/:   :',
-            ':   :lX:@@D%: X:   :',
-            ':   :X ::::::Xl:   :',
-            ':   : X X X X X:   :',
-            ':   :X X l X X :   :',
-            ':   :::::D::::::   :',
-            ':                  :',
-            ':   Y    U     S   :',
-            ':                  :',
-            '::::::::::::::::::::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Bomb Alley
-        new_floor_plan = (
-
-            '::::::::::::::::::::',
-            ':- :    : X X:@ % +:',
-            ':: :: ^ :X X::::   :',
-            '::b:: :b::::b  : ^^:',
-            ':^:::  :^:Y: : :   :',
-            ': ^::: :b:   :D::: :',
-            ': : :  :X:::::   : :',
-            ':  b::::UX :@   ^: :',
-            ':::::: :X X:  ^  : :',
-            ':@:::  : X?:b   ^: :',
-            ':     U ::::::::::D:',
-            ':     : :  :U:/:U  :',
-            '::;:  : :b     : ^^:',
-            '::b:::::::XX^X :   :',
-            '::::X X::::::::::  :',
-            ':  :X X?:   :^  b:::',
-            ':  ::j::  :::  :: X:',
-            ':    :   b: :  : X :',
-            ':^U  D  :::   : X ?:',
-            '::::::::::::::::::::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Hello Kitty
-        new_floor_plan = (
-
-            '::::::::::::::::::::',
-            ':+   ;             :',
-            ':    :     :::     :',
-            ':    :     ;       :',
-            ':    :     :::  k  :',
-            ':::::::::: :       :',
-            ':          ::      :',
-            ':          ::;::::::',
-            '::::       :  :    :',
-            ':- :::  l  :  ;    :',
-            ':  :       :  :    :',
-            ':  :      :::::    :',
-            ':K :               :',
-            ':  ;    S          :',
-            ':  :       :::     :',
-            ':  :   ::::: :::   :',
-            ':  :   :   :       :',
-            ':  :   :           :',
-            ':  :   :          @:',
-            '::::::::::::::::::::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # The Final Countdown
-        new_floor_plan = (
-            '::::::::::::::::::::',
-            ':+   ;             :',
-            ':    :    ::       :',
-            ':    :    ::       :',
-            ':    ::::    ::    :',
-            ':    :@ :    ::    :',
-            ':K   :  :          :',
-            '::::::  ;      S   :',
-            ':-   :  :          :',
-            ':::  :  :          :',
-            ': :  ::::::::::::: :',
-            ':    :        :    :',
-            ': : l;        :    :',
-            ': :  :        :    :',
-            ': :  :::::::  k  :::',
-            ': :        :   : :j:',
-            ': :::::::::::: ::: :',
-            ':                  :',
-            ':                  :',
-            '::::::::::::::::::::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # The Tower Top
-        new_floor_plan = (
-
-            '~~~~~~~~~~~.~~~~~~~~',
-            '~~.~~~~~.~~~~~~.~~~~',
-            '~~~~~.~~~~~~.~~~~~~~',
-            '~~~~~~~~~~~~~~~~~.~~',
-            '.~~~~:::::::::~~~~~~',
-            '~~~~::  :-:  ::~.~~~',
-            '~.~~:   : :   :~~~~~',
-            '~~~~:  :: ::  :~~~.~',
-            '~~~~:         :~~~~~',
-            '~~~~:         :~~.~~',
-            '~~~~:         :~~~~~',
-            '~~.~:    G    :~.~~~',
-            '.~~~: @@:2:@@ :~~~.~',
-            '~~~~:: ::::: ::~~~~~',
-            '~~~~~:::::::::~~~~~~',
-            '~~.~~~~~~~~~~~~~~.~~',
-            '~~~~~~~.~~.~~~.~~~~~',
-            '~~~~.~~~~~~~~~~~~~~~',
-            '~.~~~~~~~~~.~~~~.~~~',
-            '~~~~~~.~~~~~~~~~~~~~',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Floor Test
-        new_floor_plan = (
-            '::::::::::::::::::::',
-            ':      SYlk / UO$  :',
-            ':       b      b   :',
-            ':                  :',
-            ':  :^:^::          :',
-            ':  ::^::^         ##',
-            ':  TTb:::b    A    #',
-            ':  :::::^       ####',
-            ':  ::^:^:      ## ##',
-            ':   qi    2     #  #',
-            ':   I              #',
-            ':    Z        Z    :',
-            ':                  :',
-            ':        A         :',
-            ':         i        :',
-            ':        iqI   %   :',
-            ':    b         b   :',
-            ':     ::::d::::    :',
-            ':3    :       :    :',
-            '::::::::::::::::::::',
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-
-        # Cave Entrance
-        new_floor_plan = (
-            '####################',
-            '##   #######   :**##',
-            '#     #  ##    :   #',
-            '#  #  #   #  # D |%#',
-            '## #      #W#  :   #',
-            '##         #   :@  #',
-            '##    ##      ###/##',
-            '##U# ####    ##W####',
-            '#  #  ##    ##     +',
-            '#3 #  ##   ##     ##',
-            '#2##   #  ##     ###',
-            '###       #   # #W##',
-            '##        #  # #   #',
-            '##  #  #  #  #     #',
-            '#  ## ## ##     ## #',
-            '#  ## ##  ##   #   #',
-            '#     #     ###    #',
-            '##    #           ##',
-            '#?   ### ##      ###',
-            '####################',
-
-        )
-        self.floor_plans.append(new_floor_plan)
-
-        # Underground River
-        new_floor_plan = (
-            '#############W######',
-            '##         #WW#   ##',
-            '#         :::::    #',
-            '#          ___     #',
-            '#         :::::  [ #',
-            '##    [    WW    [ #',
-            '##   [[   WW    [[[#',
-            '#    [[  WW    [ [[#',
-            '-       WWWW       +',
-            '#        WWW      ##',
-            '##      WWW      ###',
-            '##       WWW      ##',
-            '#         W       ##',
-            '#         W    [   #',
-            '#        WWW  [[   #',
-            '#       WW#W   [[  #',
-            '#      WW##WW      #',
-            '#     WW####W      #',
-            '##  ,#W#####W#     #',
-            '######W#####W#######',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Lava flow
-        new_floor_plan = (
-            '#########HH#########',
-            '#-      HH        ##',
-            '#       H          #',
-            '#       HH  HH  HH #',
-            '#        H   HHHH  #',
-            '#        H    H    #',
-            '##      HH  HHH   ##',
-            '##     HH    H   ###',
-            '##   HHH     HH  ###',
-            '#   HH        HH  ##',
-            '#  HHHH        H   #',
-            '#  HHHH        H   #',
-            '#   HH   H_H  HH   #',
-            '#       HH_H  H    #',
-            '##      HH HHHH  ###',
-            '##     HHH HHH    ##',
-            '#    HHHH   HH     #',
-            '#   HHHH     HH    #',
-            '#HHHHH@*****%HH,  +#',
-            'HHH###########HH####',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Collossal Cave
-        new_floor_plan = (
-            '####################',
-            '####            ####',
-            '###              ###',
-            '##  W             ##',
-            '#  WWW        W    #',
-            '#    W       WW    #',
-            '#       ##    WW   #',
-            '#    [  ##    WW[[ #',
-            '-   [[         W [ +',
-            '#  [[[[    [[    [[#',
-            '#     [   [[     [ #',
-            '#             ##   #',
-            '#  ##   W     ##   #',
-            '#  ##   WW    ##   #',
-            '#     WWWWWW       #',
-            '#       W          #',
-            '##                ##',
-            '###         [[   ###',
-            '####       [[[[ ####',
-            '####################',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Ancient Lake
-        new_floor_plan = (
-            '#########WWWWWWWWWWW',
-            '#######sWWWWWWWWWWWW',
-            '###   sWWWWWWWWWWWWW',
-            '##    sWWWWWWWWWWWWW',
-            '#    sWWWWWWWWWWWWWW',
-            '#    sWWWWWWWWsssWWW',
-            '#    sWWWWWWWss:ssWW',
-            '#   sWWWWWWWss: :sWW',
-            '#   sWWWWWWWs:: :sWW',
-            '-   s,,_____ss +:sWW',
-            '#   sWWWWWWWs:: :sWW',
-            '#   sWWWWWWWss: :sWW',
-            '#   sWWWWWWWWss:ssWW',
-            '#   sWWWWWWWWWsssWWW',
-            '#    sWWWWWWWWWWWWWW',
-            '#    sWWWWWWWWWWWWWW',
-            '#:   sWWWWWWWWWWWWWW',
-            '#::   sWWWWWWWWWWWWW',
-            '#,;;   sWWWWWWWWWWWW',
-            '#########WWWWWWWWWWW',
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Switch Maze
-        new_floor_plan = (
-            '####################',
-            '#  _, :    :     ::#',
-            '# ::  :    :      :#',
-            '#  :  :_::D: :::D::#',
-            '#: :  :,:  :  :    #',
-            '#  :    :  ;  :    #',
-            '# :: ::::::::::    #',
-            '#  :       :       #',
-            '#: :       :  ::: :#',
-            '-  :::::  :: :   : +',
-            '#:,:XX::  :@ :   : #',
-            '# ::XU b  :: : : : #',
-            '# %:XX  :  : : : : #',
-            '#  :,?@:?::: : : : #',
-            '#   ::: ::   : :   #',
-            '#            : :   #',
-            '#  :::  ::: :   :Z:#',
-            '#     ::   :     :@#',
-            '#:  Z    Z    Z    #',
-            '####################',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # No Where to go
-        new_floor_plan = (
-            '####################',
-            '#;;;@:**::;;;:::;;;#',
-            '#;::::::XXX:;;;;;:;#',
-            '#;;;;;;:XXX::::::*;#',
-            '#::;::;;XXX;::ZZZ:;#',
-            '#;:;:*:;:::;::ZZZ:;#',
-            '#;;;:::;;;:;:;ZZZ:;#',
-            '#;::;;;::;:;:;:::;;#',
-            '#;::;:;: / ::;::;;:#',
-            '-;;;;;;: % ;;;::;:;+',
-            '#;::::;: U ::;::;:;#',
-            '#;::@:;::::::;;:;:;#',
-            '#;:;;::*:;:;;;::;:;#',
-            '#;:;::;::;:;::::;:;#',
-            '#;:;:;;::;:;;;;:;:;#',
-            '#;:;;;::AAA:::;:;;@#',
-            '#;:::;::AAA::::*:*:#',
-            '#;:;;;:;AAA:;;;:::;#',
-            '#;;;:;;;::;;;:;;;;;#',
-            '####################',
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Marble Hall
-        new_floor_plan = (
-            '::::::::::::ssWWWWWW',
-            ':         ::ssWWWWWW',
-            ':         :::ssWWWWW',
-            ':     £    ::ssWWWWW',
-            ':          :::ssWWWW',
-            ':     :::::::::ssWWW',
-            ':     :]]]]]]::sssWW',
-            ':     :]]]]]]:::ssWW',
-            ':     :]]]]]] ::ssWW',
-            '-     _]]]]]]G2:ssWW',
-            ':     :]]]]]] ::ssWW',
-            ':     :]]]]]]:::ssWW',
-            ':     :]]]]]]::ssWWW',
-            ':     :::::::::ssWWW',
-            ':          :::ssWWWW',
-            ':          ::ssWWWWW',
-            ':     ,    ::ssWWWWW',
-            ':         :::ssWWWWW',
-            ':         ::ssWWWWWW',
-            '::::::::::::ssWWWWWW',
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Frost Ward
-        new_floor_plan = (
-            'IIIIIIIIIIIIIIIIIIII',
-            'I3IIii  0000    iIII',
-            'I iii  t0 %0   iiI I',
-            'I i     0 00t iiII I',
-            'I     t       IIII I',
-            'I   t     t    II  0',
-            'Ii                i0',
-            'Iii         t    ii0',
-            'IIi     ii      0000',
-            'IIi  t iiiI        +',
-            'IIi    qi2I     0000',
-            'Iii     iii   t  ii0',
-            'Ii        i       i0',
-            'I    t             0',
-            'I      t    t      I',
-            'I  t           t   I',
-            'Ii       t        iI',
-            'Iii   t          iiI',
-            'IIii           iiiII',
-            'IIIIIIIIIIIIIIIIIIII',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Ice Fort
-        new_floor_plan = (
-            'IIIIIIIIIIIIIIIIIIII',
-            'IIIIIIIIiiiiiiiIIIII',
-            'IIIIIiiii00000iiiIII',
-            'IIIIiii000   000iiII',
-            'IIIiii00       00iiI',
-            'IIiii00         00iI',
-            '0Iiii0           0iI',
-            '0Iii00           00I',
-            '00000     000    00I',
-            '-         0t0    +0I',
-            '00000     000    00I',
-            '0Iii00           00I',
-            '0Iiii0           0iI',
-            'IIiii00         00iI',
-            'IIIiii00       00iiI',
-            'IIIIiii000   000iiII',
-            'IIIIIiiii00000iiiIII',
-            'IIIIIIIiiiiiiiiIIIII',
-            'IIIIIIIIIIIIIIIIIIII',
-            'IIIIIIIIIIIIIIIIIIII',
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Deception
-        new_floor_plan = (
-            '00000000000000000000',
-            '0} D    iii    ii0}0',
-            '0000            i0 0',
-            '0ii  000000000   0D0',
-            '0i   0?  0  ?0     0',
-            '0        0         0',
-            '0                  0',
-            '0 0    00 00    0  0',
-            '0 0i   0   0   i0  0',
-            '0 000000 - 000000 i0',
-            '0 0?  i0   0i  ?0 i0',
-            '0 0    00000    0 i0',
-            '0                  0',
-            '0                  0',
-            '0     0000000      0',
-            '0i    0  0  0      0',
-            '0ii      0       0D0',
-            '0000    i0i     i0 0',
-            '0} D   ii0ii   ii0}0',
-            '00000000000000000000',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Ice Throne
-        new_floor_plan = (
-            '00000000000000000000',
-            '0                  0',
-            '0}0             0 ?0',
-            '000             0000',
-            '0i  00  00  00    i0',
-            '0   00  00  00     0',
-            '0                  0',
-            '0     ii      ]]0000',
-            '00     iii    ]]iii0',
-            '      ii i   ]]iiI00',
-            '-    ii  iii ]]iiI00',
-            '    ii    ii  ]]iii0',
-            '00   i        ]]0000',
-            '0                  0',
-            '0   00  00  00     0',
-            '0i  00  00  00    i0',
-            '000             0000',
-            '0}0             0 @0',
-            '0               D  0',
-            '00000000000000000000',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Prison of Ice
-        new_floor_plan = (
-            '00000000000000000000',
-            '0?               i?0',
-            '0                 i0',
-            '0  00D0000D00D000  0',
-            '0  0   ii   0   0  0',
-            '0  0   i    0  i0  0',
-            '0  0   i   i0  i0  0',
-            '0  0i }i  ii0  }0  0',
-            '0  0000q0000q0000  0',
-            '0                  0',
-            '0                  0',
-            '0  00000q000q0000  0',
-            '0  0i  }0i @0} i0  0',
-            '0  0   i0   0  i0  0',
-            '0  0    0   0   0  0',
-            '0  0?   0   0   0  0',
-            '0  00D0000D0000D0  0',
-            '0                  0',
-            '0-                ?0',
-            '00000000000000000000',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Dungeon of the Damned
-        new_floor_plan = (
-            '00000000000000000000',
-            '0-i0ii         0ii?0',
-            '0  0i       q  0 ii0',
-            '0  0      ii0i 0  q0',
-            '0  0     ii 0iq0   0',
-            '0    0 iiii 0iii   0',
-            '0    0ii   ,0iiii i0',
-            '0   i000000000000000',
-            '0  iiiiiiiiiiiiiiii0',
-            '0i  qi qi qi qi qii0',
-            '000iiiiiiiiiiiiiiii0',
-            '0i  i000000000000D00',
-            '0   i0i      iii0 @0',
-            '0   i0      iiiq0  0',
-            '0    0   0 iiiii0  0',
-            '0 0000   0 iiii%0  0',
-            '0    0   0 iiiii0  0',
-            '0        0  iiiq0  0',
-            '0i      i0   ___0 +0',
-            '00000000000000000000',
-
-        )
-        self.floor_plans.append(new_floor_plan)
-
-        # Lair of the Ice Beast
-        new_floor_plan = (
-            '0000iiiiiiiiiiii0000',
-            '0+ 00i    iiiii00  0',
-            '0   0q     i  q0   0',
-            '00  i             00',
-            'i00ii   0 0      00i',
-            'iiqii   0 0i     qii',
-            'ii     00D000     ii',
-            'i     i0i  @0ii    i',
-            'ii  0000    0000   i',
-            'iii 0000    0000   i',
-            'i/i    0%  i0      i',
-            'i8i    000000     ii',
-            'i8i      00i      ii',
-            'ii       00      iii',
-            'iiq      00      qii',
-            'i00i             00i',
-            '00 ii             00',
-            '0  i0qi    i  q0   0',
-            '0? 00iiiiiii ii00 -0',
-            '0000iiiiiiiiiiii0000',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-
-        # Frost Top
-        new_floor_plan = (
-            '~~~~~~~~~~~~~~~~~~.~',
-            '~~~.~~~~~~~~.~~~.~~~',
-            '.~~~~~~~~00~~~~~~~~~',
-            '~~~~~.~~0000~~.~~~~.',
-            '~.~~~~~00 -00~~~~~~~',
-            '~~~.~~00j  j00~~~.~~',
-            '~~~~~00      00~~~~~',
-            '~~0000        0000~~',
-            '~~0iiiq]]]]]]qiii0~~',
-            '~~0iii]]]]]]]]iii0~~',
-            '.~0iGi]]]]]]]]i2i0~~',
-            '~~0iiiq]]]]]]qiii0~~',
-            '~~0000        0000~~',
-            '~~~~~00      00~~~~~',
-            '~~~~~~00    00~~~~~~',
-            '~.~~~~~00@@00~~.~~.~',
-            '~~~~~~~~0000~~~~~~~~',
-            '~~~~~~~~~00~~~.~~~~~',
-            '~~.~~~~~~~~~~~~~~.~~',
-            '~~~~~~~~~~~~~~~~~~~~',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # chaos
-        new_floor_plan = (
-
-            ':H::?  !::::   :::::',
-            ':HH:::    :    :q j:',
-            '::HHH    |:|       :',
-            ':HHHH     :    H   :',
-            ':H    H  ::   HHH:::',
-            ':H    HH    HHHHHH::',
-            'HHH    HH  H:::ssHH:',
-            ' HH  HHHH   :q  ssHH',
-            '      HHHH  D   sssH',
-            '   !   HH   :   s+sH',
-            '!     HHHH  :q  ssHH',
-            '3      HH  H:::ssHH:',
-            '!      H    HHHHHH::',
-            '       H     HHHH:::',
-            '  q q         HH   :',
-            ' :: ::             :',
-            'H:   :           ! :',
-            'H:  2:H HH    ::   :',
-            'H:::::HHHHH   :J  q:',
-            'HHHHHHHHHHHHHH::::::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # ceaseless discharge
-        new_floor_plan = (
-            '::::HHHH::::HHHHHHHH',
-            '- :HHHHHH@:HHHHH:::H',
-            '  :HHHHHHH:HHHHHD%:H',
-            '  :jHH:HHHHHHHHH:::H',
-            '  :::::HHHHHHHHHHH:H',
-            '  :HHH:HHHHH::HHHH:H',
-            '  :HHHHHH:HH::HHH::H',
-            '  :HHHHHH::::::HHHHH',
-            '  qHHHHHH: ?:HHHHHHH',
-            'HHHHHHHHHH  :HHHHHHH',
-            'HHHHHHHHHHH :HHHHHHH',
-            'HHHHHHHHHHHH;HHHHHHH',
-            'HHHHHHHHHHH:::HHHHHH',
-            'HHHHHHHHHHHHHHHHHHHH',
-            'HHHHHHHHHHHHHHHHHHHH',
-            'HHHHHHH:HHHHHHH:HHHH',
-            'H:HH::::HHH::HH::HH:',
-            'H:J :HHHHHHH::H:::::',
-            'H::::HHHHHHHHHHHH   ',
-            'HHHHHHHHHHHHHHHH@: +',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Furnace Steps
-        new_floor_plan = (
-            ':HH:::::::::::::::::',
-            ':HH:@         @::HH:',
-            'HH :           :HHH:',
-            'HH             :HHH:',
-            'HH             :HHH:',
-            ':HH     :  ::  :::::',
-            ':HH    ::   :H     :',
-            '::HH   H:   :H     :',
-            ' ::HH  H:  ::H     :',
-            '+ ::HHHH:  :HHH    H',
-            '   DHHHH:  :HHH    H',
-            '  ::HHHH:  ::HH  HHH',
-            ':::HH  ::   :HHH  HH',
-            ':HHH    :   :H    HH',
-            ':HH        ::     HH',
-            'HHH             : :H',
-            'HH   :::::    HH: :H',
-            'HH   :HHH:   HHH: ::',
-            'Hj  ?:HHH: HHHHH:   ',
-            'H:::::::::::::HH:  -',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-
-        # Forge of Giants
-        new_floor_plan = (
-            'HH::::::HH::::::::HH',
-            'HH:    ;HH:% £  £:HH',
-            ':::    :HH:£   £ :HH',
-            ':    :::HH::::£ ?:HH',
-            ':    :HHHHHHH::D::::',
-            ':    :HHH/HHH:     :',
-            ':    :::::::::     :',
-            ':                  :',
-            ':                  :',
-            ':::q  ::::      q:::',
-            '-     :HH::      D +',
-            ':::q  :HHH::    q:::',
-            ':?    :HHHH:       :',
-            ':     ::::::       :',
-            ':                 J:',
-            ':                 ::',
-            ':::    q   q     ::H',
-            'HH:    :::::     :HH',
-            'HH:    :HHH:   :::HH',
-            'HH::::::HHH:::::HHHH',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-
-        # The crucible
-        new_floor_plan = (
-            'HHHHHHHHHHHHHHHHHHHH',
-            'HHHHHHHHHHHHHHHHHHHH',
-            'HHHHHHHH:::::HHHHHHH',
-            'HHHHH::::   :::HHHHH',
-            'HHH:::        :::HHH',
-            'HH::            ::HH',
-            'HH:              :HH',
-            'H::              ::H',
-            'H:      :::::     :H',
-            '::q     :HHH:    q::',
-            '+        HjH       -',
-            '::q     :HHH:    q::',
-            'H:      :::::     :H',
-            'H::              ::H',
-            'HH:              :HH',
-            'HH::            ::HH',
-            'HHH:::        :::HHH',
-            'HHHHH::::   :::HHHHH',
-            'HHHHHHHH:::::HHHHHHH',
-            'HHHHHHHHHHHHHHHHHHHH',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # The Pyre
-        new_floor_plan = (
-            ':::q        HH::HHHH',
-            ':,:          ?:HHHH:',
-            ': D   :::::  ::HHHH:',
-            ':::   :      :%HHHH:',
-            '- :  ::      :HHHj::',
-            ': :  :   :H  ;HHH::H',
-            ': :  ::  :HH::HH::HH',
-            ': :   :  ::::HHH:HH:',
-            '  :   :   HHHHH::H::',
-            '  ::  :  HHHHHH:_H + ',
-            ':  :  : HHHHHHH::H::',
-            ':  :  :::::::HHH:HH:',
-            ':  :        ::HH::HH',
-            ':  :         :HHH::H',
-            ': ::::q      :HHHH::',
-            ':  :     ::: ::HHHH:',
-            ':  q    ::_::::HHHH:',
-            ':      ::HHH:::HHHH:',
-            ':     ::HHJHH:::HHH:',
-            ':::::::HHHHHHH:::HHH',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-        # Hell's Gate
-        new_floor_plan = (
-            ':::::::HH:::::::::::',
-            '::   ::HH:@       ::',
-            ':     :HH:        @:',
-            ':     :HH:   ::::  :',
-            ':    ::HH::  :HH:  :',
-            ':   ::HHHH:: :HH:  :',
-            ':   :jHHHHj: :HH:  :',
-            ':   :HHHHHH: ::::  :',
-            ':q q::_HH_::q ::   :',
-            '::   ::::::      q::',
-            '+    ::::::        -',
-            ':: q::_HH_::q    q::',
-            ':q  :HHHHHH:       :',
-            ':   :jHHHHj:       :',
-            ':   ::HHHH::     :::',
-            ':    ::HHH:::::  :HH',
-            ':     :HH::::H:: :HH',
-            ':     :HH:::HHH: :::',
-            '::   ::HH:::H,H:   :',
-            ':::::::HH:::HHH;;:::',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
-
-
-        # Fire Throne
-        new_floor_plan = (
-            'HHHHHHHHHH   HHHHH  ',
-            ':HHHHHHHHHH HHHHHHH ',
-            '::HHHHHHHHHHHHHHHHHH',
-            ' ::HHHH::HHHHHH:HHHH',
-            '  ::HH::::HHHHH:HHHH',
-            '   :HH:  :HHHHH:HHHH',
-            '   :HH:  :HHH:::::HH',
-            '   :HH:  :HH::q]]:HH',
-            '  q::::  :::::]]]:HH',
-            '-             ]]2:HH',
-            '              ]]G:HH',
-            '  q::::  :::::]]]:HH',
-            '   :HH:  :HH::q]]:HH',
-            '   :HH:  :HHH:::::HH',
-            '   :HH:  :HHHHH:HHHH',
-            '  ::HH::::HHHHH:HHHH',
-            ' ::HHHH::HHHHHH:HHHH',
-            '::HHHHHHHHH HHHHHHH ',
-            ':HHHHHHHHH   HHHHH  ',
-            'HHHHHHHHH     HHHHH ',
-
-        )
-
-        self.floor_plans.append(new_floor_plan)
+
+        # The floors and their settings come from a level pack file
+        self.level_pack = levelpack.open_level_pack(self.level_pack_path)
+
+        # Give every floor its own random stream so floors come out the same whatever order they are built in
+        self.floor_seeds = [self.rng.getrandbits(64) for i in range(0, len(self.level_pack))]
+
+        # Floors are built the first time that they are needed but the trophies are already counted
+        self.floors = [None] * len(self.level_pack)
+        self.trophies = sum(self.level_pack.trophies(i) for i in range(0, self.floor_count))
+
+        logging.info("%i floors ready to build!", self.floor_count)
+
+    @property
+    def floor_count(self):
+        return len(self.floors)
+
+    # Get a floor, building it if this is the first time that it has been needed
+    def get_floor(self, level: int):
+        if self.floors[level] is None:
+            self.floors[level] = self.build_floor(level)
+        return self.floors[level]
+
+    # Get the parsed plan of a floor, parsing it if this is the first time that it has been needed
+    def get_template(self, level: int):
+        key = (self.level_pack.path, level)
+        if key not in FloorBuilder.templates:
+            FloorBuilder.templates[key] = FloorTemplate(self.level_pack.record(level).rows)
+        return FloorBuilder.templates[key]
+
+    def build_floor(self, level: int):
+        logging.info("Processing floor %i", level)
+        enemies, enemy_type, traps, treasures, keys, switch_tiles, name = self.level_pack.record(level).settings
+        new_floor = self.floor_class(treasures=treasures, enemies=enemies, enemy_type=enemy_type, traps=traps,
+                                     keys=keys, switch_tiles=switch_tiles, name=name,
+                                     rng=random.Random(self.floor_seeds[level]),
+                                     template=self.get_template(level),
+                                     events=self.events)
+        logging.info("Completed floor %i.%s", level, name)
+        return new_floor
+
+    # Build every floor that has not been built yet e.g. to check all of the floors
+    def build_all(self):
+        for level in range(0, self.floor_count):
+            self.get_floor(level)
+        return self.floors
@@ -1,7 +1,11 @@
 __author__ = 'user'
 
+import functools
+import hashlib
+import io
 import logging
 import os.path
+import struct
 import time
 
 import pygame
@@ -21,8 +25,28 @@ class Colours:
     GOLD = (255, 201, 14)
 
 
+# Fonts by size along with the text rendered with them, shared by all of the views. Rendered text is cached by
+# message, size and colours so that labels that are drawn over and over again are only rendered once.
+class Fonts:
+    fonts = {}
+
+    @staticmethod
+    def get(size: int):
+        font = Fonts.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            Fonts.fonts[size] = font
+        return font
+
+    # The surface that comes back is shared so it must not be drawn on
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def render(msg: str, size: int, fg_colour, bg_colour=None):
+        return Fonts.get(size).render(msg, 1, fg_colour, bg_colour)
+
+
 class TileFileNames:
-    RESOURCES_DIR = os.path.dirname(__file__) + "\\resources\\"
+    RESOURCES_DIR = os.path.join(os.path.dirname(__file__), "resources")
 
     files = {
 
@@ -93,72 +117,382 @@ class TileFileNames:
 
     }
 
+    # Get the full path of a file in the resources folder
+    @staticmethod
+    def path(file_name: str):
+        return os.path.join(TileFileNames.RESOURCES_DIR, file_name)
+
+
+# Scaled images kept in a file between runs so that they don't have to be decoded and scaled every time the game
+# starts. Each image is kept with a hash of the file that it came from and the size that it was scaled to and is only
+# used again if both are still the same. The whole file is read in one go when the cache is created.
+# Images are kept ready to go into FloorView's atlases. Partly see-through images keep per pixel alpha and every
+# other image is kept without alpha, with the atlas colour key where it is see-through.
+# File layout: header then for each image its file name, hash, size, whether it has alpha and its pixels
+class SpriteCache:
+    MAGIC = b"TWSC"
+    VERSION = 2
+    DEFAULT_PATH = "Tower.sprites"
+
+    # magic, version, number of images
+    HEADER = struct.Struct("<4sHH")
+
+    # file name length, size and modified time of the file, SHA-1 of the file, width, height, has alpha
+    ENTRY = struct.Struct("<BIq20sHHB")
+
+    def __init__(self, path=None):
+
+        if path is None:
+            path = SpriteCache.DEFAULT_PATH
+
+        self.path = path
+
+        # The file details, size and pixels of each image by file name, and whether anything has changed since it
+        # was read
+        self.entries = {}
+        self.used = set()
+        self.changed = False
+
+        self.read()
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return
+
+        try:
+            magic, version, count = SpriteCache.HEADER.unpack_from(data, 0)
+            if magic != SpriteCache.MAGIC or version != SpriteCache.VERSION:
+                raise ValueError("{0} is not a version {1} sprite cache".format(self.path, SpriteCache.VERSION))
+
+            offset = SpriteCache.HEADER.size
+            entries = {}
+            for i in range(0, count):
+                name_length, file_size, modified, digest, width, height, alpha = \
+                    SpriteCache.ENTRY.unpack_from(data, offset)
+                offset += SpriteCache.ENTRY.size
+                file_name = data[offset:offset + name_length].decode("utf-8")
+                offset += name_length
+                pixel_size = width * height * (4 if alpha else 3)
+                pixels = data[offset:offset + pixel_size]
+                offset += pixel_size
+                if len(pixels) != pixel_size:
+                    raise ValueError("{0} has been cut short".format(self.path))
+                entries[file_name] = ((file_size, modified, digest), (width, height), bool(alpha), pixels)
+
+        except (struct.error, ValueError, UnicodeDecodeError) as error:
+            logging.warning("Ignoring sprite cache: %s", error)
+            return
+
+        self.entries = entries
+
+    # Get an image from the resources folder scaled to a size, only decoding and scaling it if it isn't in the cache.
+    # The file is only read and hashed if its size or modified time are different from when it was cached.
+    def get_image(self, file_name: str, size):
+
+        path = TileFileNames.path(file_name)
+        stat = os.stat(path)
+        self.used.add(file_name)
+
+        entry = self.entries.get(file_name)
+        if entry is None or entry[0][:2] != (stat.st_size, stat.st_mtime_ns) or entry[1] != tuple(size):
+
+            with open(path, "rb") as file:
+                source = file.read()
+
+            details = (stat.st_size, stat.st_mtime_ns, hashlib.sha1(source).digest())
+
+            # A file that has only been touched keeps its cached pixels
+            if entry is not None and entry[0][2] == details[2] and entry[1] == tuple(size):
+                entry = (details,) + entry[1:]
+            else:
+                image = pygame.transform.scale(pygame.image.load(io.BytesIO(source), file_name), size)
+
+                if FloorView.is_translucent(image):
+                    entry = (details, tuple(size), True, pygame.image.tostring(image, "RGBA"))
+                else:
+                    keyed = pygame.Surface(size, 0, 32)
+                    keyed.fill(FloorView.ATLAS_KEY)
+                    keyed.blit(image, (0, 0))
+                    entry = (details, tuple(size), False, pygame.image.tostring(keyed, "RGB"))
+
+            self.entries[file_name] = entry
+            self.changed = True
+
+        details, size, alpha, pixels = entry
+
+        if alpha is True:
+            return pygame.image.fromstring(pixels, size, "RGBA")
+        else:
+            image = pygame.image.fromstring(pixels, size, "RGB")
+            image.set_colorkey(FloorView.ATLAS_KEY)
+            return image
+
+    # Write the images that have been used back to the cache file if any of them had to be loaded again
+    def save(self):
+
+        if self.changed is False and self.used == set(self.entries.keys()):
+            return
+
+        data = [SpriteCache.HEADER.pack(SpriteCache.MAGIC, SpriteCache.VERSION, len(self.used))]
+        for file_name in sorted(self.used):
+            (file_size, modified, digest), (width, height), alpha, pixels = self.entries[file_name]
+            name = file_name.encode("utf-8")
+            data.append(SpriteCache.ENTRY.pack(len(name), file_size, modified, digest, width, height, alpha) +
+                        name + pixels)
+
+        # Write to a new file first so that a half written cache is never read
+        try:
+            new_path = self.path + ".new"
+            with open(new_path, "wb") as file:
+                file.write(b"".join(data))
+            os.replace(new_path, self.path)
+        except OSError as error:
+            logging.warning("Unable to save sprite cache %s: %s", self.path, error)
+            return
+
+        self.entries = {file_name: self.entries[file_name] for file_name in self.used}
+        self.changed = False
+
 
 class FloorView:
     images = {}
+    atlas_areas = {}
+    atlas = None
+    alpha_atlas = None
     tile_width = 32
     tile_height = 32
 
+    # Tile images are packed into rows of this many with this colour showing through where they are see-through
+    ATLAS_COLUMNS = 8
+    ATLAS_KEY = (255, 0, 255)
+
+    # Scenery that is drawn once into the floor's static layer rather than every time the floor is drawn
+    STATIC_TILES = frozenset(game.Floor.PLAYER_BLOCKED_TILES + game.Floor.PLAYER_DOT_TILES + (
+        game.Floor.EMPTY, game.Floor.SAFETY, game.Floor.BEACH, game.Floor.SKY, game.Floor.CLOUD, game.Floor.CHEQUER,
+        game.Floor.ENTRANCE, game.Floor.ENTRANCE_TELEPORT, game.Floor.EXIT, game.Floor.FAKE_EXIT,
+        game.Floor.CHAOS_PORTAL, game.Floor.TELEPORT1, game.Floor.TELEPORT2, game.Floor.WELL, game.Floor.DOOR,
+        game.Floor.BOSS_DOOR, game.Floor.SECRET_WALL, game.Floor.FROST_TREE, game.Floor.TRAP))
+
     def __init__(self, floor: game.Floor):
         self.floor = floor
 
+        # The static tiles of the floor drawn on a surface of their own, the static tile drawn at each index and
+        # the indexes of every other tile, which are drawn on top
+        self.static_floor = None
+        self.static_layer = None
+        self.static_tiles = None
+        self.dynamic_positions = None
+
+    # Load every tile image once, however many tiles use it, and pack them into atlas surfaces in the display's pixel
+    # format. Each tile's image is the area of an atlas that it was packed into. Scaled images come from the sprite
+    # cache if there is one.
     @staticmethod
-    def initialise():
+    def initialise(sprite_cache=None):
+
+        file_names = sorted(set(file_name for file_name in TileFileNames.files.values() if file_name is not None))
+        size = (FloorView.tile_width, FloorView.tile_height)
+        images = {}
+
+        for file_name in file_names:
+            if sprite_cache is not None:
+                images[file_name] = sprite_cache.get_image(file_name, size)
+            else:
+                images[file_name] = pygame.transform.scale(pygame.image.load(TileFileNames.path(file_name)), size)
+
+        # Drawing with per pixel alpha is slower than drawing with a colour key, so only images that are partly
+        # see-through go in an atlas with per pixel alpha and everything else goes in an atlas with a colour key
+        translucent = [file_name for file_name in file_names if FloorView.is_translucent(images[file_name])]
+        FloorView.atlas, areas = FloorView.pack_atlas(images, [file_name for file_name in file_names
+                                                               if file_name not in translucent])
+        FloorView.alpha_atlas, alpha_areas = FloorView.pack_atlas(images, translucent, alpha=True)
 
         for object in TileFileNames.files.keys():
             logging.info("Initialising %s", object)
             filename = TileFileNames.files[object]
+            if filename in areas:
+                FloorView.atlas_areas[object] = (FloorView.atlas, areas[filename])
+            elif filename in alpha_areas:
+                FloorView.atlas_areas[object] = (FloorView.alpha_atlas, alpha_areas[filename])
+
+            # Tiles are drawn straight from their atlas but their images are there for anything else that needs them
+            if object in FloorView.atlas_areas:
+                atlas, area = FloorView.atlas_areas[object]
+                FloorView.images[object] = atlas.subsurface(area)
+            else:
+                FloorView.images[object] = None
+
             if filename is not None:
-                filename = TileFileNames.RESOURCES_DIR + TileFileNames.files[object]
-                image = pygame.image.load(filename)
-                image = pygame.transform.scale(image, (FloorView.tile_width, FloorView.tile_height))
-                FloorView.images[object] = image
+                print("Loaded image {0} for object {1}".format(TileFileNames.path(filename), object))
+
+    # Does an image have any pixels that are neither solid nor completely see-through
+    @staticmethod
+    def is_translucent(image):
+        return image.get_flags() & pygame.SRCALPHA and \
+               pygame.mask.from_surface(image, 0).count() != pygame.mask.from_surface(image, 254).count()
+
+    # Pack tile sized images into a grid on one surface and return it along with the area that each image is in
+    @staticmethod
+    def pack_atlas(images, file_names, alpha=False):
+
+        rows = max(1, (len(file_names) + FloorView.ATLAS_COLUMNS - 1) // FloorView.ATLAS_COLUMNS)
+        size = (FloorView.ATLAS_COLUMNS * FloorView.tile_width, rows * FloorView.tile_height)
+
+        if alpha is True:
+            atlas = pygame.Surface(size, pygame.SRCALPHA, 32)
+        else:
+            atlas = pygame.Surface(size)
+            atlas.fill(FloorView.ATLAS_KEY)
+
+        areas = {}
 
-                print("Loaded image {0} for object {1}".format(filename, object))
+        for i, file_name in enumerate(file_names):
+            area = pygame.Rect((i % FloorView.ATLAS_COLUMNS) * FloorView.tile_width,
+                               (i // FloorView.ATLAS_COLUMNS) * FloorView.tile_height,
+                               FloorView.tile_width, FloorView.tile_height)
+
+            # Copy images with per pixel alpha into the empty atlas exactly rather than blending them with it
+            if alpha is True:
+                atlas.blit(images[file_name], area, special_flags=pygame.BLEND_RGBA_MAX)
             else:
-                FloorView.images[object] = None
+                atlas.blit(images[file_name], area)
+
+            areas[file_name] = area
+
+        # Images blit fastest when they are already in the same pixel format as the display
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha() if alpha is True else atlas.convert()
+
+        if alpha is False:
+            atlas.set_colorkey(FloorView.ATLAS_KEY)
+
+        return atlas, areas
 
     def draw(self, surface):
 
         player = self.floor.player
 
-        for y in range(0, self.floor.height):
-            for x in range(0, len(self.floor.plan[y])):
+        self.update_static_layer(surface)
+        surface.blit(self.static_layer, (0, 0))
 
-                tile = self.floor.get_tile(x, y)
+        for index in sorted(self.dynamic_positions):
+            self.draw_tile(surface, *self.floor.position(index))
 
-                if tile not in FloorView.images.keys():
-                    logging.warning("Found unknown tile '%s', using empty tile instead.", tile)
-                    tile = game.Floor.EMPTY
-                    self.floor.plan[x][y] = tile
+        self.floor.dirty.clear()
 
-                image = FloorView.images[tile]
-                if image is not None:
-                    surface.blit(image, (x * self.tile_width, y * self.tile_height, self.tile_width, self.tile_height))
+        self.draw_name(surface)
+
+        if player is not None:
+            self.draw_player(surface)
+
+    # Redraw just the squares of the floor that have changed since it was last drawn and return the areas updated
+    def draw_dirty(self, surface):
+
+        player = self.floor.player
+        rects = []
 
-                if tile == game.Floor.BOMB_LIT:
-                    if (x, y) in self.floor.bombs.keys():
-                        count = self.floor.bombs[(x, y)]
-                        self.draw_text(surface, str(count), (x + 0.5) * self.tile_width, (y + 0.5) * self.tile_height,
-                                       16)
+        self.update_static_layer(surface)
 
+        for index in sorted(self.floor.dirty):
+            x, y = self.floor.position(index)
+            rect = pygame.Rect(x * self.tile_width, y * self.tile_height, self.tile_width, self.tile_height)
+            surface.blit(self.static_layer, rect, rect)
+
+            if index in self.dynamic_positions:
+                self.draw_tile(surface, x, y)
+
+            if player is not None and (player.x, player.y) == (x, y):
+                self.draw_player(surface)
+
+            rects.append(rect)
+
+        self.floor.dirty.clear()
+
+        # If the floor's name got drawn over then put it back
+        if len(rects) > 0 and self.floor.name is not None:
+            name_rect = self.draw_name(surface, draw=False)
+            if name_rect.collidelist(rects) >= 0:
+                rects.append(self.draw_name(surface))
+
+        return rects
+
+    # Bring the static layer up to date with the squares that have changed since the floor was last drawn, or draw
+    # the whole layer if we are looking at a different floor
+    def update_static_layer(self, surface):
+
+        floor = self.floor
+
+        if floor is not self.static_floor:
+            self.static_floor = floor
+            self.static_layer = pygame.Surface((floor.width * self.tile_width, floor.height * self.tile_height), 0,
+                                               surface)
+            self.static_layer.fill(Colours.GREY)
+            self.static_tiles = [game.Floor.EMPTY] * (floor.width * floor.height)
+            self.dynamic_positions = set()
+            indexes = range(0, floor.width * floor.height)
+        else:
+            indexes = sorted(floor.dirty)
+
+        for index in indexes:
+
+            tile = floor.get_tile_at(index)
+
+            if tile not in FloorView.images.keys():
+                logging.warning("Found unknown tile '%s', using empty tile instead.", tile)
+                tile = game.Floor.EMPTY
+                floor.set_tile_at(index, tile)
+
+            if tile in FloorView.STATIC_TILES:
+                self.dynamic_positions.discard(index)
+            else:
+                self.dynamic_positions.add(index)
+                tile = game.Floor.EMPTY
+
+            # Only redraw the square on the layer if a static tile has come or gone
+            if tile != self.static_tiles[index]:
+                self.static_tiles[index] = tile
+                x, y = floor.position(index)
+                rect = pygame.Rect(x * self.tile_width, y * self.tile_height, self.tile_width, self.tile_height)
+                self.static_layer.fill(Colours.GREY, rect)
+                self.blit_tile(self.static_layer, tile, x, y)
+
+    def draw_tile(self, surface, x: int, y: int):
+
+        tile = self.floor.get_tile(x, y)
+
+        self.blit_tile(surface, tile, x, y)
+
+        if tile == game.Floor.BOMB_LIT:
+            count = self.floor.fuse_remaining(self.floor.index(x, y))
+            if count is not None:
+                self.draw_text(surface, str(count), (x + 0.5) * self.tile_width, (y + 0.5) * self.tile_height,
+                               16)
+
+    def draw_name(self, surface, draw=True):
         if self.floor.name is not None:
-            self.draw_text(surface, "  " + self.floor.name + "  ", (self.floor.width * self.tile_width / 2),
-                           surface.get_rect().top + 8, 24)
+            return self.draw_text(surface, "  " + self.floor.name + "  ", (self.floor.width * self.tile_width / 2),
+                                  surface.get_rect().top + 8, 24, draw=draw)
 
-        if player is not None:
-            if TileFileNames.files[game.Floor.PLAYER] is not None:
-                image = self.images[game.Floor.PLAYER]
-                surface.blit(image, (
-                    player.x * self.tile_width, player.y * self.tile_height, self.tile_width, self.tile_height))
+    # Draw a tile's image from its atlas, if it has one, on to a square of the floor
+    def blit_tile(self, surface, tile: str, x: int, y: int):
+        if tile in FloorView.atlas_areas:
+            atlas, area = FloorView.atlas_areas[tile]
+            surface.blit(atlas, (x * self.tile_width, y * self.tile_height), area)
 
-    def draw_text(self, surface, msg, x, y, size=32, fg_colour=Colours.WHITE, bg_colour=Colours.BLACK):
-        font = pygame.font.Font(None, size)
-        text = font.render(msg, 1, fg_colour, bg_colour)
+    def draw_player(self, surface):
+        player = self.floor.player
+        self.blit_tile(surface, game.Floor.PLAYER, player.x, player.y)
+
+    def draw_text(self, surface, msg, x, y, size=32, fg_colour=Colours.WHITE, bg_colour=Colours.BLACK, draw=True):
+        text = Fonts.render(msg, size, fg_colour, bg_colour)
         textpos = text.get_rect()
         textpos.centerx = x
         textpos.top = y
-        surface.blit(text, textpos)
+        if draw is True:
+            surface.blit(text, textpos)
+        return textpos
 
 
 class ScoreView():
@@ -173,136 +507,165 @@ class ScoreView():
 
     }
 
+    # The top of each row of the score panel. Each row is drawn in the band of the panel down to the next row.
+    ROW_TOPS = (0, 38, 58, 78, 98, 118, 138, 158, 210)
+
     def __init__(self, rpg: game.TowerRPG):
         self.rpg = rpg
 
+        # The score panel is kept on a surface of its own along with the values each row was last drawn with
+        self.panel = None
+        self.row_values = None
+
     def draw(self, surface):
+        self.update_panel(surface)
+        surface.blit(self.panel, self.panel_frame(surface))
+        self.draw_state(surface)
 
-        font = pygame.font.Font(None, 24)
-        name_font = pygame.font.Font(None, 32)
-        spacing = 20
+    # Get the area of the screen that the score panel is drawn in
+    def panel_frame(self, surface):
+        return pygame.Rect(FloorView.tile_width * 20, surface.get_rect().top, 800 - FloorView.tile_width * 20,
+                           800).clip(surface.get_rect())
 
-        frame = pygame.Rect(FloorView.tile_width * 20, surface.get_rect().top, 800 - FloorView.tile_width * 20, 800)
+    # Get the values shown in each row of the score panel so that we can tell when a row needs redrawing
+    def get_row_values(self):
+        player = self.rpg.player
+        return ((player.name,), (player.HP,), (player.treasure,), (player.kills,), (player.score(),),
+                (self.rpg.current_floor_level,), (time.strftime("Time:%H:%M:%S", self.rpg.elapsed_time),),
+                (player.keys, player.exit_keys, player.boss_key, player.trophies,
+                 tuple((effect, self.rpg.effect_remaining(effect)) for effect in self.rpg.effects.keys())),
+                tuple(self.rpg.hst.table))
 
-        name = name_font.render(self.rpg.player.name, 1, Colours.WHITE)
+    # Redraw the rows of the score panel whose values have changed and return their areas of the panel
+    def update_panel(self, surface):
 
-        if self.rpg.player.HP <= 3:
-            fg = Colours.GREY
-            bg = Colours.RED
-        elif self.rpg.player.HP <= 5:
-            fg = Colours.BLACK
-            bg = Colours.GOLD
-        else:
-            fg = Colours.GREEN
-            bg = Colours.GREY
+        frame = self.panel_frame(surface)
 
-        HP = font.render("    HP: %i    " % self.rpg.player.HP, 1, fg, bg)
+        if self.panel is None or self.panel.get_size() != frame.size:
+            self.panel = pygame.Surface(frame.size, 0, surface)
+            self.row_values = [None] * len(ScoreView.ROW_TOPS)
 
-        treasure = font.render("Treasure: %03i" % self.rpg.player.treasure, 1, Colours.RED)
-        kills = font.render("Kills: %i" % self.rpg.player.kills, 1, Colours.BLUE)
-        score = font.render("Score: %i" % self.rpg.player.score(), 1, Colours.GOLD)
-        level = font.render("Level: %02i" % (self.rpg.current_floor_level + 1), 1, Colours.WHITE)
-        elapsed_time = font.render(time.strftime("Time:%H:%M:%S", self.rpg.elapsed_time), 1, Colours.GREEN)
+        changed = []
 
-        textpos = name.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = frame.top + 8
-        texttop = textpos.top
-        surface.blit(name, textpos)
+        for row, values in enumerate(self.get_row_values()):
+            if values != self.row_values[row]:
+                self.row_values[row] = values
 
-        texttop += spacing + 10
+                if row + 1 < len(ScoreView.ROW_TOPS):
+                    bottom = ScoreView.ROW_TOPS[row + 1]
+                else:
+                    bottom = frame.height
 
-        textpos = HP.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(HP, textpos)
+                band = pygame.Rect(0, ScoreView.ROW_TOPS[row], frame.width, bottom - ScoreView.ROW_TOPS[row])
+                self.panel.fill(Colours.GREY, band)
+                self.panel.set_clip(band)
+                self.draw_row(self.panel, row, band.top)
+                self.panel.set_clip(None)
+                changed.append(band)
 
-        texttop += spacing
+        return changed
 
-        textpos = treasure.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(treasure, textpos)
+    # Redraw the rows of the score panel whose values have changed and return the areas of the screen updated
+    def draw_changes(self, surface):
 
-        texttop += spacing
+        frame = self.panel_frame(surface)
+        rects = []
 
-        textpos = kills.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(kills, textpos)
+        for band in self.update_panel(surface):
+            rect = band.move(frame.topleft)
+            surface.blit(self.panel, rect, band)
+            rects.append(rect)
 
-        texttop += spacing
+        return rects
 
-        textpos = score.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(score, textpos)
+    # Draw some text centred across the score panel
+    def draw_centred(self, panel, text, top):
+        textpos = text.get_rect()
+        textpos.centerx = panel.get_rect().centerx
+        textpos.top = top
+        panel.blit(text, textpos)
 
-        texttop += spacing
+    def draw_row(self, panel, row, top):
 
-        textpos = level.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(level, textpos)
+        player = self.rpg.player
+        spacing = 20
 
-        texttop += spacing
+        if row == 0:
+            self.draw_centred(panel, Fonts.render(player.name, 32, Colours.WHITE), top + 8)
 
-        textpos = elapsed_time.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(elapsed_time, textpos)
+        elif row == 1:
+            if player.HP <= 3:
+                fg = Colours.GREY
+                bg = Colours.RED
+            elif player.HP <= 5:
+                fg = Colours.BLACK
+                bg = Colours.GOLD
+            else:
+                fg = Colours.GREEN
+                bg = Colours.GREY
 
-        texttop += spacing
+            self.draw_centred(panel, Fonts.render("    HP: %i    " % player.HP, 24, fg, bg), top)
 
-        icon_slot_width = 8 + FloorView.tile_width
-        icon_left = frame.left + 8
+        elif row == 2:
+            self.draw_centred(panel, Fonts.render("Treasure: %03i" % player.treasure, 24, Colours.RED), top)
 
-        if self.rpg.player.keys > 0:
-            self.draw_icon(surface, icon_left, texttop, game.Floor.KEY, self.rpg.player.keys)
-            icon_left += icon_slot_width
+        elif row == 3:
+            self.draw_centred(panel, Fonts.render("Kills: %i" % player.kills, 24, Colours.BLUE), top)
 
-        if self.rpg.player.exit_keys > 0:
-            self.draw_icon(surface, icon_left, texttop, game.Floor.EXIT_KEY, self.rpg.player.exit_keys)
-            icon_left += icon_slot_width
+        elif row == 4:
+            self.draw_centred(panel, Fonts.render("Score: %i" % player.score(), 24, Colours.GOLD), top)
 
-        if self.rpg.player.boss_key == True:
-            self.draw_icon(surface, icon_left, texttop, game.Floor.BOSS_KEY)
-            icon_left += icon_slot_width
+        elif row == 5:
+            self.draw_centred(panel, Fonts.render("Level: %02i" % (self.rpg.current_floor_level + 1), 24,
+                                                  Colours.WHITE), top)
 
-        if self.rpg.player.trophies > 0:
-            self.draw_icon(surface, icon_left, texttop, game.Floor.GOAL, self.rpg.player.trophies)
-            icon_left += icon_slot_width
+        elif row == 6:
+            self.draw_centred(panel, Fonts.render(time.strftime("Time:%H:%M:%S", self.rpg.elapsed_time), 24,
+                                                  Colours.GREEN), top)
 
-        for effect in self.rpg.effects.keys():
+        elif row == 7:
+            icon_slot_width = 8 + FloorView.tile_width
+            icon_left = 8
 
-            if effect in ScoreView.effect_to_icon_map.keys():
+            if player.keys > 0:
+                self.draw_icon(panel, icon_left, top, game.Floor.KEY, player.keys)
+                icon_left += icon_slot_width
 
-                self.draw_icon(surface, icon_left, texttop, ScoreView.effect_to_icon_map[effect],
-                               self.rpg.effects[effect])
+            if player.exit_keys > 0:
+                self.draw_icon(panel, icon_left, top, game.Floor.EXIT_KEY, player.exit_keys)
                 icon_left += icon_slot_width
 
-            else:
-                logging.WARN("Effect %s has no icon!" % effect)
-
-        texttop += spacing + FloorView.tile_height
-        entry = font.render("High Score Table", 1, Colours.GOLD)
-        textpos = entry.get_rect()
-        textpos.centerx = frame.centerx
-        textpos.top = texttop
-        surface.blit(entry, textpos)
-
-        for i in range(0, len(self.rpg.hst.table)):
-            texttop += spacing
-            name, score = self.rpg.hst.table[i]
-            entry = font.render(name + ":" + str(score), 1, Colours.GOLD)
-            textpos = entry.get_rect()
-            textpos.centerx = frame.centerx
-            textpos.top = texttop
-            surface.blit(entry, textpos)
+            if player.boss_key == True:
+                self.draw_icon(panel, icon_left, top, game.Floor.BOSS_KEY)
+                icon_left += icon_slot_width
+
+            if player.trophies > 0:
+                self.draw_icon(panel, icon_left, top, game.Floor.GOAL, player.trophies)
+                icon_left += icon_slot_width
+
+            for effect in self.rpg.effects.keys():
+
+                if effect in ScoreView.effect_to_icon_map.keys():
+
+                    self.draw_icon(panel, icon_left, top, ScoreView.effect_to_icon_map[effect],
+                                   self.rpg.effect_remaining(effect))
+                    icon_left += icon_slot_width
+
+                else:
+                    logging.WARN("Effect %s has no icon!" % effect)
+
+        elif row == 8:
+            self.draw_centred(panel, Fonts.render("High Score Table", 24, Colours.GOLD), top)
+
+            for name, score in self.rpg.hst.table:
+                top += spacing
+                self.draw_centred(panel, Fonts.render(name + ":" + str(score), 24, Colours.GOLD), top)
+
+    # Draw any messages about the state of the game over the floor
+    def draw_state(self, surface):
 
         if self.rpg.state == game.TowerRPG.GAME_OVER:
-            font = pygame.font.Font(None, 60)
-            state = font.render("  G A M E   O V E R  ", 1, Colours.BLACK, Colours.RED)
+            state = Fonts.render("  G A M E   O V E R  ", 60, Colours.BLACK, Colours.RED)
             textpos = state.get_rect()
             textpos.centerx = (self.rpg.current_floor.width * FloorView.tile_width / 2)
             textpos.centery = (self.rpg.current_floor.height * FloorView.tile_height / 2)
@@ -316,16 +679,14 @@ class ScoreView():
                                y=self.rpg.current_floor.height * FloorView.tile_height / 2 + 60)
 
         elif self.rpg.state == game.TowerRPG.FINISHED:
-            font = pygame.font.Font(None, 60)
-            state = font.render("  C O N G R A T U L A T I O N S  ", 1, Colours.BLACK, Colours.GOLD)
+            state = Fonts.render("  C O N G R A T U L A T I O N S  ", 60, Colours.BLACK, Colours.GOLD)
             textpos = state.get_rect()
             textpos.centerx = (self.rpg.current_floor.width * FloorView.tile_width / 2)
             textpos.centery = (self.rpg.current_floor.height * FloorView.tile_height / 2)
             surface.blit(state, textpos)
 
         elif self.rpg.state == game.TowerRPG.READY:
-            font = pygame.font.Font(None, 60)
-            state = font.render("  R E A D Y ?  ", 1, Colours.BLACK, Colours.GREEN)
+            state = Fonts.render("  R E A D Y ?  ", 60, Colours.BLACK, Colours.GREEN)
             textpos = state.get_rect()
             textpos.centerx = (self.rpg.current_floor.width * FloorView.tile_width / 2)
             textpos.centery = (self.rpg.current_floor.height * FloorView.tile_height / 2)
@@ -338,8 +699,7 @@ class ScoreView():
                            y=self.rpg.current_floor.height * FloorView.tile_height - 50)
 
         elif self.rpg.state == game.TowerRPG.PAUSED:
-            font = pygame.font.Font(None, 60)
-            state = font.render("  P A U S E D  ", 1, Colours.BLACK, Colours.GREEN)
+            state = Fonts.render("  P A U S E D  ", 60, Colours.BLACK, Colours.GREEN)
             textpos = state.get_rect()
             textpos.centerx = (self.rpg.current_floor.width * FloorView.tile_width / 2)
             textpos.centery = (self.rpg.current_floor.height * FloorView.tile_height / 2)
@@ -347,8 +707,7 @@ class ScoreView():
 
         if self.rpg.state in (
         game.TowerRPG.READY, game.TowerRPG.FINISHED, game.TowerRPG.GAME_OVER, game.TowerRPG.PAUSED):
-            font = pygame.font.Font(None, 40)
-            press_space = font.render("  Press SPACE to continue  ", 1, Colours.WHITE, Colours.BLACK)
+            press_space = Fonts.render("  Press SPACE to continue  ", 40, Colours.WHITE, Colours.BLACK)
             textpos = press_space.get_rect()
             textpos.centerx = (self.rpg.current_floor.width * FloorView.tile_width / 2)
             textpos.bottom = (self.rpg.current_floor.height * FloorView.tile_height)
@@ -365,8 +724,7 @@ class ScoreView():
             surface.blit(image, iconpos)
 
             if count is not None:
-                small_font = pygame.font.Font(None, 20)
-                icon_count = small_font.render(str(count), 1, Colours.BLACK, Colours.WHITE)
+                icon_count = Fonts.render(str(count), 20, Colours.BLACK, Colours.WHITE)
                 count_pos = icon_count.get_rect()
                 count_pos.bottom = iconpos.bottom
                 count_pos.right = iconpos.right
@@ -376,8 +734,7 @@ class ScoreView():
             logging.WARN("I can't find icon %s!" % icon_name)
 
     def draw_text(self, surface, msg, x, y, size=32, fg_colour=Colours.WHITE, bg_colour=Colours.BLACK):
-        font = pygame.font.Font(None, size)
-        text = font.render(msg, 1, fg_colour, bg_colour)
+        text = Fonts.render(msg, size, fg_colour, bg_colour)
         textpos = text.get_rect()
         textpos.centerx = x
         textpos.centery = y
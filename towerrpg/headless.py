@@ -0,0 +1,162 @@
+__author__ = 'user'
+
+import contextlib
+import os
+import random
+import sys
+import time
+
+from towerrpg.game import Player, TowerRPG
+from towerrpg.KWGameClasses import HighScoreTable
+
+
+# A clock that only moves when it is told to
+class SimulatedClock:
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+# A high score table that is only kept in memory so that headless runs don't write to the real one
+class UnsavedHighScoreTable(HighScoreTable):
+    def save(self):
+        pass
+
+
+# The results of a headless run
+class RunStats:
+    def __init__(self):
+        self.games = 1
+        self.ticks = 0
+        self.moves = 0
+        self.wall_seconds = 0.0
+        self.simulated_seconds = 0.0
+        self.state = None
+        self.floor_level = 0
+        self.score = 0
+
+    @property
+    def ticks_per_second(self):
+        if self.wall_seconds > 0:
+            return self.ticks / self.wall_seconds
+        else:
+            return float("inf")
+
+    def print(self):
+        print("{0} ticks ({1:.1f} game seconds) over {2} games in {3:.3f}s = {4:,.0f} ticks per second".format(
+            self.ticks, self.simulated_seconds, self.games, self.wall_seconds, self.ticks_per_second))
+        print("Finished on floor {0} in state {1} with a score of {2} after {3} moves".format(
+            self.floor_level, self.state, self.score, self.moves))
+
+
+# Drive a TowerRPG game without a display, using a simulated clock so that games can be fast forwarded
+class HeadlessRunner:
+    # Scripted input commands
+    MOVES = {"w": (0, -1), "s": (0, 1), "a": (-1, 0), "d": (1, 0), ".": None}
+
+    def __init__(self, rpg: TowerRPG = None, player_name="Bot", difficulty=None, floor_class=None, seed=None,
+                 quiet=True):
+
+        self.clock = SimulatedClock()
+        self.quiet = quiet
+
+        with self.output():
+            if rpg is None:
+                rpg = TowerRPG(Player(player_name, 1, 1), difficulty=difficulty, floor_class=floor_class,
+                               clock=self.clock, seed=seed, hst=UnsavedHighScoreTable("Headless"))
+            else:
+                rpg.clock = self.clock
+                rpg.game_start = self.clock()
+
+                hst = UnsavedHighScoreTable(rpg.hst.name, rpg.hst.max_size, rpg.hst.prefix)
+                hst.table = list(rpg.hst.table)
+                rpg.hst = hst
+
+        self.rpg = rpg
+
+    # Send the game's console output nowhere if we are running quietly
+    @contextlib.contextmanager
+    def output(self):
+        if self.quiet is True:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                yield
+        else:
+            yield
+
+    # Turn a script or a function into a source of moves, one per tick.
+    # A script is a string of w, a, s, d and . (stay still) characters or a sequence of (dx, dy) or None.
+    # A function is called with the game before every tick and returns (dx, dy) or None.
+    @staticmethod
+    def input_source(inputs):
+        if callable(inputs):
+            while True:
+                yield inputs
+        else:
+            for command in inputs:
+                if isinstance(command, str):
+                    command = HeadlessRunner.MOVES[command.lower()]
+                yield command
+
+    # Run the game until the inputs run out, the game ends or we have done the maximum number of ticks.
+    # If restart is True then a new game is started whenever the game ends.
+    def run(self, inputs, max_ticks=None, restart=False):
+
+        stats = RunStats()
+        tick_seconds = self.rpg.difficulty / 1000
+
+        if self.rpg.state == TowerRPG.READY:
+            self.rpg.state = TowerRPG.PLAYING
+
+        start = time.perf_counter()
+
+        with self.output():
+            for command in HeadlessRunner.input_source(inputs):
+
+                if self.rpg.state in (TowerRPG.GAME_OVER, TowerRPG.FINISHED) and restart is True:
+                    self.rpg.initialise()
+                    self.rpg.state = TowerRPG.PLAYING
+                    stats.games += 1
+
+                if self.rpg.state != TowerRPG.PLAYING or (max_ticks is not None and stats.ticks >= max_ticks):
+                    break
+
+                if callable(command):
+                    command = command(self.rpg)
+
+                if command is not None:
+                    self.rpg.move_player(*command)
+                    stats.moves += 1
+
+                self.rpg.check_collision()
+
+                self.clock.advance(tick_seconds)
+                self.rpg.tick()
+                self.rpg.check_collision()
+                stats.ticks += 1
+
+        stats.wall_seconds = time.perf_counter() - start
+        stats.simulated_seconds = stats.ticks * tick_seconds
+        stats.state = self.rpg.state
+        stats.floor_level = self.rpg.current_floor_level
+        stats.score = self.rpg.player.score()
+
+        return stats
+
+
+# A bot that wanders around at random
+def random_bot(seed=None):
+    moves = list(HeadlessRunner.MOVES.values())
+    rng = random.Random(seed)
+    return lambda rpg: rng.choice(moves)
+
+
+if __name__ == "__main__":
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    runner = HeadlessRunner(seed=seed)
+    runner.run(random_bot(seed), max_ticks=ticks, restart=True).print()
@@ -0,0 +1,189 @@
+__author__ = 'user'
+
+import mmap
+import os
+import struct
+import sys
+
+# A level pack holds all of the floors of a tower in one binary file:-
+# - header: magic, format version, number of floors
+# - index: the offset and size of each floor's record in the file
+# - records: each floor's settings and name followed by its tiles, one byte per tile, row by row
+# The file is memory mapped and each floor is only decoded the first time that it is asked for.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "tower.lvl")
+
+MAGIC = b"TWRP"
+VERSION = 1
+TILE_ENCODING = "latin-1"
+NAME_ENCODING = "utf-8"
+
+HEADER = struct.Struct("<4sHH")
+INDEX_ENTRY = struct.Struct("<II")
+
+# enemies, enemy type, traps, treasures, keys, switch tile off, switch tile on, trophies, width, height, name length
+RECORD = struct.Struct("<HBHHHBBHHHB")
+
+
+# The settings and plan of one floor in a level pack
+class LevelRecord:
+    def __init__(self, name, rows, enemies=0, enemy_type=None, traps=0, treasures=0, keys=0, switch_tiles=None,
+                 trophies=0):
+        self.name = name
+        self.rows = rows
+        self.enemies = enemies
+        self.enemy_type = enemy_type
+        self.traps = traps
+        self.treasures = treasures
+        self.keys = keys
+        self.switch_tiles = switch_tiles
+        self.trophies = trophies
+
+    @property
+    def width(self):
+        return len(self.rows[0])
+
+    @property
+    def height(self):
+        return len(self.rows)
+
+    # The settings in the order that FloorBuilder uses them
+    @property
+    def settings(self):
+        return self.enemies, self.enemy_type, self.traps, self.treasures, self.keys, self.switch_tiles, self.name
+
+
+# Read the floors out of a level pack file
+class LevelPack:
+    def __init__(self, path=None):
+
+        if path is None:
+            path = DEFAULT_PATH
+
+        self.path = path
+
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < HEADER.size:
+            raise (Exception("{0} is too short to be a level pack".format(path)))
+
+        magic, version, count = HEADER.unpack_from(self.data, 0)
+
+        if magic != MAGIC:
+            raise (Exception("{0} is not a level pack".format(path)))
+
+        if version != VERSION:
+            raise (Exception("{0} is level pack version {1} but only version {2} can be read".format(
+                path, version, VERSION)))
+
+        self.index = [INDEX_ENTRY.unpack_from(self.data, HEADER.size + i * INDEX_ENTRY.size) for i in range(count)]
+        self.records = [None] * count
+
+        for offset, size in self.index:
+            if offset + size > len(self.data) or size < RECORD.size:
+                raise (Exception("{0} is truncated".format(path)))
+
+    def __len__(self):
+        return len(self.index)
+
+    # Get the number of trophies on a floor without decoding the rest of the floor
+    def trophies(self, level: int):
+        offset, size = self.index[level]
+        return RECORD.unpack_from(self.data, offset)[7]
+
+    # Get a floor's record, decoding it if this is the first time that it has been asked for
+    def record(self, level: int):
+        if self.records[level] is None:
+            self.records[level] = self.decode(level)
+        return self.records[level]
+
+    def decode(self, level: int):
+        offset, size = self.index[level]
+        enemies, enemy_type, traps, treasures, keys, switch_off, switch_on, trophies, width, height, name_length = \
+            RECORD.unpack_from(self.data, offset)
+
+        start = offset + RECORD.size
+        name = self.data[start:start + name_length].decode(NAME_ENCODING)
+
+        start += name_length
+        if start + width * height != offset + size:
+            raise (Exception("Floor {0} in {1} is the wrong size".format(level, self.path)))
+
+        tiles = self.data[start:start + width * height].decode(TILE_ENCODING)
+        rows = tuple(tiles[y * width:(y + 1) * width] for y in range(height))
+
+        return LevelRecord(name, rows,
+                           enemies=enemies,
+                           enemy_type=chr(enemy_type) if enemy_type != 0 else None,
+                           traps=traps,
+                           treasures=treasures,
+                           keys=keys,
+                           switch_tiles=(chr(switch_off), chr(switch_on)) if switch_off != 0 else None,
+                           trophies=trophies)
+
+    def close(self):
+        self.data.close()
+
+
+# Level packs are shared by everything in the process that uses the same file
+level_packs = {}
+
+
+def open_level_pack(path=None):
+    if path is None:
+        path = DEFAULT_PATH
+
+    if path not in level_packs:
+        level_packs[path] = LevelPack(path)
+
+    return level_packs[path]
+
+
+# Encode a floor's record
+def encode(record: LevelRecord):
+
+    for row in record.rows:
+        if len(row) != record.width:
+            raise (Exception("Floor {0} has rows of different lengths".format(record.name)))
+
+    name = record.name.encode(NAME_ENCODING)
+    if len(name) > 255:
+        raise (Exception("Floor name {0} is too long".format(record.name)))
+
+    if record.switch_tiles is not None:
+        switch_off, switch_on = (ord(tile) for tile in record.switch_tiles)
+    else:
+        switch_off, switch_on = 0, 0
+
+    return RECORD.pack(record.enemies, ord(record.enemy_type) if record.enemy_type is not None else 0,
+                       record.traps, record.treasures, record.keys, switch_off, switch_on, record.trophies,
+                       record.width, record.height, len(name)) + \
+           name + "".join(record.rows).encode(TILE_ENCODING)
+
+
+# Write a list of floor records to a new level pack file
+def write_level_pack(path, records):
+    data = [encode(record) for record in records]
+
+    offset = HEADER.size + INDEX_ENTRY.size * len(data)
+    index = []
+    for record_data in data:
+        index.append(INDEX_ENTRY.pack(offset, len(record_data)))
+        offset += len(record_data)
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(data)))
+        file.write(b"".join(index))
+        file.write(b"".join(data))
+
+
+# List the floors in a level pack e.g. python -m towerrpg.levelpack [path]
+if __name__ == "__main__":
+    pack = LevelPack(sys.argv[1] if len(sys.argv) > 1 else None)
+    print("{0}: version {1}, {2} floors".format(pack.path, VERSION, len(pack)))
+    for level in range(0, len(pack)):
+        record = pack.record(level)
+        print("{0:2} {1:25} {2}x{3} enemies={4} traps={5} treasures={6} keys={7} trophies={8}".format(
+            level, record.name, record.width, record.height, record.enemies, record.traps, record.treasures,
+            record.keys, record.trophies))
@@ -1,5 +1,6 @@
 __author__ = 'user'
 
+import collections
 import sys
 
 import pygame
@@ -9,8 +10,49 @@ import logging
 from .graphics import *
 from .game import *
 from towerrpg import eztext
+from towerrpg import savegame
 
-def main():
+# How often to take a checkpoint that the player can rewind to and how many to keep
+REWIND_TICKS = 10
+REWIND_POINTS = 2
+
+# The most frames to draw per second, the most late game ticks to catch up with in one go and the most frames in a
+# row that can be skipped when the game is falling behind
+MAX_FPS = 30
+MAX_CATCH_UP_TICKS = 3
+MAX_SKIPPED_FRAMES = 5
+
+
+# Says how many game ticks are due so that the game ticks at a steady rate however long each frame takes.
+# If the game falls behind it catches up a few ticks at a time and anything beyond that is dropped rather than
+# letting the game race along until it has caught up.
+class TickScheduler:
+    def __init__(self, interval: int, clock=pygame.time.get_ticks):
+        self.clock = clock
+        self.reset(interval)
+
+    # Start ticking every interval milliseconds from now
+    def reset(self, interval: int):
+        self.interval = interval
+        self.next_tick = self.clock() + interval
+
+    # How many ticks are due now, counting them as done
+    def due_ticks(self):
+        now = self.clock()
+        if now < self.next_tick:
+            return 0
+
+        ticks = (now - self.next_tick) // self.interval + 1
+        self.next_tick += ticks * self.interval
+
+        return min(ticks, MAX_CATCH_UP_TICKS)
+
+    # Is the next tick due already, i.e. is there no time to draw a frame before it
+    def is_behind(self):
+        return self.clock() >= self.next_tick
+
+
+def main(fps=MAX_FPS):
 
     logging.basicConfig(level = logging.WARN)
     os.environ["SDL_VIDEO_CENTERED"] = "1"
@@ -18,18 +60,29 @@ def main():
 
     # Set-up the game window
     pygame.display.set_caption('The Tower')
-    filename = TileFileNames.RESOURCES_DIR + "tower.png"
-    image = pygame.image.load(filename)
-    image = pygame.transform.scale(image, (FloorView.tile_width, FloorView.tile_height))
+    sprite_cache = SpriteCache()
+    image = sprite_cache.get_image("tower.png", (FloorView.tile_width, FloorView.tile_height))
     pygame.display.set_icon(image)
 
     DISPLAYSURF = pygame.display.set_mode((800, 640))
 
     player = game.Player("Doran", 1, 2)
     rpg = game.TowerRPG(player, difficulty=game.TowerRPG.MEDIUM)
-    FloorView.initialise()
+    rpg.events.subscribe(game.log_event)
+    FloorView.initialise(sprite_cache)
+    sprite_cache.save()
 
-    pygame.time.set_timer(USEREVENT + 1, rpg.difficulty)
+    ticks = TickScheduler(rpg.difficulty)
+    frame_clock = pygame.time.Clock()
+    skipped_frames = 0
+
+    save_game = savegame.SaveGame(rpg)
+    rewind_points = collections.deque()
+
+    floor_view = FloorView(rpg.current_floor)
+    score_view = ScoreView(rpg)
+    redraw = True
+    drawn_state = None
 
 
     # main game loop
@@ -57,9 +110,25 @@ def main():
                         rpg.state = game.TowerRPG.PAUSED
                     elif rpg.state == game.TowerRPG.PAUSED:
                         rpg.state = game.TowerRPG.PLAYING
+                elif event.key == K_F5 and rpg.state in (game.TowerRPG.PLAYING, game.TowerRPG.PAUSED):
+                    save_game.save()
+                    logging.info("Game saved to %s", save_game.path)
+                elif event.key == K_BACKSPACE and rpg.state in (game.TowerRPG.PLAYING, game.TowerRPG.PAUSED) and \
+                        len(rewind_points) > 0 and rewind_points[0].floor_builder is rpg.floor_builder:
+                    # Go back to the oldest checkpoint, which can be rewound to again
+                    rpg.restore(rewind_points[0])
+                    while len(rewind_points) > 1:
+                        rewind_points.pop()
+                    logging.info("Rewound to tick %i", rpg.tick_count)
+                    redraw = True
+                elif event.key == K_F9 and os.path.exists(save_game.path):
+                    save_game.load()
+                    ticks.reset(rpg.difficulty)
+                    logging.info("Game loaded from %s", save_game.path)
+                    redraw = True
                 elif event.key == (K_n) and rpg.state == game.TowerRPG.READY:
                     print("Change Character Name...")
-                    txtbx = eztext.Input(maxlength=10, color=Colours.WHITE, font=pygame.font.Font(None, 24),
+                    txtbx = eztext.Input(maxlength=10, color=Colours.WHITE, font=Fonts.get(24),
                                          x = (FloorView.tile_width * 20) + 8,
                                          y = 440,
                                          prompt='Name? ')
@@ -93,22 +162,64 @@ def main():
                         # refresh the display
                         pygame.display.flip()
 
+                    redraw = True
 
-            elif event.type == USEREVENT + 1:
-                rpg.tick()
+                    # Don't rush to catch up with the ticks that were due while the name was being typed
+                    ticks.reset(rpg.difficulty)
 
-        # Now see if there has been a collision
+        # See if the player has moved into an enemy
         rpg.check_collision()
 
-        # draw on the surface object
-        DISPLAYSURF.fill(Colours.GREY)
-        view = FloorView(rpg.current_floor)
-        view.draw(DISPLAYSURF)
+        for i in range(0, ticks.due_ticks()):
+            rpg.tick()
+
+            # Keep a few checkpoints of the game that is being played so that the player can rewind
+            if rpg.state == game.TowerRPG.PLAYING and rpg.tick_count % REWIND_TICKS == 0:
+                if len(rewind_points) > 0 and rewind_points[0].floor_builder is not rpg.floor_builder:
+                    rewind_points.clear()
+                rewind_points.append(rpg.checkpoint())
+                if len(rewind_points) > REWIND_POINTS:
+                    rewind_points.popleft()
+                    rpg.forget(rewind_points[0])
+
+            # See if an enemy has moved into the player
+            rpg.check_collision()
 
-        score = ScoreView(rpg)
-        score.draw(DISPLAYSURF)
+        # If the game is falling behind then skip drawing this frame, but not too many frames in a row.
+        # Anything that changed stays dirty until the next frame that is drawn.
+        if ticks.is_behind() is True and skipped_frames < MAX_SKIPPED_FRAMES:
+            skipped_frames += 1
+            continue
 
-        pygame.display.update()
+        skipped_frames = 0
+
+        # Redraw everything if we are looking at a different floor or the game state has changed...
+        if rpg.current_floor is not floor_view.floor or rpg.state != drawn_state:
+            redraw = True
+
+        # ...or if something changed under one of the game state messages
+        elif rpg.state != game.TowerRPG.PLAYING and len(rpg.current_floor.dirty) > 0:
+            redraw = True
+
+        # draw on the surface object
+        if redraw is True:
+            DISPLAYSURF.fill(Colours.GREY)
+            floor_view.floor = rpg.current_floor
+            floor_view.draw(DISPLAYSURF)
+            score_view.draw(DISPLAYSURF)
+            pygame.display.update()
+
+            redraw = False
+            drawn_state = rpg.state
+
+        # ...otherwise just redraw the parts of the screen that have changed
+        else:
+            rects = floor_view.draw_dirty(DISPLAYSURF) + score_view.draw_changes(DISPLAYSURF)
+            if len(rects) > 0:
+                pygame.display.update(rects)
+
+        # Wait until it is time for the next frame rather than spinning
+        frame_clock.tick(fps)
 
     return
 
@@ -0,0 +1,314 @@
+__author__ = 'user'
+
+import os
+import struct
+import sys
+
+from towerrpg.game import FloorBuilder
+from towerrpg.timers import TimerHeap
+
+# A save file holds a game in progress:-
+# - header: magic, format version
+# - chunks: a kind and a size followed by either the game's state or one floor's state
+# Each floor is saved as the squares that are different from its template along with its fuses, so a floor that
+# has barely been played on only takes a few bytes. Floors that have never been played on are not saved at all as
+# they are built again from the same seeds when the game is loaded.
+# A save appends the floors played on since the last save followed by the game's state, so the game chunk marks
+# the end of a complete save. When loading, the last complete save wins and any half written save is ignored.
+# Once the file has grown too much from incremental saves it is rewritten with just the latest state.
+
+MAGIC = b"TWRS"
+VERSION = 2
+NAME_ENCODING = "utf-8"
+DEFAULT_PATH = "Tower.sav"
+
+HEADER = struct.Struct("<4sH")
+CHUNK = struct.Struct("<BI")
+
+GAME_CHUNK = 1
+FLOOR_CHUNK = 2
+
+# floor builder seed, game random seed, difficulty, state, tick count, playing ticks, elapsed seconds,
+# current floor, number of floors, number of effects
+GAME = struct.Struct("<QQHBIIdHHB")
+
+# effect count, name length
+EFFECT = struct.Struct("<hB")
+
+# x, y, old x, old y, keys, exit keys, boss key, treasure, trophies, kills, HP, sword, shield, name length
+PLAYER = struct.Struct("<hhhhHHBIIIhBBB")
+
+# level, floor random seed, switch on, exit locked, exit x, exit y, number of changed squares, bombs, braziers,
+# playing tick that the player left the floor on (-1 if they haven't left it)
+FLOOR = struct.Struct("<HQBBhhHHHq")
+
+# plan index, tile code
+CELL = struct.Struct("<HB")
+
+# plan index, count down
+FUSE = struct.Struct("<Hh")
+
+
+# Saves and loads one game to and from a save file
+class SaveGame:
+    # Rewrite the whole file once incremental saves have made it this many times bigger than a full save
+    COMPACT_FACTOR = 4
+
+    def __init__(self, rpg, path=None):
+
+        if path is None:
+            path = DEFAULT_PATH
+
+        self.rpg = rpg
+        self.path = path
+
+        # What is in the save file at the moment
+        self.floor_builder = None
+        self.saved_floors = set()
+        self.file_size = 0
+        self.full_size = 0
+
+    # Save the game, only writing the floors that have been played on since the last save if we can
+    def save(self):
+        rpg = self.rpg
+
+        # Start a new file if this is a different game, the file is not what we last wrote or it has grown too big
+        if rpg.floor_builder is not self.floor_builder or os.path.exists(self.path) is False or \
+                os.path.getsize(self.path) != self.file_size or \
+                self.file_size > self.full_size * SaveGame.COMPACT_FACTOR:
+            self.save_all()
+            return
+
+        levels = sorted(rpg.touched_floors.union((rpg.current_floor_level,)))
+        data = b"".join(self.encode_floor(level) for level in levels) + self.encode_game()
+
+        with open(self.path, "ab") as file:
+            file.write(data)
+
+        self.saved_floors.update(levels)
+        self.file_size += len(data)
+        rpg.touched_floors = {rpg.current_floor_level}
+
+    # Write a new save file with every floor that has been played on
+    def save_all(self):
+        rpg = self.rpg
+
+        if rpg.floor_builder is not self.floor_builder:
+            self.floor_builder = rpg.floor_builder
+            self.saved_floors = set()
+
+        levels = sorted(self.saved_floors.union(rpg.touched_floors, (rpg.current_floor_level,)))
+        data = HEADER.pack(MAGIC, VERSION) + b"".join(self.encode_floor(level) for level in levels) + \
+               self.encode_game()
+
+        # Write to a new file first so that the old save survives if anything goes wrong
+        new_path = self.path + ".new"
+        with open(new_path, "wb") as file:
+            file.write(data)
+        os.replace(new_path, self.path)
+
+        self.saved_floors = set(levels)
+        self.file_size = len(data)
+        self.full_size = len(data)
+        rpg.touched_floors = {rpg.current_floor_level}
+
+    @staticmethod
+    def chunk(kind: int, data: bytes):
+        return CHUNK.pack(kind, len(data)) + data
+
+    # Random number generators are reseeded from themselves when they are saved, which takes a few bytes rather
+    # than the whole generator state, and the game carries on exactly as it would after being loaded
+    @staticmethod
+    def reseed(rng):
+        seed = rng.getrandbits(64)
+        rng.seed(seed)
+        return seed
+
+    def encode_game(self):
+        rpg = self.rpg
+        player = rpg.player
+
+        data = [GAME.pack(self.floor_builder.seed, SaveGame.reseed(rpg.rng), rpg.difficulty, rpg.state,
+                          rpg.tick_count, rpg.timers.now, rpg.clock() - rpg.game_start, rpg.current_floor_level,
+                          rpg.floor_builder.floor_count, len(rpg.effects))]
+
+        for effect in rpg.effects.keys():
+            name = effect.encode(NAME_ENCODING)
+            data.append(EFFECT.pack(rpg.effect_remaining(effect), len(name)) + name)
+
+        name = player.name.encode(NAME_ENCODING)
+        data.append(PLAYER.pack(player.x, player.y, player.old_x, player.old_y, player.keys, player.exit_keys,
+                                player.boss_key, player.treasure, player.trophies, player.kills, player.HP,
+                                player.sword, player.shield, len(name)) + name)
+
+        return SaveGame.chunk(GAME_CHUNK, b"".join(data))
+
+    def encode_floor(self, level: int):
+        floor = self.rpg.floor_builder.get_floor(level)
+        template = self.rpg.floor_builder.get_template(level).plan
+
+        if len(floor.plan) != len(template) or len(floor.plan) > 0x10000:
+            raise (Exception("Floor {0} can't be saved".format(level)))
+
+        changes = [CELL.pack(index, code) for index, (code, template_code) in enumerate(zip(floor.plan, template))
+                   if code != template_code]
+
+        exit_x, exit_y = floor.exit if floor.exit is not None else (-1, -1)
+
+        # Reseeding changes the random number state that any checkpoints remember
+        seed = SaveGame.reseed(floor.rng)
+        floor.rng_state = None
+
+        left_tick = floor.left_tick if floor.left_tick is not None else -1
+
+        data = [FLOOR.pack(level, seed, floor.switch_on, floor.exit_locked, exit_x, exit_y,
+                           len(changes), len(floor.bombs), len(floor.braziers), left_tick)]
+        data += changes
+        data += [FUSE.pack(index, floor.timers.remaining(due)) for index, due in floor.bombs.items()]
+        data += [FUSE.pack(index, floor.timers.remaining(due)) for index, due in floor.braziers.items()]
+
+        return SaveGame.chunk(FLOOR_CHUNK, b"".join(data))
+
+    # Read the last complete save in the file
+    def read(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        if len(data) < HEADER.size or HEADER.unpack_from(data, 0)[0] != MAGIC:
+            raise (Exception("{0} is not a save file".format(self.path)))
+
+        version = HEADER.unpack_from(data, 0)[1]
+        if version != VERSION:
+            raise (Exception("{0} is save file version {1} but only version {2} can be read".format(
+                self.path, version, VERSION)))
+
+        game = None
+        floors = {}
+        unsaved_floors = {}
+        offset = HEADER.size
+        full_size = len(data)
+
+        while offset + CHUNK.size <= len(data):
+            kind, size = CHUNK.unpack_from(data, offset)
+            start = offset + CHUNK.size
+            if start + size > len(data):
+                break
+
+            if kind == FLOOR_CHUNK:
+                unsaved_floors[FLOOR.unpack_from(data, start)[0]] = start
+            elif kind == GAME_CHUNK:
+                game = start
+                floors.update(unsaved_floors)
+                unsaved_floors = {}
+                if full_size == len(data):
+                    full_size = start + size
+
+            offset = start + size
+
+        if game is None:
+            raise (Exception("{0} has no complete save in it".format(self.path)))
+
+        # Incremental saves after the first one are not counted towards the size of a full save
+        self.full_size = full_size
+        self.file_size = offset
+
+        return data, game, floors
+
+    # Load the last complete save into the game
+    def load(self):
+        rpg = self.rpg
+        player = rpg.player
+
+        data, offset, floors = self.read()
+
+        builder_seed, rng_seed, rpg.difficulty, rpg.state, rpg.tick_count, playing_ticks, elapsed, \
+        current_floor_level, floor_count, effect_count = GAME.unpack_from(data, offset)
+        offset += GAME.size
+
+        effects = []
+        for i in range(0, effect_count):
+            count, name_length = EFFECT.unpack_from(data, offset)
+            offset += EFFECT.size
+            effects.append((data[offset:offset + name_length].decode(NAME_ENCODING), count))
+            offset += name_length
+
+        x, y, old_x, old_y, player.keys, player.exit_keys, boss_key, player.treasure, player.trophies, \
+        player.kills, player.HP, sword, shield, name_length = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        player.name = data[offset:offset + name_length].decode(NAME_ENCODING)
+        player._x, player._y, player.old_x, player.old_y = x, y, old_x, old_y
+        player.boss_key, player.sword, player.shield = bool(boss_key), bool(sword), bool(shield)
+
+        # Floors that were never played on come out the same when they are built from the same seeds
+        floor_builder = FloorBuilder(rpg.floor_class, seed=builder_seed, events=rpg.events)
+        floor_builder.initialise()
+
+        if floor_builder.floor_count != floor_count:
+            raise (Exception("{0} has {1} floors but the tower has {2}".format(
+                self.path, floor_count, floor_builder.floor_count)))
+
+        # The game's clock carries on from where it was so that floors catch up with the ticks they have missed
+        for level, offset in floors.items():
+            self.decode_floor(floor_builder, data, offset, playing_ticks)
+
+        rpg.rng.seed(rng_seed)
+        rpg.floor_builder = floor_builder
+        rpg.trophies = floor_builder.trophies
+        rpg.game_start = rpg.clock() - elapsed
+        rpg.timers = TimerHeap()
+        rpg.timers.now = playing_ticks
+        rpg.effects = {effect: rpg.timers.schedule(count + 1, effect) for effect, count in effects}
+        rpg.effect_count = 0
+        rpg.current_floor_level = current_floor_level
+        rpg.current_floor.player = player
+        rpg.current_floor.left_tick = None
+        rpg.touched_floors = {rpg.current_floor_level}
+
+        self.floor_builder = floor_builder
+        self.saved_floors = set(floors.keys())
+
+    def decode_floor(self, floor_builder, data, offset, playing_ticks: int):
+        level, seed, switch_on, exit_locked, exit_x, exit_y, change_count, bomb_count, brazier_count, left_tick = \
+            FLOOR.unpack_from(data, offset)
+        offset += FLOOR.size
+
+        floor = floor_builder.get_floor(level)
+        plan = bytearray(floor_builder.get_template(level).plan)
+
+        for index, code in CELL.iter_unpack(data[offset:offset + change_count * CELL.size]):
+            plan[index] = code
+        offset += change_count * CELL.size
+
+        bombs = FUSE.iter_unpack(data[offset:offset + bomb_count * FUSE.size])
+        offset += bomb_count * FUSE.size
+
+        braziers = FUSE.iter_unpack(data[offset:offset + brazier_count * FUSE.size])
+
+        floor.clear_plan(plan)
+        floor.rng.seed(seed)
+        floor.rng_state = None
+        floor.switch_on = bool(switch_on)
+        floor.exit_locked = bool(exit_locked)
+        floor.exit = (exit_x, exit_y) if exit_x >= 0 else None
+        floor.timers = TimerHeap()
+        floor.bombs = {index: floor.timers.schedule(count, index) for index, count in bombs}
+        floor.braziers = {index: floor.timers.schedule(count, index) for index, count in braziers}
+        floor.player = self.rpg.player
+
+        # A floor that the player was on when it was saved has missed nothing yet
+        floor.left_tick = left_tick if left_tick >= 0 else playing_ticks
+
+
+# Show what is in a save file e.g. python -m towerrpg.savegame [path]
+if __name__ == "__main__":
+    save_game = SaveGame(None, sys.argv[1] if len(sys.argv) > 1 else None)
+    data, offset, floors = save_game.read()
+    builder_seed, rng_seed, difficulty, state, tick_count, playing_ticks, elapsed, current_floor_level, \
+    floor_count, effect_count = GAME.unpack_from(data, offset)
+    print("{0}: version {1}, {2:,} bytes, floor {3} of {4} after {5} ticks ({6:.0f}s)".format(
+        save_game.path, VERSION, len(data), current_floor_level, floor_count, tick_count, elapsed))
+    for level in sorted(floors.keys()):
+        level, seed, switch_on, exit_locked, exit_x, exit_y, change_count, bomb_count, brazier_count, left_tick = \
+            FLOOR.unpack_from(data, floors[level])
+        print("Floor {0:2}: {1} squares changed, {2} lit bombs, {3} lit braziers, {4} ticks missed".format(
+            level, change_count, bomb_count, brazier_count, playing_ticks - left_tick if left_tick >= 0 else 0))
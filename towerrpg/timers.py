@@ -0,0 +1,58 @@
+__author__ = 'user'
+
+import heapq
+
+
+# Timers that go off on a given tick of a clock that only moves when it is told to.
+# Timers are kept in a heap so a tick only costs anything for the timers that go off on it.
+# A timer is never taken out of the heap when it is replaced or cancelled. Instead whoever set it remembers the tick
+# that it is due on and ignores it when it goes off if that has changed, so replacing or cancelling a timer costs
+# nothing and the timers can be checkpointed by copying a list of tuples.
+class TimerHeap:
+    def __init__(self):
+        self.now = 0
+        self.timers = []
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.timers)
+
+    # Set a timer that goes off a number of ticks from now and return the tick that it is due on
+    def schedule(self, delay: int, key):
+        due = self.now + delay
+
+        # Timers due on the same tick go off in the order that they were set
+        heapq.heappush(self.timers, (due, self.sequence, key))
+        self.sequence += 1
+
+        return due
+
+    # Move the clock on by a tick and return the (due, key) of every timer that has gone off
+    def advance(self, ticks: int = 1):
+        self.now += ticks
+
+        fired = []
+        while len(self.timers) > 0 and self.timers[0][0] <= self.now:
+            due, sequence, key = heapq.heappop(self.timers)
+            fired.append((due, key))
+
+        return fired
+
+    # How many ticks until a timer is due
+    def remaining(self, due: int):
+        return due - self.now
+
+    # The tick that the next timer is due on, if there is one
+    def next_due(self):
+        if len(self.timers) > 0:
+            return self.timers[0][0]
+        else:
+            return None
+
+    def checkpoint(self):
+        return self.now, list(self.timers), self.sequence
+
+    def restore(self, checkpoint):
+        now, timers, self.sequence = checkpoint
+        self.now = now
+        self.timers = list(timers)